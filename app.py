@@ -1,34 +1,124 @@
 import os
 import logging
-from flask import Flask
+import tempfile
+import click
+from flask import Flask, Request
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
+import db_profiles
+import instrumentation
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging: LOG_LEVEL is any logging level name (DEBUG, INFO, WARNING, ...)
+logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
 
 class Base(DeclarativeBase):
     pass
 
 db = SQLAlchemy(model_class=Base)
 
+class SpooledRequest(Request):
+    """Keeps uploaded files in memory up to UPLOAD_SPOOL_MAX_SIZE before spilling to a temp file"""
+    
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_MAX_SIZE'])
+
 # Create the app
 app = Flask(__name__)
+app.request_class = SpooledRequest
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
 
 # Configure the database
 app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///cryptoapp.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
+
+# Engine tuning profile: auto (from the URL), basic, sqlite or postgres
+app.config['DB_PROFILE'] = os.environ.get("DB_PROFILE", "auto")
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", 5000))
+app.config['DB_POOL_SIZE'] = int(os.environ.get("DB_POOL_SIZE", 10))
+app.config['DB_MAX_OVERFLOW'] = int(os.environ.get("DB_MAX_OVERFLOW", 20))
+app.config['DB_POOL_TIMEOUT'] = float(os.environ.get("DB_POOL_TIMEOUT", 10))
+app.config['DB_POOL_RECYCLE'] = int(os.environ.get("DB_POOL_RECYCLE", 1800))
+app.config['DB_STATEMENT_TIMEOUT_MS'] = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", 30000))
+app.config["SQLALCHEMY_ENGINE_OPTIONS"] = db_profiles.engine_options(
+    app.config['DB_PROFILE'], app.config["SQLALCHEMY_DATABASE_URI"], app.config
+)
 app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
 
 # File upload configuration
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['UPLOAD_SPOOL_MAX_SIZE'] = int(os.environ.get("UPLOAD_SPOOL_MAX_SIZE", 8 * 1024 * 1024))
+
+# Content-addressed storage for carrier and stego images
+app.config['BLOB_FOLDER'] = os.environ.get("BLOB_FOLDER", os.path.join(app.config['UPLOAD_FOLDER'], 'blobs'))
+app.config['BLOB_GC_GRACE_SECONDS'] = int(os.environ.get("BLOB_GC_GRACE_SECONDS", 3600))
+
+# Download offload to the front proxy: X-Sendfile (Apache/lighttpd) or an nginx internal location
+app.config['USE_X_SENDFILE'] = os.environ.get("USE_X_SENDFILE", "").lower() in ("1", "true", "yes")
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.environ.get("X_ACCEL_REDIRECT_PREFIX", "")
+app.config['OWNED_FILES_CACHE_TTL'] = float(os.environ.get("OWNED_FILES_CACHE_TTL", 30))
+app.config['OWNED_FILES_CACHE_SIZE'] = int(os.environ.get("OWNED_FILES_CACHE_SIZE", 1024))
+
+# Per-worker cache of logged-in users for the Flask-Login user loader. It holds no credentials, only the
+# id, username, email and row version; a change committed by another worker is seen at once by sessions
+# that carry the new version, and by every other session of that user within USER_CACHE_TTL seconds
+app.config['USER_CACHE_TTL'] = float(os.environ.get("USER_CACHE_TTL", 60))
+app.config['USER_CACHE_SIZE'] = int(os.environ.get("USER_CACHE_SIZE", 4096))
+
+# Pre-generated RSA key pool for registration (size 0 disables it)
+app.config['RSA_KEY_POOL_SIZE'] = int(os.environ.get("RSA_KEY_POOL_SIZE", 4))
+app.config['RSA_KEY_POOL_WORKERS'] = int(os.environ.get("RSA_KEY_POOL_WORKERS", 1))
+app.config['RSA_KEY_POOL_EXECUTOR'] = os.environ.get("RSA_KEY_POOL_EXECUTOR", "thread")
+
+# Per-worker process pools for password hashing (auth) and RSA key generation and decryption (rsa).
+# 0 workers runs that work inline on the request thread; calls beyond MAX_PENDING waiting in one
+# gunicorn worker are answered with 503. gunicorn.conf.py turns both pools on
+app.config['OFFLOAD_AUTH_WORKERS'] = int(os.environ.get("OFFLOAD_AUTH_WORKERS", 0))
+app.config['OFFLOAD_AUTH_MAX_PENDING'] = int(os.environ.get("OFFLOAD_AUTH_MAX_PENDING", 32))
+app.config['OFFLOAD_RSA_WORKERS'] = int(os.environ.get("OFFLOAD_RSA_WORKERS", 0))
+app.config['OFFLOAD_RSA_MAX_PENDING'] = int(os.environ.get("OFFLOAD_RSA_MAX_PENDING", 8))
+app.config['OFFLOAD_RETRY_AFTER'] = int(os.environ.get("OFFLOAD_RETRY_AFTER", 1))
+
+# How new ciphertexts and RSA keys are written: binary (raw bytes, DER keys) or text (base64, PEM keys).
+# Both are always readable; text lets workers that predate the binary columns run alongside during a deploy
+app.config['CRYPTO_STORAGE'] = os.environ.get("CRYPTO_STORAGE", "binary")
+if app.config['CRYPTO_STORAGE'] not in ('binary', 'text'):
+    raise ValueError(f"Unknown CRYPTO_STORAGE: {app.config['CRYPTO_STORAGE']}")
+
+# Batch encrypt/decrypt API
+app.config['BATCH_MAX_ITEMS'] = int(os.environ.get("BATCH_MAX_ITEMS", 5000))
+app.config['CRYPTO_WORKERS'] = int(os.environ.get("CRYPTO_WORKERS", os.cpu_count() or 1))
+
+# Bulk steganography: pool size, images per request and upload size for the batch endpoints
+app.config['STEGO_BATCH_WORKERS'] = int(os.environ.get("STEGO_BATCH_WORKERS", os.cpu_count() or 1))
+app.config['STEGO_BATCH_MAX_IMAGES'] = int(os.environ.get("STEGO_BATCH_MAX_IMAGES", 500))
+app.config['STEGO_BATCH_MAX_UPLOAD'] = int(os.environ.get("STEGO_BATCH_MAX_UPLOAD", 256 * 1024 * 1024))
+
+# Failed extractions allowed per user and window before answering 429, and the largest image
+# without a key check header that is still scanned for older payload formats (0 for no limit)
+app.config['EXTRACT_FAILURE_LIMIT'] = int(os.environ.get("EXTRACT_FAILURE_LIMIT", 10))
+app.config['EXTRACT_FAILURE_WINDOW'] = float(os.environ.get("EXTRACT_FAILURE_WINDOW", 60))
+app.config['EXTRACT_LIMITER_SIZE'] = int(os.environ.get("EXTRACT_LIMITER_SIZE", 10000))
+app.config['STEGO_LEGACY_MAX_PIXELS'] = int(os.environ.get("STEGO_LEGACY_MAX_PIXELS", 16 * 1024 * 1024))
+
+# Background steganography jobs
+app.config['JOBS_DATABASE'] = os.environ.get("JOBS_DATABASE", os.path.join(app.instance_path, "jobs.db"))
+app.config['JOB_WORKERS'] = int(os.environ.get("JOB_WORKERS", 2))
+app.config['JOB_QUEUE_SIZE'] = int(os.environ.get("JOB_QUEUE_SIZE", 16))
+
+# Per-stage timers, SQL query counts and a Prometheus /metrics endpoint, only served once METRICS_TOKEN is set
+app.config['METRICS_ENABLED'] = os.environ.get("METRICS_ENABLED", "1").lower() in ("1", "true", "yes")
+app.config['METRICS_TOKEN'] = os.environ.get("METRICS_TOKEN", "")
+
+# Opt-in sampling profiler: a fraction of requests, or any request sent with X-Profile: 1 when allowed
+app.config['PROFILE_SAMPLE_RATE'] = float(os.environ.get("PROFILE_SAMPLE_RATE", 0))
+app.config['PROFILE_ALLOW_HEADER'] = os.environ.get("PROFILE_ALLOW_HEADER", "").lower() in ("1", "true", "yes")
+app.config['PROFILE_INTERVAL_MS'] = float(os.environ.get("PROFILE_INTERVAL_MS", 5))
+app.config['PROFILE_DIR'] = os.environ.get("PROFILE_DIR", os.path.join(app.instance_path, "profiles"))
+
+# Schema creation is a deploy step ("flask --app app init-db"); set this to also run it when the app is created
+app.config['DB_CREATE_ON_START'] = os.environ.get("DB_CREATE_ON_START", "").lower() in ("1", "true", "yes")
 
 # Initialize the app with the extension
 db.init_app(app)
@@ -37,7 +127,47 @@ db.init_app(app)
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 with app.app_context():
-    # Import models to ensure tables are created
+    # Per-connection hooks must be in place before the first connection is opened
+    db_profiles.configure_engine(db.engine, app.config['DB_PROFILE'], app.config)
+    instrumentation.init_app(app, db.engine, db.session)
+    
+    # Import models so the mappers are configured
     import models  # noqa: F401
-    db.create_all()
+
+def init_db():
+    """Create missing tables and bring existing ones up to date; safe to run repeatedly"""
+    import migrations
+    with app.app_context():
+        db.create_all()
+        migrations.upgrade(db.engine)
     logging.info("Database tables created")
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Create the database tables and apply migrations"""
+    init_db()
+
+@app.cli.command('convert-crypto-storage')
+@click.option('--batch-size', type=int, default=1000, help='Rows converted per transaction.')
+@click.option('--pause', type=float, default=0.0, help='Seconds to sleep between batches, to leave room for live traffic.')
+def convert_crypto_storage_command(batch_size, pause):
+    """Move base64 ciphertexts and PEM keys into the binary columns; safe to interrupt and re-run"""
+    import migrations
+    if app.config['CRYPTO_STORAGE'] != 'binary':
+        # Text storage signals a deploy in progress, and workers from before it cannot read converted rows
+        raise click.ClickException("CRYPTO_STORAGE is text; switch every worker to binary storage before converting rows.")
+    with app.app_context():
+        summary = migrations.convert_crypto_storage(db.engine, batch_size=batch_size, pause=pause)
+    for column, (converted, unreadable) in summary.items():
+        click.echo(f"{column}: {converted} rows converted, {unreadable} left as text")
+
+def create_app():
+    """The app with every route registered, e.g. gunicorn 'app:create_app()'
+    
+    Routes register on the module-level app, so there is one app per process and
+    repeated calls return it. Nothing touches the database unless DB_CREATE_ON_START is set.
+    """
+    import routes  # noqa: F401
+    if app.config['DB_CREATE_ON_START']:
+        init_db()
+    return app
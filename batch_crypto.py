@@ -0,0 +1,93 @@
+import os
+from concurrent.futures.process import BrokenProcessPool
+from cache_utils import LRUCache
+from process_pool import ProcessPool
+
+# Batches smaller than this are processed inline; pool dispatch would cost more than it saves
+PARALLEL_THRESHOLD = 32
+# Smallest number of items sent to a worker in one task
+MIN_CHUNK_SIZE = 8
+
+# Parsed keys inside each worker process, keyed by a digest of the PEM or DER key
+_worker_keys = LRUCache(maxsize=64)
+
+
+def _cached_key(material, loader):
+    from crypto_utils import key_material_digest
+    cache_key = key_material_digest(material)
+    key = _worker_keys.get(cache_key)
+    if key is None:
+        key = loader(material)
+        _worker_keys.set(cache_key, key)
+    return key
+
+
+def encrypt_chunk(public_key_material, messages, mode):
+    """Encrypt a list of messages, returning per-item dicts with the raw ciphertext or an error"""
+    from crypto_utils import CryptoUtils
+    public_key = _cached_key(public_key_material, CryptoUtils.load_public_key)
+    results = []
+    for message in messages:
+        try:
+            results.append({
+                'ciphertext': CryptoUtils.encrypt_message_bytes(message, public_key, mode=mode),
+                'md5_hash': CryptoUtils.generate_md5_hash(message),
+            })
+        except Exception as e:
+            results.append({'error': str(e)})
+    return results
+
+
+def decrypt_chunk(private_key_material, ciphertexts):
+    """Decrypt a list of base64 ciphertexts, returning per-item dicts with a result or an error"""
+    from crypto_utils import CryptoUtils
+    private_key = _cached_key(private_key_material, CryptoUtils.load_private_key)
+    results = []
+    for ciphertext in ciphertexts:
+        try:
+            message = CryptoUtils.decrypt_message(ciphertext, private_key)
+            results.append({
+                'decrypted_message': message,
+                'md5_hash': CryptoUtils.generate_md5_hash(message),
+            })
+        except Exception as e:
+            results.append({'error': str(e)})
+    return results
+
+
+class BatchCryptoExecutor:
+    """Spreads RSA work for large batches across a per-process ProcessPoolExecutor"""
+    
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = ProcessPool(self.workers)
+    
+    def encrypt(self, public_key_material, messages, mode='hybrid'):
+        return self._run(encrypt_chunk, public_key_material, messages, mode)
+    
+    def decrypt(self, private_key_material, ciphertexts):
+        return self._run(decrypt_chunk, private_key_material, ciphertexts)
+    
+    def shutdown(self):
+        self._pool.shutdown()
+    
+    def _run(self, func, key_material, items, *args):
+        if len(items) < PARALLEL_THRESHOLD or self.workers < 2:
+            return func(key_material, items, *args)
+        
+        try:
+            return self._map(func, key_material, items, args)
+        except BrokenProcessPool:
+            # A pool process died and failed the batch with it; run it once more on a fresh pool
+            return self._map(func, key_material, items, args)
+    
+    def _map(self, func, key_material, items, args):
+        chunk_size = max(MIN_CHUNK_SIZE, -(-len(items) // self.workers))
+        futures = [
+            self._pool.submit(func, key_material, items[start:start + chunk_size], *args)
+            for start in range(0, len(items), chunk_size)
+        ]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
@@ -0,0 +1,134 @@
+import io
+import os
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from process_pool import ProcessPool
+
+# Images queued per worker; keeps the pool busy without reading the whole upload ahead
+IN_FLIGHT_PER_WORKER = 2
+# Bytes copied per step when streaming a file into an archive
+ZIP_CHUNK_SIZE = 1024 * 1024
+
+
+def hide_image(data, message, secret_key, output_path):
+    """Embed a message into one carrier's bytes, writing the stego PNG to output_path"""
+    from steganography import SteganographyUtils
+    SteganographyUtils.hide_message_in_image(io.BytesIO(data), message, secret_key, output_path)
+    return output_path
+
+
+def extract_image(data, secret_key, legacy_max_pixels=None):
+    """Extract the message hidden in one image's bytes"""
+    from steganography import SteganographyUtils
+    return SteganographyUtils.extract_message_from_image(
+        io.BytesIO(data), secret_key, text_only=True, legacy_max_pixels=legacy_max_pixels
+    )
+
+
+class BatchStegoExecutor:
+    """Runs per-image steganography over a per-process ProcessPoolExecutor, yielding results as they finish"""
+    
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self._pool = ProcessPool(self.workers)
+    
+    def imap_unordered(self, func, tasks):
+        """Yield (key, result, error) for each (key, args) task in completion order
+        
+        Tasks are pulled from the iterable only as slots free up, so at most
+        workers * IN_FLIGHT_PER_WORKER inputs are held at once. A task whose args
+        is an exception is reported as failed without running. Tasks lost to a pool
+        process dying (say, out of memory on a huge image) are run once more.
+        """
+        if self.workers < 2:
+            for key, args in tasks:
+                if isinstance(args, Exception):
+                    yield key, None, args
+                    continue
+                try:
+                    yield key, func(*args), None
+                except Exception as e:
+                    yield key, None, e
+            return
+        
+        tasks = iter(tasks)
+        pending = {}
+        try:
+            while True:
+                while len(pending) < self.workers * IN_FLIGHT_PER_WORKER:
+                    task = next(tasks, None)
+                    if task is None:
+                        break
+                    key, args = task
+                    if isinstance(args, Exception):
+                        yield key, None, args
+                        continue
+                    pending[self._pool.submit(func, *args)] = key, args, False
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, args, retried = pending.pop(future)
+                    error = future.exception()
+                    if isinstance(error, BrokenProcessPool) and not retried:
+                        pending[self._pool.submit(func, *args)] = key, args, True
+                        continue
+                    yield key, None if error else future.result(), error
+        finally:
+            # A client that disconnects mid-stream should not leave queued work behind
+            for future in pending:
+                future.cancel()
+    
+    def shutdown(self):
+        self._pool.shutdown()
+
+
+class _DrainableBuffer(io.RawIOBase):
+    """Write-only, unseekable sink whose contents are handed out and forgotten by drain()"""
+    
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class StreamingZip:
+    """A ZIP archive built entry by entry, whose bytes are taken out as soon as they are written
+    
+    The sink is unseekable, so zipfile writes sizes and CRCs in data descriptors after
+    each entry and nothing before the current chunk has to stay in memory.
+    """
+    
+    def __init__(self):
+        self._buffer = _DrainableBuffer()
+        self._zip = zipfile.ZipFile(self._buffer, 'w')
+    
+    def add_file(self, name, path):
+        """Store a file that is already compressed (PNG), yielding the archive bytes as they are produced"""
+        with open(path, 'rb') as source, self._zip.open(name, 'w') as entry:
+            for chunk in iter(lambda: source.read(ZIP_CHUNK_SIZE), b''):
+                entry.write(chunk)
+                yield self._buffer.drain()
+        yield self._buffer.drain()
+    
+    def add_bytes(self, name, data):
+        """Deflate a small in-memory entry, returning the archive bytes it produced"""
+        self._zip.writestr(name, data, compress_type=zipfile.ZIP_DEFLATED)
+        return self._buffer.drain()
+    
+    def close(self):
+        """Write the central directory, returning the final archive bytes"""
+        self._zip.close()
+        return self._buffer.drain()
@@ -0,0 +1,130 @@
+"""Table size and row fetch time of text (base64/PEM) versus binary (raw/DER) crypto storage.
+
+Usage: python benchmarks/bench_crypto_storage.py [--messages 20000] [--message-size 200] [--users 200]
+
+Seeds a temporary SQLite database in text storage, the way rows were written
+before the binary columns existed, measures it, converts it in place with
+migrations.convert_crypto_storage() and measures again after a VACUUM. Sizes
+come from the dbstat table (pages used by each table and its indexes). Fetch
+times are the median over --repeat runs of reading every message as
+/api/messages does, including the base64 applied for the response, and of
+loading and parsing --key-loads private keys with the parsed key cache cold
+(RSA key validation dominates that, whichever the encoding).
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def median_time(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--message-size', type=int, default=200)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--key-loads', type=int, default=20, help='private keys loaded per sample')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['CRYPTO_STORAGE'] = 'text'
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+    
+    from sqlalchemy import insert, text
+    from sqlalchemy.orm import undefer_group
+    from app import app, db, init_db
+    from crypto_utils import CryptoUtils
+    from models import Message, User
+    import migrations
+    
+    init_db()
+    private_der, public_der = CryptoUtils.generate_rsa_keys('der')
+    public_key = CryptoUtils.load_public_key(public_der)
+    
+    with app.app_context():
+        # One key pair for everyone; key generation is not what is measured
+        users = []
+        for i in range(args.users):
+            user = User(username=f'bench{i}', email=f'bench{i}@example.com', password_hash='-')
+            user.set_rsa_keys(private_der, public_der)
+            users.append(user)
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [user.id for user in users]
+        
+        text_message = 'x' * args.message_size
+        rows = [{
+            'user_id': user_ids[i % len(user_ids)],
+            'original_message': text_message,
+            'md5_hash': CryptoUtils.generate_md5_hash(text_message),
+            **Message.ciphertext_columns(CryptoUtils.encrypt_message_bytes(text_message, public_key)),
+        } for i in range(args.messages)]
+        db.session.execute(insert(Message), rows)
+        db.session.commit()
+    
+    def table_bytes(table):
+        with db.engine.connect() as conn:
+            return conn.execute(text(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = :table OR name IN "
+                "(SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :table)"
+            ), {'table': table}).scalar()
+    
+    def fetch_messages():
+        with app.app_context():
+            messages = Message.query.options(undefer_group('message_text')).all()
+            return [message.ciphertext_base64 for message in messages]
+    
+    def load_private_keys():
+        with app.app_context():
+            for user_id in user_ids[:args.key_loads]:
+                CryptoUtils.load_private_key(User.with_private_key(user_id).private_key_material)
+    
+    def measure():
+        with app.app_context():
+            return {
+                'messages table': table_bytes('messages'),
+                'users table': table_bytes('users'),
+                'fetch all messages': median_time(fetch_messages, args.repeat),
+                'load private keys': median_time(load_private_keys, args.repeat),
+            }
+    
+    with app.app_context():
+        before = measure()
+        app.config['CRYPTO_STORAGE'] = 'binary'
+        start = time.perf_counter()
+        migrations.convert_crypto_storage(db.engine, batch_size=args.batch_size)
+        convert_seconds = time.perf_counter() - start
+        with db.engine.connect() as conn:
+            conn.execute(text('VACUUM'))
+        after = measure()
+    
+    print(f"{args.messages} messages of {args.message_size} characters, {args.users} users, "
+          f"converted in {convert_seconds:.2f} s ({(args.messages + 2 * args.users) / convert_seconds:,.0f} values/s)")
+    print(f"{'':<22} {'text':>14} {'binary':>14} {'change':>8}")
+    for name in before:
+        old, new = before[name], after[name]
+        if name.endswith('table'):
+            print(f"{name:<22} {old:>12,} B {new:>12,} B {new / old - 1:>+8.0%}")
+        else:
+            print(f"{name:<22} {old * 1000:>11.1f} ms {new * 1000:>11.1f} ms {new / old - 1:>+8.0%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""Concurrent write throughput of each database engine profile.
+
+Usage: python benchmarks/bench_db_writes.py [--threads 8] [--writes 200] [--url postgresql://...]
+
+Without --url, runs against a fresh temporary SQLite file once with the
+basic profile (rollback journal, pre-ping on checkout) and once with the
+sqlite profile (WAL, synchronous=NORMAL, busy_timeout). With a PostgreSQL
+URL, compares basic against the postgres profile instead. Each thread
+mimics /encrypt: a short read of the user row followed by a one-row insert
+committed on its own, while reader threads keep listing recent rows.
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, Text, create_engine, exc, select
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db_profiles  # noqa: E402
+
+SETTINGS = {
+    'SQLITE_BUSY_TIMEOUT_MS': 5000,
+    'DB_POOL_SIZE': 10,
+    'DB_MAX_OVERFLOW': 20,
+    'DB_POOL_TIMEOUT': 10,
+    'DB_POOL_RECYCLE': 1800,
+    'DB_STATEMENT_TIMEOUT_MS': 30000,
+}
+
+metadata = MetaData()
+bench_users = Table(
+    'bench_users', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('username', String(80)),
+)
+bench_messages = Table(
+    'bench_messages', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('user_id', Integer, nullable=False),
+    Column('encrypted_message', Text, nullable=False),
+    Column('created_at', DateTime, default=datetime.utcnow),
+)
+
+
+def make_engine(url, profile):
+    engine = create_engine(url, **db_profiles.engine_options(profile, url, SETTINGS))
+    db_profiles.configure_engine(engine, profile, SETTINGS)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(bench_users.insert().values(id=1, username='bench'))
+    return engine
+
+
+def run(engine, threads, writes, readers):
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    done = threading.Event()
+    payload = 'x' * 700
+    
+    def writer():
+        for _ in range(writes):
+            start = time.perf_counter()
+            try:
+                with engine.begin() as conn:
+                    conn.execute(select(bench_users.c.username).where(bench_users.c.id == 1)).scalar()
+                    conn.execute(bench_messages.insert().values(user_id=1, encrypted_message=payload))
+            except exc.OperationalError as e:
+                with lock:
+                    errors.append(str(e.orig))
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - start)
+    
+    def reader():
+        while not done.is_set():
+            try:
+                with engine.connect() as conn:
+                    conn.execute(
+                        select(bench_messages.c.id, bench_messages.c.created_at)
+                        .order_by(bench_messages.c.id.desc()).limit(20)
+                    ).all()
+            except exc.OperationalError as e:
+                with lock:
+                    errors.append(str(e.orig))
+    
+    reader_threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in reader_threads:
+        thread.start()
+    
+    start = time.perf_counter()
+    writer_threads = [threading.Thread(target=writer) for _ in range(threads)]
+    for thread in writer_threads:
+        thread.start()
+    for thread in writer_threads:
+        thread.join()
+    wall = time.perf_counter() - start
+    
+    done.set()
+    for thread in reader_threads:
+        thread.join()
+    return latencies, errors, wall
+
+
+def summarize(label, latencies, errors, wall):
+    if not latencies:
+        print(f"{label:<10} no successful writes, {len(errors)} errors")
+        return
+    latencies = sorted(latencies)
+    p99 = latencies[max(int(len(latencies) * 0.99) - 1, 0)]
+    print(f"{label:<10} {len(latencies) / wall:8.1f} writes/s   p50 {statistics.median(latencies) * 1000:7.2f} ms   "
+          f"p99 {p99 * 1000:7.2f} ms   errors {len(errors)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=200, help='commits per writer thread')
+    parser.add_argument('--readers', type=int, default=2)
+    parser.add_argument('--url', help='PostgreSQL URL; a temporary SQLite file is used if omitted')
+    args = parser.parse_args()
+    
+    if args.url:
+        url = args.url
+        profiles = ('basic', 'postgres')
+    else:
+        workdir = tempfile.mkdtemp()
+        profiles = ('basic', 'sqlite')
+    
+    for profile in profiles:
+        if not args.url:
+            # A fresh file per profile, since WAL mode persists in the database file
+            url = f"sqlite:///{os.path.join(workdir, f'{profile}.db')}"
+        engine = make_engine(url, profile)
+        latencies, errors, wall = run(engine, args.threads, args.writes, args.readers)
+        summarize(profile, latencies, errors, wall)
+        for message in sorted(set(errors))[:3]:
+            print(f"           {message}")
+        metadata.drop_all(engine)
+        engine.dispose()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,233 @@
+"""/login latency percentiles under mixed traffic, sync gunicorn workers versus CPU offload.
+
+Usage: python benchmarks/bench_login_load.py [--duration 20] [--login-clients 8] [--browse-clients 4] [--decrypt-clients 2] [--modes sync,offload]
+
+For each mode a gunicorn server is started on a temporary SQLite database with
+gunicorn.conf.py: 'sync' overrides it to sync workers with password hashing and
+RSA inline, as the app used to be served; 'offload' keeps its defaults (gthread
+workers, auth and RSA process pools). Users are registered over HTTP, then for
+--duration seconds login clients post /login with fresh sessions while logged-in
+clients load /dashboard and post /decrypt, each waiting --think seconds between
+requests and backing off for Retry-After after a 503. Reports p50/p95/p99/max latency of the requests served and the
+503s shed per route. With --url, the traffic runs against an already
+running server instead (one mode, whatever it serves).
+"""
+import argparse
+import http.cookiejar
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PASSWORD = 'load-test-password'
+
+# Server environment per mode, on top of gunicorn.conf.py
+MODES = {
+    'sync': {'GUNICORN_WORKER_CLASS': 'sync', 'OFFLOAD_AUTH_WORKERS': '0', 'OFFLOAD_RSA_WORKERS': '0',
+             'RSA_KEY_POOL_EXECUTOR': 'thread'},
+    'offload': {},
+}
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # A 302 after login is the answer being measured, not something to follow
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Client:
+    """One browser: its own cookie jar, no redirects followed"""
+    
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect()
+        )
+    
+    def request(self, path, form=None, json_body=None):
+        """Return (status, body, seconds); a 503 is followed by the wait its Retry-After asks for"""
+        data, headers = None, {}
+        if form is not None:
+            data = urllib.parse.urlencode(form).encode()
+        elif json_body is not None:
+            data, headers = json.dumps(json_body).encode(), {'Content-Type': 'application/json'}
+        req = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=120) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, body = e.code, e.read()
+            retry_after = e.headers.get('Retry-After')
+        else:
+            retry_after = None
+        seconds = time.perf_counter() - start
+        if status == 503 and retry_after:
+            time.sleep(float(retry_after))
+        return status, body, seconds
+    
+    def login(self, username):
+        status, _, seconds = self.request('/login', {'username': username, 'password': PASSWORD})
+        return status, seconds
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, workers):
+    """Start gunicorn for a mode on a fresh database, returning (process, base_url)"""
+    workdir = tempfile.mkdtemp()
+    port = _free_port()
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': ROOT,
+        'PORT': str(port),
+        'WEB_CONCURRENCY': str(workers),
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'load.db')}",
+        'JOBS_DATABASE': os.path.join(workdir, 'jobs.db'),
+        'LOG_LEVEL': 'WARNING',
+        'METRICS_ENABLED': '0',
+    })
+    env.pop('DB_CREATE_ON_START', None)
+    env.update(MODES[mode])
+    subprocess.run([sys.executable, '-c', 'from app import init_db; init_db()'], cwd=workdir, env=env, check=True)
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'main:app'],
+        cwd=workdir, env=env
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {process.returncode}")
+        try:
+            urllib.request.urlopen(base_url + '/', timeout=5).close()
+            return process, base_url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("gunicorn did not start within 60 s")
+
+
+def setup_users(base_url, count):
+    """Register users; returns (usernames, (client, ciphertext) per logged-in user)"""
+    usernames = [f'load{i}' for i in range(count)]
+    sessions = []
+    for username in usernames:
+        client = Client(base_url)
+        client.request('/register', {'username': username, 'email': f'{username}@example.com',
+                                     'password': PASSWORD, 'confirm_password': PASSWORD})
+        status, _ = client.login(username)
+        if status != 302:
+            raise RuntimeError(f"login of {username} answered {status}")
+        status, body, _ = client.request('/api/encrypt/batch', json_body={'messages': ['load test message']})
+        sessions.append((client, json.loads(body)['results'][0]['encrypted_message']))
+    return usernames, sessions
+
+
+def run_traffic(base_url, usernames, sessions, args):
+    """Drive every client for the duration; returns {route: [(status, seconds), ...]}"""
+    samples = {'/login': [], '/dashboard': [], '/decrypt': []}
+    lock = threading.Lock()
+    deadline = time.monotonic() + args.duration
+    
+    def record(route, status, seconds):
+        with lock:
+            samples[route].append((status, seconds))
+    
+    def login_client(index):
+        i = index
+        while time.monotonic() < deadline:
+            # A fresh session every time, like a burst of different people signing in
+            status, seconds = Client(base_url).login(usernames[i % len(usernames)])
+            record('/login', status, seconds)
+            time.sleep(args.think)
+            i += args.login_clients
+    
+    def browse_client(index):
+        client, _ = sessions[index % len(sessions)]
+        while time.monotonic() < deadline:
+            status, _, seconds = client.request('/dashboard')
+            record('/dashboard', status, seconds)
+            time.sleep(args.think)
+    
+    def decrypt_client(index):
+        client, ciphertext = sessions[index % len(sessions)]
+        while time.monotonic() < deadline:
+            status, _, seconds = client.request('/decrypt', {'encrypted_message': ciphertext})
+            record('/decrypt', status, seconds)
+            time.sleep(args.think)
+    
+    threads = [threading.Thread(target=target, args=(i,))
+               for target, count in ((login_client, args.login_clients), (browse_client, args.browse_clients),
+                                     (decrypt_client, args.decrypt_clients))
+               for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def report(label, samples, duration):
+    print(f"\n{label}")
+    print(f"  {'route':<12} {'requests':>8} {'req/s':>7} {'503':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for route, results in samples.items():
+        if not results:
+            continue
+        served = [seconds for status, seconds in results if status != 503] or [0.0]
+        shed = sum(1 for status, _ in results if status == 503)
+        print(f"  {route:<12} {len(results):>8} {len(results) / duration:>7.1f} {shed:>5}"
+              + ''.join(f" {percentile(served, q) * 1000:>8.0f}" for q in (50, 95, 99, 100)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--duration', type=float, default=20)
+    parser.add_argument('--login-clients', type=int, default=8)
+    parser.add_argument('--browse-clients', type=int, default=4)
+    parser.add_argument('--decrypt-clients', type=int, default=2)
+    parser.add_argument('--think', type=float, default=0.05, help='seconds each client waits between requests')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--modes', default='sync,offload', help='comma-separated: ' + ', '.join(MODES))
+    parser.add_argument('--url', help='load an already running server instead of starting one per mode')
+    args = parser.parse_args()
+    
+    print(f"{args.login_clients} login, {args.browse_clients} dashboard and {args.decrypt_clients} decrypt clients "
+          f"for {args.duration:g} s, {os.cpu_count()} CPUs")
+    if args.url:
+        usernames, sessions = setup_users(args.url.rstrip('/'), args.users)
+        report(args.url, run_traffic(args.url.rstrip('/'), usernames, sessions, args), args.duration)
+        return
+    
+    for mode in args.modes.split(','):
+        process, base_url = start_server(mode, args.workers)
+        try:
+            usernames, sessions = setup_users(base_url, args.users)
+            report(f"{mode} ({args.workers} gunicorn workers)", run_traffic(base_url, usernames, sessions, args), args.duration)
+        finally:
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
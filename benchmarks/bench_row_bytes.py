@@ -0,0 +1,151 @@
+"""Bytes of row data fetched from the database per request, with and without deferred columns.
+
+Usage: python benchmarks/bench_row_bytes.py [--messages 40] [--message-size 2000]
+
+Seeds a temporary SQLite database through the Flask test client, then issues
+each request twice: once as the app ships (deferred PEM, password hash and
+message text columns, SessionUser projection in the user loader) and once
+with every column undeferred and the loader returning a full User, which is
+how requests were served before. Every SELECT a request runs is recorded and
+replayed afterwards to add up the size of the values it returned.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def value_size(value):
+    if value is None:
+        return 0
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, str):
+        return len(value.encode('utf-8'))
+    if isinstance(value, (int, float)):
+        return 8
+    return len(str(value))
+
+
+class SelectRecorder:
+    """Collects the SELECT statements run on an engine while enabled"""
+    
+    def __init__(self, engine):
+        from sqlalchemy import event
+        
+        self.engine = engine
+        self.statements = []
+        self.enabled = False
+        event.listen(engine, 'before_cursor_execute', self._record)
+    
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        if self.enabled and statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            self.statements.append((statement, parameters))
+    
+    def measure(self, func):
+        """Run func and return (queries, bytes returned by its SELECTs)"""
+        self.statements = []
+        self.enabled = True
+        try:
+            func()
+        finally:
+            self.enabled = False
+        
+        total = 0
+        with self.engine.connect() as conn:
+            for statement, parameters in self.statements:
+                for row in conn.exec_driver_sql(statement, parameters):
+                    total += sum(value_size(value) for value in row)
+        return len(self.statements), total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=40)
+    parser.add_argument('--message-size', type=int, default=2000)
+    parser.add_argument('--operations', type=int, default=5)
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault('RSA_KEY_POOL_SIZE', '0')
+    os.environ.setdefault('DB_CREATE_ON_START', '1')
+    
+    import main as _  # noqa: F401  registers routes
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session, undefer
+    from app import app, db
+    from models import User
+    from routes import login_manager, load_user
+    
+    app.config['TESTING'] = True
+    client = app.test_client()
+    client.post('/register', data={
+        'username': 'bench', 'email': 'bench@example.com',
+        'password': 'benchpass', 'confirm_password': 'benchpass',
+    })
+    client.post('/login', data={'username': 'bench', 'password': 'benchpass'})
+    
+    text = ('x' * args.message_size)
+    result = client.post('/api/encrypt/batch', json={'messages': [text] * args.messages}).get_json()
+    ciphertext = result['results'][0]['encrypted_message']
+    
+    carrier = io.BytesIO()
+    Image.fromarray(np.random.default_rng(3).integers(0, 256, (64, 64, 3), dtype=np.uint8), 'RGB').save(carrier, 'PNG')
+    for _ in range(args.operations):
+        client.post('/steganography', data={
+            'message': text[:200], 'secret_key': 'bench-key',
+            'image': (io.BytesIO(carrier.getvalue()), 'carrier.png'),
+        }, content_type='multipart/form-data')
+    
+    requests = [
+        ('GET /encrypt', lambda: client.get('/encrypt')),
+        ('GET /dashboard', lambda: client.get('/dashboard')),
+        ('GET /history/messages', lambda: client.get('/history/messages')),
+        ('GET /history/steganography', lambda: client.get('/history/steganography')),
+        ('GET /api/messages', lambda: client.get('/api/messages')),
+        ('POST /encrypt', lambda: client.post('/encrypt', data={'message': 'hello'})),
+        ('POST /decrypt', lambda: client.post('/decrypt', data={'encrypted_message': ciphertext})),
+    ]
+    
+    def undefer_everything(orm_execute_state):
+        if orm_execute_state.is_select:
+            orm_execute_state.statement = orm_execute_state.statement.options(undefer('*'))
+    
+    def measure_eager(func):
+        # Serve the request the way it was served before deferral
+        event.listen(Session, 'do_orm_execute', undefer_everything)
+        login_manager.user_loader(lambda user_id: db.session.get(User, int(user_id)))
+        try:
+            return recorder.measure(func)
+        finally:
+            event.remove(Session, 'do_orm_execute', undefer_everything)
+            login_manager.user_loader(load_user)
+    
+    # Each request gets its own app context and session, as in production
+    with app.app_context():
+        recorder = SelectRecorder(db.engine)
+    deferred, eager = {}, {}
+    for label, func in requests:
+        # Both passes see the same rows, since POST requests insert new ones
+        deferred[label] = recorder.measure(func)
+        eager[label] = measure_eager(func)
+    
+    print(f"{'request':<28} {'eager bytes':>12} {'deferred bytes':>15} {'saved':>7}   queries")
+    for label, _ in requests:
+        eager_queries, eager_bytes = eager[label]
+        deferred_queries, deferred_bytes = deferred[label]
+        saved = 1 - deferred_bytes / eager_bytes if eager_bytes else 0.0
+        print(f"{label:<28} {eager_bytes:>12,} {deferred_bytes:>15,} {saved:>6.0%}   {eager_queries} -> {deferred_queries}")
+
+
+if __name__ == '__main__':
+    main()
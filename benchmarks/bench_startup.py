@@ -0,0 +1,132 @@
+"""Cold start of a web worker: time to a ready app and import time per module.
+
+Usage: python benchmarks/bench_startup.py [--repeat 10] [--top 15] [--module main]
+
+Every sample is a fresh interpreter importing --module (what a gunicorn worker
+does) under python -X importtime, against an empty SQLite database in a temp
+directory. Reports the median time to a ready app, the whole process and
+`flask init-db`, the median cumulative import time of the project's own modules
+and of the heaviest other top-level packages, and whether numpy, PIL or
+cryptography were imported at all; they should only load on first use.
+benchmarks/suite.py runs the same measurements as its 'startup' group.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that only the steganography and crypto routes need
+HEAVY_MODULES = ('numpy', 'PIL', 'cryptography')
+
+# Project modules, i.e. the .py files at the repository root
+PROJECT_MODULES = sorted(name[:-3] for name in os.listdir(ROOT) if name.endswith('.py'))
+
+IMPORT_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{'seconds': time.perf_counter() - start,
+                  'loaded': [name for name in {heavy!r} if name in sys.modules]}}))
+"""
+
+INIT_DB_SNIPPET = """
+import json, time
+from app import init_db
+start = time.perf_counter()
+init_db()
+print(json.dumps({'seconds': time.perf_counter() - start}))
+"""
+
+# "import time: self [us] | cumulative | <indent>name"
+IMPORT_TIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| *(\S+)$')
+
+
+def _run(snippet, workdir, importtime=False):
+    env = dict(os.environ)
+    env.update({
+        'PYTHONPATH': ROOT,
+        'DATABASE_URL': f"sqlite:///{os.path.join(workdir, 'startup.db')}",
+        'RSA_KEY_POOL_SIZE': '0',
+        'LOG_LEVEL': 'WARNING',
+    })
+    env.pop('DB_CREATE_ON_START', None)
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', snippet]
+    start = time.perf_counter()
+    completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise RuntimeError(f"startup sample failed:\n{completed.stderr[-2000:]}")
+    return elapsed, json.loads(completed.stdout.strip().splitlines()[-1]), completed.stderr
+
+
+def parse_import_times(stderr):
+    """Cumulative seconds of every top-level module or package imported"""
+    times = {}
+    for line in stderr.splitlines():
+        match = IMPORT_TIME_LINE.match(line)
+        if not match:
+            continue
+        # Submodules are already counted in their package's cumulative time
+        name = match.group(3)
+        if '.' not in name:
+            times.setdefault(name, int(match.group(2)) / 1e6)
+    return times
+
+
+def collect(repeat, module='main'):
+    """Per-sample seconds for every startup measurement, plus the heavy modules seen loaded"""
+    samples = {}
+    loaded = set()
+    for _ in range(repeat):
+        workdir = tempfile.mkdtemp()
+        process, result, stderr = _run(IMPORT_SNIPPET.format(module=module, heavy=HEAVY_MODULES), workdir, True)
+        samples.setdefault(f'startup.import_{module}', []).append(result['seconds'])
+        samples.setdefault('startup.process', []).append(process)
+        loaded.update(result['loaded'])
+        for name, seconds in parse_import_times(stderr).items():
+            samples.setdefault(f'startup.import.{name}', []).append(seconds)
+        
+        _, result, _ = _run(INIT_DB_SNIPPET, workdir)
+        samples.setdefault('startup.init_db', []).append(result['seconds'])
+    return samples, sorted(loaded)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--top', type=int, default=15, help='third-party packages to list')
+    parser.add_argument('--module', default='main', help='module a worker imports to get the app')
+    args = parser.parse_args()
+    
+    # Compile bytecode first, so the samples measure warm starts as after a deploy
+    subprocess.run([sys.executable, '-m', 'compileall', '-q', ROOT], check=True, capture_output=True)
+    samples, loaded = collect(args.repeat, args.module)
+    medians = {name: statistics.median(values) for name, values in samples.items()}
+    
+    print(f"{args.repeat} fresh interpreters, Python {sys.version.split()[0]}")
+    for name in (f'startup.import_{args.module}', 'startup.process', 'startup.init_db'):
+        print(f"{name:<36} {medians[name] * 1000:10.1f} ms")
+    
+    modules = {name[len('startup.import.'):]: seconds for name, seconds in medians.items()
+               if name.startswith('startup.import.')}
+    print("\nproject modules (cumulative)")
+    for name, seconds in sorted(modules.items(), key=lambda item: -item[1]):
+        if name in PROJECT_MODULES:
+            print(f"  {name:<34} {seconds * 1000:10.1f} ms")
+    print(f"\nheaviest other packages (cumulative, top {args.top})")
+    others = sorted(((name, seconds) for name, seconds in modules.items() if name not in PROJECT_MODULES),
+                    key=lambda item: -item[1])
+    for name, seconds in others[:args.top]:
+        print(f"  {name:<34} {seconds * 1000:10.1f} ms")
+    print(f"\nheavy modules imported at startup: {', '.join(loaded) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+"""Compare the vectorized LSB encoder (legacy delimiter format) against the original per-pixel loop.
+
+Usage: python benchmarks/bench_steganography.py [--sizes 0.1,1,4,12,16] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from steganography import SteganographyUtils  # noqa: E402
+
+
+def legacy_hide_message_in_image(image_path, message, secret_key, output_path):
+    """Reference copy of the original tuple-per-pixel encoder"""
+    img = Image.open(image_path)
+    if img.mode != 'RGB':
+        img = img.convert('RGB')
+    
+    full_message = message + "<<<END_OF_MESSAGE>>>"
+    binary_message = ''.join(format(ord(char), '08b') for char in full_message)
+    
+    width, height = img.size
+    # Image.getdata() is deprecated; the same list of pixel tuples
+    pixels = [tuple(pixel) for pixel in np.asarray(img).reshape(-1, 3).tolist()]
+    
+    data_index = 0
+    for i in range(len(pixels)):
+        if data_index < len(binary_message):
+            pixel = list(pixels[i])
+            for j in range(3):
+                if data_index < len(binary_message):
+                    pixel[j] = pixel[j] & 0xFE | int(binary_message[data_index])
+                    data_index += 1
+            pixels[i] = tuple(pixel)
+        else:
+            break
+    
+    stego_img = Image.new('RGB', (width, height))
+    stego_img.putdata(pixels)
+    stego_img.save(output_path)
+
+
+def make_carrier(path, megapixels):
+    """Write a random RGB PNG with roughly the given pixel count"""
+    side = max(int((megapixels * 1_000_000) ** 0.5), 8)
+    rng = np.random.default_rng(1234)
+    Image.fromarray(rng.integers(0, 256, (side, side, 3), dtype=np.uint8), 'RGB').save(path)
+    return side
+
+
+def best_of(repeat, func, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='0.1,1,4,12,16', help='comma separated megapixel sizes')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--message-bytes', type=int, default=4096)
+    args = parser.parse_args()
+    
+    message = ('benchmark payload ' * args.message_bytes)[:args.message_bytes]
+    print(f"{'MP':>6} {'legacy s':>10} {'vector s':>10} {'speedup':>8}  identical")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in (float(s) for s in args.sizes.split(',')):
+            carrier = os.path.join(tmp, 'carrier.png')
+            legacy_out = os.path.join(tmp, 'legacy.png')
+            vector_out = os.path.join(tmp, 'vector.png')
+            make_carrier(carrier, size)
+            
+            legacy = best_of(args.repeat, legacy_hide_message_in_image, carrier, message, 'key', legacy_out)
+            # The delimiter format is the one the original encoder wrote, byte for byte
+            vector = best_of(args.repeat, SteganographyUtils.hide_message_in_image, carrier, message, 'key', vector_out,
+                             'legacy')
+            
+            with open(legacy_out, 'rb') as a, open(vector_out, 'rb') as b:
+                identical = a.read() == b.read()
+            print(f"{size:>6} {legacy:>10.3f} {vector:>10.3f} {legacy / vector:>7.1f}x  {identical}")
+
+
+if __name__ == '__main__':
+    main()
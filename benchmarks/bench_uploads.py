@@ -0,0 +1,122 @@
+"""Request latency of in-memory upload decoding versus the old save/reopen/delete path.
+
+Usage: python benchmarks/bench_uploads.py [--megapixels 2] [--concurrency 8] [--requests 64]
+
+Runs concurrent /extract requests through the Flask test client against a
+temporary SQLite database, then repeats the same decode under the same
+concurrency with the upload first written to uploads/ and reopened, which is
+what the handlers used to do.
+"""
+import argparse
+import io
+import os
+import queue
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_stego_png(megapixels, secret_key):
+    from steganography import SteganographyUtils
+    
+    side = max(int((megapixels * 1_000_000) ** 0.5), 8)
+    rng = np.random.default_rng(7)
+    carrier = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (side, side, 3), dtype=np.uint8), 'RGB').save(carrier, 'PNG')
+    carrier.seek(0)
+    output = os.path.join(tempfile.mkdtemp(), 'stego.png')
+    SteganographyUtils.hide_message_in_image(carrier, 'benchmark', secret_key, output)
+    with open(output, 'rb') as f:
+        return f.read()
+
+
+def summarize(label, latencies, wall):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<22} p50 {statistics.median(latencies) * 1000:8.1f} ms   "
+          f"p95 {p95 * 1000:8.1f} ms   {len(latencies) / wall:6.1f} req/s")
+
+
+def run_concurrently(func, count, concurrency):
+    def timed(_):
+        start = time.perf_counter()
+        func()
+        return time.perf_counter() - start
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        latencies = list(pool.map(timed, range(count)))
+    return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--megapixels', type=float, default=2)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=64)
+    args = parser.parse_args()
+    
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault('RSA_KEY_POOL_SIZE', '0')
+    os.environ.setdefault('DB_CREATE_ON_START', '1')
+    
+    import main as _  # noqa: F401  registers routes
+    from app import app
+    from steganography import SteganographyUtils
+    
+    app.config['TESTING'] = True
+    secret_key = 'bench-key'
+    png = make_stego_png(args.megapixels, secret_key)
+    
+    setup = app.test_client()
+    setup.post('/register', data={'username': 'bench', 'email': 'bench@example.com',
+                                  'password': 'benchpass', 'confirm_password': 'benchpass'})
+    
+    # Logged-in clients are checked out per request, so login cost stays out of the timings
+    clients = queue.Queue()
+    for _ in range(args.concurrency):
+        client = app.test_client()
+        client.post('/login', data={'username': 'bench', 'password': 'benchpass'})
+        clients.put(client)
+    
+    def extract_request():
+        client = clients.get()
+        try:
+            response = client.post('/extract', data={'secret_key': secret_key, 'image': (io.BytesIO(png), 'carrier.png')},
+                                   content_type='multipart/form-data')
+            assert response.status_code == 200
+        finally:
+            clients.put(client)
+    
+    def extract_via_disk():
+        path = os.path.join(app.config['UPLOAD_FOLDER'], f"extract_{uuid.uuid4()}_carrier.png")
+        with open(path, 'wb') as f:
+            f.write(png)
+        try:
+            SteganographyUtils.extract_message_from_image(path, secret_key)
+        finally:
+            os.remove(path)
+    
+    def extract_in_memory():
+        SteganographyUtils.extract_message_from_image(io.BytesIO(png), secret_key)
+    
+    print(f"{args.megapixels} MP carrier, {len(png) / 1e6:.1f} MB upload, "
+          f"{args.requests} requests at concurrency {args.concurrency}")
+    summarize('/extract (in memory)', *run_concurrently(extract_request, args.requests, args.concurrency))
+    summarize('decode via disk', *run_concurrently(extract_via_disk, args.requests, args.concurrency))
+    summarize('decode in memory', *run_concurrently(extract_in_memory, args.requests, args.concurrency))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Compare two benchmark suite result files and fail on regressions.
+
+Usage: python benchmarks/compare.py BASELINE CURRENT [--threshold 0.10] [--min-delta-ms 0.05]
+
+A benchmark regresses when its median time grows by more than --threshold
+(a fraction of the baseline) and by more than --min-delta-ms in absolute
+terms, which keeps microsecond-scale noise from failing the run. Benchmarks
+present in only one file are listed but never fail the comparison. Exits
+with status 1 if anything regressed.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold, min_delta):
+    """Rows of (name, baseline median, current median, relative change, status)"""
+    rows = []
+    for name in sorted(set(baseline) | set(current)):
+        if name not in current:
+            rows.append((name, baseline[name]['median'], None, None, 'missing'))
+            continue
+        if name not in baseline:
+            rows.append((name, None, current[name]['median'], None, 'new'))
+            continue
+        old, new = baseline[name]['median'], current[name]['median']
+        change = (new - old) / old if old else 0.0
+        if change > threshold and new - old > min_delta:
+            status = 'REGRESSION'
+        elif change < -threshold and old - new > min_delta:
+            status = 'improved'
+        else:
+            status = 'ok'
+        rows.append((name, old, new, change, status))
+    return rows
+
+
+def format_ms(value):
+    return f"{value * 1000:10.3f}" if value is not None else f"{'-':>10}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--threshold', type=float, default=0.10, help='allowed relative slowdown (0.10 = 10%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=0.05, help='ignore slowdowns smaller than this')
+    args = parser.parse_args()
+    
+    baseline = load(args.baseline)
+    current = load(args.current)
+    for key in ('python', 'machine', 'cpu_count'):
+        if baseline['environment'].get(key) != current['environment'].get(key):
+            print(f"warning: {key} differs ({baseline['environment'].get(key)} vs "
+                  f"{current['environment'].get(key)}); results may not be comparable", file=sys.stderr)
+    
+    rows = compare(baseline['results'], current['results'], args.threshold, args.min_delta_ms / 1000)
+    print(f"{'benchmark':<36} {'baseline ms':>11} {'current ms':>11} {'change':>8}   status")
+    for name, old, new, change, status in rows:
+        change_text = f"{change:+7.1%}" if change is not None else f"{'':>7}"
+        print(f"{name:<36} {format_ms(old)}  {format_ms(new)}  {change_text}   {status}")
+    
+    regressions = [row for row in rows if row[4] == 'REGRESSION']
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) above {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
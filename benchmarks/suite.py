@@ -0,0 +1,288 @@
+"""Reproducible benchmark suite for crypto, steganography, end-to-end routes and worker startup.
+
+Usage: python benchmarks/suite.py [--output benchmarks/results/latest.json] [--sizes 0.1,1,4,16]
+                                  [--only crypto,stego,routes,startup] [--repeat 5] [--quick]
+
+Every benchmark reports seconds per operation (lower is better) as the
+median over --repeat samples, plus min and p95. Inputs are generated from
+fixed seeds. Results are written as JSON together with enough environment
+detail to tell whether two runs are comparable; compare them with
+benchmarks/compare.py, which exits non-zero on a regression.
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime, timezone
+
+import numpy as np
+from PIL import Image
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+GROUPS = ('crypto', 'stego', 'routes', 'startup')
+DEFAULT_SIZES = '0.1,1,4,16'
+QUICK_SIZES = '0.1,1'
+
+# Each sample lasts at least this long, so fast operations are timed in loops
+MIN_SAMPLE_SECONDS = 0.2
+
+
+def summarize(samples, number=1):
+    """Seconds-per-operation statistics for a list of per-sample totals"""
+    per_op = sorted(sample / number for sample in samples)
+    return {
+        'unit': 'seconds',
+        'median': statistics.median(per_op),
+        'min': per_op[0],
+        'p95': per_op[min(len(per_op) - 1, int(len(per_op) * 0.95))],
+        'samples': len(per_op),
+        'ops_per_sample': number,
+    }
+
+
+def measure(func, repeat):
+    """Time func() with timeit, looping enough times per sample to dwarf timer overhead"""
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= MIN_SAMPLE_SECONDS or number >= 1_000_000:
+            break
+        number *= 10 if elapsed < MIN_SAMPLE_SECONDS / 10 else 2
+    return summarize(timer.repeat(repeat, number), number)
+
+
+def measure_each(func, repeat, warmup=1):
+    """Time repeat individual calls, for slow operations and requests"""
+    for _ in range(warmup):
+        func()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def make_carrier(megapixels, seed=11):
+    side = max(int((megapixels * 1_000_000) ** 0.5), 8)
+    rng = np.random.default_rng(seed)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 256, (side, side, 3), dtype=np.uint8), 'RGB').save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def size_label(megapixels):
+    return f"{megapixels:g}mp"
+
+
+def bench_crypto(results, repeat):
+    import crypto_utils
+    from crypto_utils import CryptoUtils
+    
+    private_pem, public_pem = CryptoUtils.generate_rsa_keys()
+    public_key = CryptoUtils.load_public_key(public_pem)
+    private_key = CryptoUtils.load_private_key(private_pem)
+    short_message = 'benchmark message'
+    long_message = 'x' * 64 * 1024
+    
+    results['crypto.keygen'] = measure_each(CryptoUtils.generate_rsa_keys, repeat)
+    results['crypto.pem_parse.private'] = measure(lambda: CryptoUtils.load_private_key(private_pem), repeat)
+    results['crypto.pem_parse.public'] = measure(lambda: CryptoUtils.load_public_key(public_pem), repeat)
+    private_der, public_der = CryptoUtils.generate_rsa_keys('der')
+    results['crypto.der_parse.private'] = measure(lambda: CryptoUtils.load_private_key(private_der), repeat)
+    results['crypto.der_parse.public'] = measure(lambda: CryptoUtils.load_public_key(public_der), repeat)
+    
+    results['crypto.encrypt.rsa'] = measure(
+        lambda: CryptoUtils.encrypt_message(short_message, public_key, mode='rsa'), repeat
+    )
+    rsa_ciphertext = CryptoUtils.encrypt_message(short_message, public_key, mode='rsa')
+    results['crypto.decrypt.rsa'] = measure(lambda: CryptoUtils.decrypt_message(rsa_ciphertext, private_key), repeat)
+    
+    # Hybrid mode reuses a wrapped data key, so warm numbers are the common case
+    # and cold numbers pay the RSA wrap/unwrap on every message
+    for label, message in (('small', short_message), ('64kb', long_message)):
+        ciphertext = CryptoUtils.encrypt_message(message, public_key)
+        results[f'crypto.encrypt.hybrid.{label}'] = measure(
+            lambda message=message: CryptoUtils.encrypt_message(message, public_key), repeat
+        )
+        results[f'crypto.decrypt.hybrid.{label}'] = measure(
+            lambda ciphertext=ciphertext: CryptoUtils.decrypt_message(ciphertext, private_key), repeat
+        )
+    
+    def encrypt_cold():
+        crypto_utils._data_keys.clear()
+        return CryptoUtils.encrypt_message(short_message, public_key)
+    
+    def decrypt_cold():
+        crypto_utils._unwrapped_keys.clear()
+        return CryptoUtils.decrypt_message(ciphertext, private_key)
+    
+    ciphertext = CryptoUtils.encrypt_message(short_message, public_key)
+    results['crypto.encrypt.hybrid.cold'] = measure(encrypt_cold, repeat)
+    results['crypto.decrypt.hybrid.cold'] = measure(decrypt_cold, repeat)
+
+
+def bench_stego(results, repeat, sizes, workdir):
+    from steganography import PAYLOAD_FORMATS, SteganographyUtils
+    
+    message = 'benchmark payload ' * 64
+    output_path = os.path.join(workdir, 'stego.png')
+    for megapixels in sizes:
+        carrier = make_carrier(megapixels)
+        for payload_format in PAYLOAD_FORMATS:
+            name = f'{payload_format}.{size_label(megapixels)}'
+            
+            def hide():
+                SteganographyUtils.hide_message_in_image(
+                    io.BytesIO(carrier), message, 'bench-key', output_path, payload_format=payload_format
+                )
+            
+            results[f'stego.hide.{name}'] = measure_each(hide, repeat)
+            with open(output_path, 'rb') as f:
+                stego = f.read()
+            results[f'stego.extract.{name}'] = measure_each(
+                lambda: SteganographyUtils.extract_message_from_image(io.BytesIO(stego), 'bench-key'), repeat
+            )
+
+
+def bench_routes(results, repeat, megapixels, workdir):
+    os.chdir(workdir)
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ.setdefault('RSA_KEY_POOL_SIZE', '0')
+    os.environ.setdefault('DB_CREATE_ON_START', '1')
+    
+    import main as _  # noqa: F401  registers routes
+    from app import app
+    
+    app.config['TESTING'] = True
+    client = app.test_client()
+    client.post('/register', data={
+        'username': 'bench', 'email': 'bench@example.com',
+        'password': 'benchpass', 'confirm_password': 'benchpass',
+    })
+    client.post('/login', data={'username': 'bench', 'password': 'benchpass'})
+    
+    carrier = make_carrier(megapixels)
+    label = size_label(megapixels)
+    stego_response = {}
+    
+    def check(response):
+        if response.status_code != 200:
+            raise RuntimeError(f"{response.request.path} returned {response.status_code}")
+        return response
+    
+    def encrypt():
+        check(client.post('/encrypt', data={'message': 'benchmark message'}))
+    
+    def steganography():
+        response = check(client.post('/steganography', data={
+            'message': 'benchmark payload', 'secret_key': 'bench-key',
+            'image': (io.BytesIO(carrier), 'carrier.png'),
+        }, content_type='multipart/form-data'))
+        stego_response['html'] = response.get_data(as_text=True)
+    
+    results['routes.encrypt'] = measure_each(encrypt, repeat)
+    results[f'routes.steganography.{label}'] = measure_each(steganography, repeat)
+    
+    # Extract what the last /steganography request produced
+    marker = '/download/'
+    start = stego_response['html'].index(marker) + len(marker)
+    filename = stego_response['html'][start:stego_response['html'].index('"', start)]
+    stego = check(client.get(marker + filename)).data
+    
+    def extract():
+        check(client.post('/extract', data={
+            'secret_key': 'bench-key',
+            'image': (io.BytesIO(stego), 'stego.png'),
+        }, content_type='multipart/form-data'))
+    
+    results[f'routes.extract.{label}'] = measure_each(extract, repeat)
+
+
+def bench_startup(results, repeat):
+    # Fresh interpreters, so this group is unaffected by the modules the other groups imported
+    import bench_startup as startup
+    samples, loaded = startup.collect(repeat)
+    for name, values in samples.items():
+        module = name[len('startup.import.'):] if name.startswith('startup.import.') else None
+        # Per-module import times are tracked for the project's own modules only
+        if module is None or module in startup.PROJECT_MODULES:
+            results[name] = summarize(values)
+    if loaded:
+        print(f"startup imported {', '.join(loaded)}", file=sys.stderr)
+
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import cryptography
+    import PIL
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pillow': PIL.__version__,
+        'cryptography': cryptography.__version__,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=os.path.join(ROOT, 'benchmarks', 'results', 'latest.json'))
+    parser.add_argument('--sizes', help=f'comma separated megapixel sizes (default {DEFAULT_SIZES})')
+    parser.add_argument('--only', default=','.join(GROUPS), help='comma separated groups to run')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--route-megapixels', type=float, default=1)
+    parser.add_argument('--quick', action='store_true', help=f'small images only ({QUICK_SIZES})')
+    args = parser.parse_args()
+    
+    groups = [group.strip() for group in args.only.split(',') if group.strip()]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"unknown groups: {', '.join(sorted(unknown))}")
+    sizes = [float(size) for size in (args.sizes or (QUICK_SIZES if args.quick else DEFAULT_SIZES)).split(',')]
+    output = os.path.abspath(args.output)
+    workdir = tempfile.mkdtemp()
+    
+    results = {}
+    for group in groups:
+        started = time.perf_counter()
+        if group == 'crypto':
+            bench_crypto(results, args.repeat)
+        elif group == 'stego':
+            bench_stego(results, args.repeat, sizes, workdir)
+        elif group == 'routes':
+            bench_routes(results, args.repeat, args.route_megapixels, workdir)
+        else:
+            bench_startup(results, args.repeat)
+        print(f"{group} finished in {time.perf_counter() - started:.1f} s", file=sys.stderr)
+    
+    for name, result in results.items():
+        print(f"{name:<36} {result['median'] * 1000:10.3f} ms   min {result['min'] * 1000:10.3f} ms")
+    
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2, sort_keys=True)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
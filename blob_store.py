@@ -0,0 +1,119 @@
+import hashlib
+import os
+import time
+import uuid
+
+# Bytes read per step while hashing and copying a stream
+COPY_CHUNK_SIZE = 1024 * 1024
+
+class BlobInUseError(Exception):
+    """Raised by retire() when a blob has been stored again since the cutoff"""
+
+class BlobStore:
+    """Content-addressed file store: blobs live at <root>/<ab>/<cd>/<sha256>"""
+    
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.tmp_dir = os.path.join(self.root, 'tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+    
+    def path(self, digest):
+        """Filesystem path of a blob"""
+        if len(digest) != 64 or not all(c in '0123456789abcdef' for c in digest):
+            raise ValueError(f"Invalid blob digest: {digest}")
+        return os.path.join(self.root, digest[:2], digest[2:4], digest)
+    
+    def exists(self, digest):
+        return os.path.exists(self.path(digest))
+    
+    def temp_path(self, suffix=''):
+        """A fresh path inside the store for writing a file that put_file() will adopt"""
+        return os.path.join(self.tmp_dir, f"{uuid.uuid4().hex}{suffix}")
+    
+    def put_stream(self, stream):
+        """Copy a binary stream into the store, returning its SHA-256 hex digest"""
+        hasher = hashlib.sha256()
+        tmp_path = self.temp_path()
+        with open(tmp_path, 'wb') as tmp:
+            while True:
+                chunk = stream.read(COPY_CHUNK_SIZE)
+                if not chunk:
+                    break
+                hasher.update(chunk)
+                tmp.write(chunk)
+        return self._adopt(tmp_path, hasher.hexdigest())
+    
+    def put_file(self, file_path):
+        """Move a file into the store, returning its SHA-256 hex digest"""
+        hasher = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        return self._adopt(file_path, hasher.hexdigest())
+    
+    def delete(self, digest):
+        """Remove a blob file if present"""
+        try:
+            os.remove(self.path(digest))
+            return True
+        except FileNotFoundError:
+            return False
+    
+    def iter_blobs(self):
+        """Yield (digest, mtime) for every blob file in the store"""
+        for shard in os.scandir(self.root):
+            if not shard.is_dir() or shard.path == self.tmp_dir:
+                continue
+            for subshard in os.scandir(shard.path):
+                if not subshard.is_dir():
+                    continue
+                for entry in os.scandir(subshard.path):
+                    if entry.is_file():
+                        yield entry.name, entry.stat().st_mtime
+    
+    def remove_stale_temp_files(self, older_than):
+        """Delete temp files left behind by interrupted writes"""
+        cutoff = time.time() - older_than
+        removed = 0
+        for entry in os.scandir(self.tmp_dir):
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        return removed
+    
+    def retire(self, digest, cutoff):
+        """Move a blob not stored again since cutoff out of the store, returning where it went
+        
+        Returns None if there is no such file, and raises BlobInUseError if a put_*() of the
+        same content refreshed it after cutoff. A put_*() racing with this either refreshes the
+        file before it moves, which is seen here, or finds it gone and stores its own copy.
+        The caller deletes the returned file, or puts it back with restore().
+        """
+        retired = self.temp_path('.retired')
+        try:
+            os.replace(self.path(digest), retired)
+        except FileNotFoundError:
+            return None
+        if os.path.getmtime(retired) >= cutoff:
+            self.restore(digest, retired)
+            raise BlobInUseError(f"Blob {digest} was stored again")
+        return retired
+    
+    def restore(self, digest, retired):
+        """Put a retired blob file back (identical to any copy stored meanwhile)"""
+        target = self.path(digest)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(retired, target)
+    
+    def _adopt(self, tmp_path, digest):
+        target = self.path(digest)
+        try:
+            # Already stored: identical content, keep the existing file and mark it as in use for GC
+            os.utime(target)
+        except FileNotFoundError:
+            # Not stored yet, or retired by GC in the meantime
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(tmp_path, target)
+        else:
+            os.remove(tmp_path)
+        return digest
@@ -0,0 +1,231 @@
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU mapping with hit/miss counters"""
+    
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        """Return the cached value and mark it as recently used"""
+        with self._lock:
+            value = self._data.get(key, _MISSING)
+            if value is _MISSING:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries over maxsize"""
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def pop(self, key, default=None):
+        """Remove and return a cached value"""
+        with self._lock:
+            return self._data.pop(key, default)
+    
+    def clear(self):
+        """Drop every entry and reset the counters"""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._data),
+                'maxsize': self.maxsize,
+            }
+    
+    def __len__(self):
+        return len(self._data)
+
+class SizedLRUCache(LRUCache):
+    """LRUCache also bounded by the total sizeof() of its values; a value over maxbytes is not kept"""
+    
+    def __init__(self, maxsize=128, maxbytes=64 * 1024 * 1024, sizeof=len):
+        super().__init__(maxsize)
+        self.maxbytes = maxbytes
+        self.nbytes = 0
+        self._sizeof = sizeof
+        self._sizes = {}
+    
+    def set(self, key, value):
+        """Store a value, evicting the least recently used entries over maxsize or maxbytes"""
+        size = self._sizeof(value)
+        with self._lock:
+            self.nbytes -= self._sizes.pop(key, 0)
+            self._data.pop(key, None)
+            if size > self.maxbytes:
+                return
+            self._data[key] = value
+            self._sizes[key] = size
+            self.nbytes += size
+            while len(self._data) > self.maxsize or self.nbytes > self.maxbytes:
+                evicted, _ = self._data.popitem(last=False)
+                self.nbytes -= self._sizes.pop(evicted)
+    
+    def pop(self, key, default=None):
+        with self._lock:
+            self.nbytes -= self._sizes.pop(key, 0)
+            return self._data.pop(key, default)
+    
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self._sizes.clear()
+            self.nbytes = 0
+    
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats['nbytes'] = self.nbytes
+            stats['maxbytes'] = self.maxbytes
+        return stats
+
+class TTLCache(LRUCache):
+    """LRUCache whose entries also expire a fixed number of seconds after being set"""
+    
+    def __init__(self, maxsize=128, ttl=30.0, clock=time.monotonic):
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self._clock = clock
+    
+    def get(self, key, default=None):
+        entry = super().get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        expires, value = entry
+        if expires <= self._clock():
+            # Count an expired entry as a miss rather than a hit
+            with self._lock:
+                self.hits -= 1
+                self.misses += 1
+                self._data.pop(key, None)
+            return default
+        return value
+    
+    def set(self, key, value):
+        super().set(key, (self._clock() + self.ttl, value))
+    
+    def pop(self, key, default=None):
+        entry = super().pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+class VersionedTTLCache(TTLCache):
+    """TTLCache whose entries are only served to callers expecting the same version"""
+    
+    def __init__(self, maxsize=128, ttl=30.0, clock=time.monotonic):
+        super().__init__(maxsize, ttl, clock)
+        self.stale = 0
+    
+    def get(self, key, version, default=None):
+        entry = super().get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        entry_version, value = entry
+        if entry_version != version:
+            # The caller has seen a different version of the row, so count a miss
+            with self._lock:
+                self.hits -= 1
+                self.misses += 1
+                self.stale += 1
+                self._data.pop(key, None)
+            return default
+        return value
+    
+    def set(self, key, value, version):
+        super().set(key, (version, value))
+    
+    def pop(self, key, default=None):
+        entry = super().pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+    
+    def clear(self):
+        super().clear()
+        with self._lock:
+            self.stale = 0
+    
+    def stats(self):
+        stats = super().stats()
+        stats['stale'] = self.stale
+        return stats
+
+class FailureLimiter:
+    """Per-key leaky bucket of recent failures: limit failures are allowed per window seconds
+    
+    Each tracked key costs one (level, timestamp) pair; at most maxsize keys are kept,
+    evicting the one that failed least recently.
+    """
+    
+    def __init__(self, limit=10, window=60.0, maxsize=10000, clock=time.monotonic):
+        self.limit = limit
+        self.window = window
+        self.maxsize = maxsize
+        self.rejected = 0
+        self._rate = limit / window if window > 0 else float('inf')
+        self._levels = OrderedDict()
+        self._clock = clock
+        self._lock = threading.Lock()
+    
+    def _level(self, key, now):
+        entry = self._levels.get(key)
+        if entry is None:
+            return 0.0
+        level, updated = entry
+        return max(0.0, level - (now - updated) * self._rate)
+    
+    def retry_after(self, key):
+        """Seconds until key may fail again without going over the limit; 0 if it may go ahead"""
+        if self.limit <= 0:
+            return 0.0
+        with self._lock:
+            over = self._level(key, self._clock()) + 1 - self.limit
+            if over <= 0:
+                return 0.0
+            self.rejected += 1
+            return over / self._rate
+    
+    def record_failure(self, key):
+        if self.limit <= 0:
+            return
+        with self._lock:
+            now = self._clock()
+            self._levels[key] = (self._level(key, now) + 1, now)
+            self._levels.move_to_end(key)
+            while len(self._levels) > self.maxsize:
+                self._levels.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._levels.clear()
+            self.rejected = 0
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'tracked': len(self._levels),
+                'rejected': self.rejected,
+                'limit': self.limit,
+                'window': self.window,
+            }
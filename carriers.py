@@ -0,0 +1,160 @@
+from collections import namedtuple
+import numpy as np
+from PIL import Image, ImageSequence
+from PIL.PngImagePlugin import Blend, Disposal
+
+# Stego output is always PNG (APNG for animations); JPEG or GIF re-encoding would destroy the LSBs
+OUTPUT_EXTENSION = '.png'
+
+# Source modes whose alpha channel is kept, and carries payload bits, in the output
+ALPHA_MODES = ('RGBA', 'RGBa', 'LA', 'La', 'PA')
+
+
+class CarrierInfo(namedtuple('CarrierInfo', 'format width height frames mode')):
+    """Carrier geometry as read from the image header"""
+    __slots__ = ()
+    
+    @property
+    def channels(self):
+        return len(self.mode)
+    
+    @property
+    def frame_bits(self):
+        """LSBs available in one frame"""
+        return self.width * self.height * self.channels
+    
+    @property
+    def capacity_bytes(self):
+        """Raw LSB capacity across all frames, before any payload framing"""
+        return self.frames * self.frame_bits // 8
+    
+    @property
+    def output_format(self):
+        return 'APNG' if self.frames > 1 else 'PNG'
+
+
+class Carrier:
+    """An opened carrier image: geometry from the header up front, pixels decoded on demand"""
+    
+    def __init__(self, img, source=None):
+        self.image = img
+        self.source = source
+        self.info = CarrierInfo(
+            img.format, img.width, img.height, getattr(img, 'n_frames', 1), Carrier.carrier_mode(img)
+        )
+        self.durations = []
+        self.loop = img.info.get('loop', 0)
+        self._first_frame = None
+    
+    @classmethod
+    def open(cls, source):
+        return cls(Image.open(source), source)
+    
+    @staticmethod
+    def probe(source):
+        """CarrierInfo of a file or stream without decoding any pixels; streams are rewound"""
+        position = source.tell() if hasattr(source, 'seek') else None
+        try:
+            with Image.open(source) as img:
+                return Carrier(img).info
+        finally:
+            if position is not None:
+                source.seek(position)
+    
+    @staticmethod
+    def carrier_mode(img):
+        """RGBA for images with any kind of transparency, RGB for everything else"""
+        if img.mode in ALPHA_MODES or 'transparency' in img.info:
+            return 'RGBA'
+        return 'RGB'
+    
+    def first_frame(self):
+        """The first frame converted to the carrier mode"""
+        if self._first_frame is None:
+            self.image.seek(0)
+            img = self.image
+            self._first_frame = img if img.mode == self.info.mode else img.convert(self.info.mode)
+        return self._first_frame
+    
+    def leading_channels(self, count):
+        """The first count channel values of the first frame, decoding as few rows as possible"""
+        rows = -(-count // (self.info.width * self.info.channels))
+        return self.leading_rows(rows).reshape(-1)[:count]
+    
+    def leading_rows(self, rows):
+        """The first rows of the first frame as a (rows, width, channels) uint8 array
+        
+        Non-interlaced PNGs, which is everything this app writes, are inflated top down, so
+        only those rows are decoded; the rest of the image buffer is never written, and so never
+        takes up memory. Other formats decode the first frame.
+        """
+        info = self.info
+        rows = min(rows, info.height)
+        if self._decodes_by_row():
+            decoder, extents, offset, args = self.image.tile[0]
+            # A second handle on the source, so the lazily loaded carrier image stays untouched
+            with Image.open(self.source) as head:
+                head.tile = [(decoder, (0, 0, info.width, rows), offset, args)]
+                head.load()
+                return np.asarray(head.crop((0, 0, info.width, rows)), dtype=np.uint8)
+        return np.asarray(self.first_frame(), dtype=np.uint8)[:rows]
+    
+    def row_bands(self, first_rows):
+        """Every frame top to bottom as (rows, width, channels) uint8 arrays
+        
+        A single-frame PNG comes in bands of growing height, each decoded by re-inflating the
+        rows above it (a third extra inflate work at most), so a scan that stops early only
+        decodes and holds up to four times the rows it reached. Anything else is decoded whole.
+        """
+        if self.info.frames > 1:
+            yield from self.pixels()
+            return
+        if not self._decodes_by_row():
+            yield np.asarray(self.first_frame(), dtype=np.uint8)
+            return
+        done, rows = 0, first_rows
+        while done < self.info.height:
+            band = self.leading_rows(rows)
+            yield band[done:]
+            done = len(band)
+            rows *= 4
+    
+    def _decodes_by_row(self):
+        img = self.image
+        return (self.source is not None and img.format == 'PNG' and not img.info.get('interlace')
+                and img.mode == self.info.mode and len(img.tile) == 1 and img.tile[0][0] == 'zip')
+    
+    def pixels(self):
+        """Decode every frame into one writable (frames, height, width, channels) uint8 array"""
+        info = self.info
+        if info.frames == 1:
+            self.durations = [self.image.info.get('duration', 0)]
+            return np.array(self.first_frame(), dtype=np.uint8)[np.newaxis]
+        
+        pixels = np.empty((info.frames, info.height, info.width, info.channels), dtype=np.uint8)
+        self.durations = []
+        # GIF and APNG frames come out composited over the previous ones, i.e. as displayed
+        for index, frame in enumerate(ImageSequence.Iterator(self.image)):
+            self.durations.append(frame.info.get('duration', 0))
+            pixels[index] = np.asarray(frame if frame.mode == info.mode else frame.convert(info.mode))
+        return pixels
+    
+    def save(self, pixels, output_path):
+        """Encode (frames, height, width, channels) pixels losslessly as PNG, or APNG for animations"""
+        if len(pixels) == 1:
+            Image.fromarray(pixels[0]).save(output_path, 'PNG')
+            return
+        
+        frames = [Image.fromarray(frame) for frame in pixels]
+        # The APNG writer folds a frame into its predecessor when both are identical and share a
+        # disposal, which would drop payload frames, so such a frame gets the other disposal
+        disposal = [Disposal.OP_NONE]
+        for index in range(1, len(pixels)):
+            repeated = np.array_equal(pixels[index], pixels[index - 1])
+            disposal.append(Disposal.OP_BACKGROUND if repeated and disposal[-1] == Disposal.OP_NONE
+                            else Disposal.OP_NONE)
+        # Full frames replacing their predecessor keep every pixel exactly as embedded
+        frames[0].save(
+            output_path, 'PNG', save_all=True, append_images=frames[1:],
+            duration=self.durations, loop=self.loop, disposal=disposal, blend=Blend.OP_SOURCE
+        )
@@ -0,0 +1,112 @@
+import threading
+from concurrent.futures.process import BrokenProcessPool
+from process_pool import ProcessPool
+
+
+class OffloadBusyError(Exception):
+    """Raised when an offload pool already has max_pending calls queued or running"""
+
+
+def hash_password(password):
+    """Password hash as stored in users.password_hash"""
+    from werkzeug.security import generate_password_hash
+    return generate_password_hash(password)
+
+
+def check_password(password_hash, password):
+    from werkzeug.security import check_password_hash
+    return check_password_hash(password_hash, password)
+
+
+def generate_keypair():
+    """A fresh (private_der, public_der) RSA key pair"""
+    from crypto_utils import CryptoUtils
+    return CryptoUtils.generate_rsa_keys('der')
+
+
+def decrypt_message(private_key_material, encrypted_message):
+    """Decrypt one base64 ciphertext, parsing the key through the worker's key cache"""
+    from batch_crypto import decrypt_chunk
+    result = decrypt_chunk(private_key_material, [encrypted_message])[0]
+    if 'error' in result:
+        raise Exception(result['error'])
+    return result['decrypted_message']
+
+
+def _warm_up():
+    # Imports the worker would otherwise pay for on its first real call
+    import werkzeug.security  # noqa: F401
+    import crypto_utils  # noqa: F401
+
+
+class CPUOffloadPool:
+    """Runs CPU-bound calls in a per-process ProcessPoolExecutor, so a request only waits for them
+    
+    The waiting request thread (gthread) or greenlet (gevent, whose monkey patching makes the
+    wait cooperative) holds no GIL, so the worker keeps serving other routes meanwhile. With no
+    workers, calls run inline as before.
+    """
+    
+    def __init__(self, name, workers=0, max_pending=16):
+        self.name = name
+        self.workers = workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._completed = 0
+        self._rejected = 0
+        self._pool = ProcessPool(workers)
+        self._lock = threading.Lock()
+    
+    @property
+    def offloaded(self):
+        return self.workers > 0
+    
+    def run(self, func, *args):
+        """Return func(*args) computed in the pool, or raise OffloadBusyError when it is full"""
+        if not self.offloaded:
+            return func(*args)
+        try:
+            return self._submit(func, args).result()
+        except BrokenProcessPool:
+            # A pool process died and took this call with it; try once more on a fresh pool
+            return self._submit(func, args).result()
+    
+    def start(self):
+        """Start every worker process now instead of on the first calls"""
+        if not self.offloaded:
+            return
+        for _ in range(self.workers):
+            self._pool.submit(_warm_up)
+    
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'pending': self._pending,
+                'max_pending': self.max_pending,
+                'completed': self._completed,
+                'rejected': self._rejected,
+            }
+    
+    def shutdown(self):
+        self._pool.shutdown()
+    
+    def _submit(self, func, args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self._rejected += 1
+                raise OffloadBusyError(f"Server busy ({self.name}), try again shortly")
+            self._pending += 1
+        try:
+            future = self._pool.submit(func, *args)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        future.add_done_callback(self._finish)
+        return future
+    
+    def _finish(self, future):
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
@@ -1,82 +1,339 @@
 import hashlib
 import base64
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from cache_utils import LRUCache
+from instrumentation import metrics
 from cryptography.hazmat.primitives.asymmetric import rsa, padding
 from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidSignature, InvalidTag
+
+# Hybrid envelope: magic, version, wrapped key length, RSA-wrapped AES-256 key, nonce, AES-GCM ciphertext
+HYBRID_MAGIC = b'SMHE'
+# Streaming envelope: same header followed by length-prefixed AES-GCM frames
+STREAM_MAGIC = b'SMHS'
+ENVELOPE_VERSION = 1
+NONCE_SIZE = 12
+STREAM_NONCE_PREFIX_SIZE = 7
+STREAM_CHUNK_SIZE = 64 * 1024
+STREAM_MAX_CHUNK_SIZE = 16 * 1024 * 1024
+GCM_TAG_SIZE = 16
+
+ENCRYPTION_MODES = ('hybrid', 'rsa')
+KEY_ENCODINGS = ('pem', 'der')
+
+# A wrapped data key is reused for this many messages or seconds before a
+# new one is generated, so bursts of small messages cost one RSA operation
+DATA_KEY_MAX_USES = 10000
+DATA_KEY_MAX_AGE = 300
+DATA_KEY_CACHE_SIZE = 128
+UNWRAPPED_KEY_CACHE_SIZE = 256
+
+# Parsed RSA key objects kept per process, keyed by user id and key digest
+PARSED_KEY_CACHE_SIZE = int(os.environ.get('PARSED_KEY_CACHE_SIZE', 256))
+
+OAEP_PADDING = padding.OAEP(
+    mgf=padding.MGF1(algorithm=hashes.SHA256()),
+    algorithm=hashes.SHA256(),
+    label=None
+)
+
+_data_keys = OrderedDict()
+_unwrapped_keys = OrderedDict()
+_data_key_lock = threading.Lock()
 
 class CryptoUtils:
     @staticmethod
-    def generate_rsa_keys():
-        """Generate RSA key pair"""
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=2048,
-        )
+    def generate_rsa_keys(encoding='pem'):
+        """Generate RSA key pair, as PEM strings or as DER bytes with encoding='der'"""
+        if encoding not in KEY_ENCODINGS:
+            raise ValueError(f"Unknown key encoding: {encoding}")
+        with metrics.stage('rsa_keygen'):
+            private_key = rsa.generate_private_key(
+                public_exponent=65537,
+                key_size=2048,
+            )
         
-        private_pem = private_key.private_bytes(
-            encoding=serialization.Encoding.PEM,
+        serialization_encoding = serialization.Encoding.PEM if encoding == 'pem' else serialization.Encoding.DER
+        private_bytes = private_key.private_bytes(
+            encoding=serialization_encoding,
             format=serialization.PrivateFormat.PKCS8,
             encryption_algorithm=serialization.NoEncryption()
         )
         
         public_key = private_key.public_key()
-        public_pem = public_key.public_bytes(
-            encoding=serialization.Encoding.PEM,
+        public_bytes = public_key.public_bytes(
+            encoding=serialization_encoding,
             format=serialization.PublicFormat.SubjectPublicKeyInfo
         )
         
-        return private_pem.decode('utf-8'), public_pem.decode('utf-8')
+        if encoding == 'der':
+            return private_bytes, public_bytes
+        return private_bytes.decode('utf-8'), public_bytes.decode('utf-8')
     
     @staticmethod
-    def encrypt_message(message, public_key_pem):
-        """Encrypt message using RSA public key"""
+    def encrypt_message(message, public_key, mode='hybrid'):
+        """Encrypt message using RSA public key (PEM, DER or parsed), or RSA-wrapped AES-GCM in hybrid mode"""
         try:
-            public_key = serialization.load_pem_public_key(public_key_pem.encode('utf-8'))
-            
-            # RSA can only encrypt small messages, so for larger messages we would need hybrid encryption
-            # For demo purposes, we'll limit message size
-            message_bytes = message.encode('utf-8')
-            
-            if len(message_bytes) > 190:  # RSA 2048 can encrypt up to ~245 bytes, leaving some margin
-                raise ValueError("Message too long for RSA encryption. Maximum ~190 characters.")
-            
-            encrypted = public_key.encrypt(
-                message_bytes,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
+            return base64.b64encode(CryptoUtils._encrypt(message, public_key, mode)).decode('utf-8')
+        except Exception as e:
+            raise Exception(f"Encryption failed: {str(e)}")
+    
+    @staticmethod
+    def encrypt_message_bytes(message, public_key, mode='hybrid'):
+        """Like encrypt_message, returning the raw ciphertext for binary storage"""
+        try:
+            return CryptoUtils._encrypt(message, public_key, mode)
+        except Exception as e:
+            raise Exception(f"Encryption failed: {str(e)}")
+    
+    @staticmethod
+    def decrypt_message(encrypted_message, private_key):
+        """Decrypt a base64 pure RSA or hybrid message using RSA private key (PEM, DER or parsed)"""
+        try:
+            return CryptoUtils._decrypt(base64.b64decode(encrypted_message.encode('utf-8')), private_key)
+        except Exception as e:
+            raise Exception(f"Decryption failed: {str(e)}")
+    
+    @staticmethod
+    def decrypt_message_bytes(encrypted_bytes, private_key):
+        """Like decrypt_message, for a raw ciphertext"""
+        try:
+            return CryptoUtils._decrypt(encrypted_bytes, private_key)
+        except Exception as e:
+            raise Exception(f"Decryption failed: {str(e)}")
+    
+    @staticmethod
+    def _encrypt(message, public_key, mode):
+        if mode not in ENCRYPTION_MODES:
+            raise ValueError(f"Unknown encryption mode: {mode}")
+        
+        public_key = CryptoUtils.load_public_key(public_key)
+        message_bytes = message.encode('utf-8')
+        
+        if mode == 'hybrid':
+            data_key, header = CryptoUtils._session_data_key(public_key)
+            nonce = os.urandom(NONCE_SIZE)
+            return header + nonce + AESGCM(data_key).encrypt(nonce, message_bytes, header)
+        
+        # Pure RSA can only encrypt small messages
+        if len(message_bytes) > 190:  # RSA 2048 can encrypt up to ~245 bytes, leaving some margin
+            raise ValueError("Message too long for RSA encryption. Maximum ~190 characters.")
+        
+        with metrics.stage('oaep_encrypt'):
+            return public_key.encrypt(message_bytes, OAEP_PADDING)
+    
+    @staticmethod
+    def _decrypt(encrypted_bytes, private_key):
+        private_key = CryptoUtils.load_private_key(private_key)
+        
+        # Legacy ciphertexts are exactly one RSA block; envelopes are always longer
+        if len(encrypted_bytes) == private_key.key_size // 8:
+            with metrics.stage('oaep_decrypt'):
+                decrypted = private_key.decrypt(encrypted_bytes, OAEP_PADDING)
+        else:
+            data_key, offset = CryptoUtils._open_envelope_header(encrypted_bytes, HYBRID_MAGIC, private_key)
+            nonce = encrypted_bytes[offset:offset + NONCE_SIZE]
+            try:
+                decrypted = AESGCM(data_key).decrypt(
+                    nonce, encrypted_bytes[offset + NONCE_SIZE:], encrypted_bytes[:offset]
                 )
-            )
+            except InvalidTag:
+                raise ValueError("Message authentication failed")
+        
+        return decrypted.decode('utf-8')
+    
+    @staticmethod
+    def encrypt_stream(source, destination, public_key, chunk_size=STREAM_CHUNK_SIZE):
+        """Encrypt a binary file-like object into another, one chunk at a time"""
+        try:
+            if not 0 < chunk_size <= STREAM_MAX_CHUNK_SIZE:
+                raise ValueError("Invalid chunk size")
+            
+            public_key = CryptoUtils.load_public_key(public_key)
+            data_key = AESGCM.generate_key(bit_length=256)
+            with metrics.stage('oaep_encrypt'):
+                wrapped_key = public_key.encrypt(data_key, OAEP_PADDING)
+            header = CryptoUtils._envelope_header(STREAM_MAGIC, wrapped_key)
+            nonce_prefix = os.urandom(STREAM_NONCE_PREFIX_SIZE)
+            destination.write(header + nonce_prefix)
             
-            return base64.b64encode(encrypted).decode('utf-8')
+            aesgcm = AESGCM(data_key)
+            counter = 0
+            chunk = source.read(chunk_size)
+            while True:
+                # Read one chunk ahead so the last frame can be marked as final
+                next_chunk = source.read(chunk_size)
+                final = not next_chunk
+                nonce = CryptoUtils._stream_nonce(nonce_prefix, counter, final)
+                frame = aesgcm.encrypt(nonce, chunk, header)
+                destination.write(struct.pack('>I', len(frame)) + frame)
+                if final:
+                    return counter + 1
+                chunk = next_chunk
+                counter += 1
         except Exception as e:
             raise Exception(f"Encryption failed: {str(e)}")
     
     @staticmethod
-    def decrypt_message(encrypted_message, private_key_pem):
-        """Decrypt message using RSA private key"""
+    def decrypt_stream(source, destination, private_key):
+        """Decrypt a stream produced by encrypt_stream into a binary file-like object"""
         try:
-            private_key = serialization.load_pem_private_key(
-                private_key_pem.encode('utf-8'),
-                password=None
-            )
+            private_key = CryptoUtils.load_private_key(private_key)
             
-            encrypted_bytes = base64.b64decode(encrypted_message.encode('utf-8'))
+            fixed = CryptoUtils._read_exact(source, len(STREAM_MAGIC) + 3)
+            wrapped_length = struct.unpack('>H', fixed[-2:])[0]
+            header = fixed + CryptoUtils._read_exact(source, wrapped_length)
+            data_key, _ = CryptoUtils._open_envelope_header(header, STREAM_MAGIC, private_key)
+            nonce_prefix = CryptoUtils._read_exact(source, STREAM_NONCE_PREFIX_SIZE)
             
-            decrypted = private_key.decrypt(
-                encrypted_bytes,
-                padding.OAEP(
-                    mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                    algorithm=hashes.SHA256(),
-                    label=None
-                )
-            )
+            aesgcm = AESGCM(data_key)
+            counter = 0
+            frame = CryptoUtils._read_frame(source)
+            while frame is not None:
+                next_frame = CryptoUtils._read_frame(source)
+                nonce = CryptoUtils._stream_nonce(nonce_prefix, counter, next_frame is None)
+                try:
+                    destination.write(aesgcm.decrypt(nonce, frame, header))
+                except InvalidTag:
+                    raise ValueError("Stream authentication failed (corrupted or truncated)")
+                frame = next_frame
+                counter += 1
             
-            return decrypted.decode('utf-8')
+            if counter == 0:
+                raise ValueError("Stream contains no data frames")
+            return counter
         except Exception as e:
             raise Exception(f"Decryption failed: {str(e)}")
     
+    @staticmethod
+    def load_public_key(public_key):
+        """Parse a PEM (str) or DER (bytes) public key; already parsed keys are returned unchanged"""
+        if isinstance(public_key, str):
+            with metrics.stage('pem_parse_public'):
+                return serialization.load_pem_public_key(public_key.encode('utf-8'))
+        if isinstance(public_key, (bytes, bytearray, memoryview)):
+            with metrics.stage('der_parse_public'):
+                return serialization.load_der_public_key(bytes(public_key))
+        return public_key
+    
+    @staticmethod
+    def load_private_key(private_key):
+        """Parse a PEM (str) or DER (bytes) private key; already parsed keys are returned unchanged"""
+        if isinstance(private_key, str):
+            with metrics.stage('pem_parse_private'):
+                return serialization.load_pem_private_key(
+                    private_key.encode('utf-8'),
+                    password=None
+                )
+        if isinstance(private_key, (bytes, bytearray, memoryview)):
+            with metrics.stage('der_parse_private'):
+                return serialization.load_der_private_key(bytes(private_key), password=None)
+        return private_key
+    
+    @staticmethod
+    def _envelope_header(magic, wrapped_key):
+        """Serialize the self-describing envelope header"""
+        return magic + struct.pack('>BH', ENVELOPE_VERSION, len(wrapped_key)) + wrapped_key
+    
+    @staticmethod
+    def _open_envelope_header(envelope, magic, private_key):
+        """Validate an envelope header and unwrap its data key, returning (key, header length)"""
+        fixed_length = len(magic) + 3
+        if len(envelope) < fixed_length or not envelope.startswith(magic):
+            raise ValueError("Unrecognized ciphertext format")
+        version, wrapped_length = struct.unpack('>BH', envelope[len(magic):fixed_length])
+        if version != ENVELOPE_VERSION:
+            raise ValueError(f"Unsupported envelope version: {version}")
+        offset = fixed_length + wrapped_length
+        wrapped_key = envelope[fixed_length:offset]
+        if len(wrapped_key) != wrapped_length:
+            raise ValueError("Truncated ciphertext")
+        return CryptoUtils._unwrap_data_key(private_key, wrapped_key), offset
+    
+    @staticmethod
+    def _session_data_key(public_key):
+        """Return a cached (data key, envelope header) for a public key, rotating as needed"""
+        cache_key = CryptoUtils._modulus_digest(public_key)
+        now = time.monotonic()
+        with _data_key_lock:
+            entry = _data_keys.get(cache_key)
+            if entry and entry['uses'] < DATA_KEY_MAX_USES and now - entry['created'] < DATA_KEY_MAX_AGE:
+                entry['uses'] += 1
+                _data_keys.move_to_end(cache_key)
+                return entry['key'], entry['header']
+        
+        data_key = AESGCM.generate_key(bit_length=256)
+        with metrics.stage('oaep_encrypt'):
+            wrapped_key = public_key.encrypt(data_key, OAEP_PADDING)
+        header = CryptoUtils._envelope_header(HYBRID_MAGIC, wrapped_key)
+        with _data_key_lock:
+            _data_keys[cache_key] = {'key': data_key, 'header': header, 'uses': 1, 'created': now}
+            _data_keys.move_to_end(cache_key)
+            while len(_data_keys) > DATA_KEY_CACHE_SIZE:
+                _data_keys.popitem(last=False)
+        return data_key, header
+    
+    @staticmethod
+    def _modulus_digest(public_key):
+        """SHA-256 of an RSA public modulus, identifying a key pair in cache keys"""
+        modulus = public_key.public_numbers().n
+        return hashlib.sha256(modulus.to_bytes((modulus.bit_length() + 7) // 8, 'big')).digest()
+    
+    @staticmethod
+    def _unwrap_data_key(private_key, wrapped_key):
+        """RSA-decrypt a wrapped data key, remembering recent ones to skip repeat RSA work
+        
+        Entries are keyed by the private key as well, so a data key unwrapped by one key
+        pair is never handed to a caller holding a different one.
+        """
+        cache_key = (CryptoUtils._modulus_digest(private_key.public_key()), hashlib.sha256(wrapped_key).digest())
+        with _data_key_lock:
+            data_key = _unwrapped_keys.get(cache_key)
+            if data_key is not None:
+                _unwrapped_keys.move_to_end(cache_key)
+                return data_key
+        
+        with metrics.stage('oaep_decrypt'):
+            data_key = private_key.decrypt(wrapped_key, OAEP_PADDING)
+        if len(data_key) != 32:
+            raise ValueError("Invalid data key")
+        with _data_key_lock:
+            _unwrapped_keys[cache_key] = data_key
+            while len(_unwrapped_keys) > UNWRAPPED_KEY_CACHE_SIZE:
+                _unwrapped_keys.popitem(last=False)
+        return data_key
+    
+    @staticmethod
+    def _stream_nonce(prefix, counter, final):
+        """Per-frame nonce: random prefix, frame counter and a last-frame flag"""
+        return prefix + struct.pack('>IB', counter, 1 if final else 0)
+    
+    @staticmethod
+    def _read_exact(source, size):
+        """Read exactly size bytes or fail on a truncated stream"""
+        data = source.read(size)
+        if len(data) != size:
+            raise ValueError("Truncated ciphertext")
+        return data
+    
+    @staticmethod
+    def _read_frame(source):
+        """Read one length-prefixed frame, or None at end of stream"""
+        length_bytes = source.read(4)
+        if not length_bytes:
+            return None
+        if len(length_bytes) != 4:
+            raise ValueError("Truncated ciphertext")
+        (length,) = struct.unpack('>I', length_bytes)
+        if length > STREAM_MAX_CHUNK_SIZE + GCM_TAG_SIZE:
+            raise ValueError("Invalid frame length")
+        return CryptoUtils._read_exact(source, length)
+    
     @staticmethod
     def generate_md5_hash(message):
         """Generate MD5 hash of message"""
@@ -87,3 +344,70 @@ class CryptoUtils:
         """Verify MD5 hash"""
         actual_hash = CryptoUtils.generate_md5_hash(message)
         return actual_hash == expected_hash
+
+
+def key_material_digest(material):
+    """SHA-256 of a PEM (str) or DER (bytes) key, for cache keys"""
+    return hashlib.sha256(material.encode('utf-8') if isinstance(material, str) else material).digest()
+
+
+class ParsedKeyCache:
+    """Process-local LRU of parsed RSA keys, keyed by user id and a digest of the key material"""
+    
+    def __init__(self, maxsize=PARSED_KEY_CACHE_SIZE):
+        self._cache = LRUCache(maxsize)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def public_key(self, user):
+        """Parsed public key for a user"""
+        return self._get(user, 'public', user.public_key_material, CryptoUtils.load_public_key)
+    
+    def private_key(self, user):
+        """Parsed private key for a user"""
+        return self._get(user, 'private', user.private_key_material, CryptoUtils.load_private_key)
+    
+    def invalidate(self, user_id):
+        """Forget both keys of a user"""
+        self._cache.pop((user_id, 'public'))
+        self._cache.pop((user_id, 'private'))
+    
+    def clear(self):
+        self._cache.clear()
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+    
+    def stats(self):
+        """Return hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'size': len(self._cache),
+                'maxsize': self._cache.maxsize,
+            }
+    
+    def _get(self, user, kind, material, loader):
+        if not material:
+            raise ValueError(f"User has no RSA {kind} key")
+        
+        # A changed updated_at or key material (including a PEM to DER migration) makes the cached entry stale
+        version = (user.updated_at, key_material_digest(material))
+        entry = self._cache.get((user.id, kind))
+        if entry is not None and entry[0] == version:
+            with self._lock:
+                self.hits += 1
+            return entry[1]
+        
+        with self._lock:
+            self.misses += 1
+        key = loader(material)
+        self._cache.set((user.id, kind), (version, key))
+        return key
+
+
+key_cache = ParsedKeyCache()
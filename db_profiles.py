@@ -0,0 +1,78 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Engine tuning profiles selectable with DB_PROFILE; 'auto' picks one from the database URL
+PROFILES = ('auto', 'basic', 'sqlite', 'postgres')
+
+# PRAGMAs applied to every new SQLite connection by the sqlite profile
+SQLITE_PRAGMAS = (
+    ('journal_mode', 'WAL'),
+    ('synchronous', 'NORMAL'),
+    ('temp_store', 'MEMORY'),
+)
+
+
+def resolve_profile(profile, database_url):
+    """Concrete profile name for a DB_PROFILE setting and database URL"""
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown database profile: {profile}. Expected one of {', '.join(PROFILES)}")
+    if profile != 'auto':
+        return profile
+    backend = make_url(database_url).get_backend_name()
+    if backend == 'sqlite':
+        return 'sqlite'
+    if backend == 'postgresql':
+        return 'postgres'
+    return 'basic'
+
+
+def engine_options(profile, database_url, settings):
+    """SQLALCHEMY_ENGINE_OPTIONS for a profile; settings is the app config"""
+    profile = resolve_profile(profile, database_url)
+    if profile == 'sqlite':
+        # A local file never drops the connection, so neither pings nor recycling buy anything
+        return {}
+    if profile == 'postgres':
+        return {
+            'pool_size': settings['DB_POOL_SIZE'],
+            'max_overflow': settings['DB_MAX_OVERFLOW'],
+            'pool_timeout': settings['DB_POOL_TIMEOUT'],
+            # Recycle below typical server and proxy idle timeouts instead of pinging on every checkout;
+            # a connection that still dies is detected on first use and the whole pool is invalidated
+            'pool_recycle': settings['DB_POOL_RECYCLE'],
+            'pool_pre_ping': False,
+            # Most recently used first, so idle connections beyond the working set age out
+            'pool_use_lifo': True,
+            'connect_args': {
+                'connect_timeout': 10,
+                'keepalives': 1,
+                'keepalives_idle': 30,
+                'keepalives_interval': 10,
+                'keepalives_count': 3,
+                'options': f"-c statement_timeout={settings['DB_STATEMENT_TIMEOUT_MS']}",
+            },
+        }
+    return {
+        'pool_recycle': 300,
+        'pool_pre_ping': True,
+    }
+
+
+def configure_engine(engine, profile, settings):
+    """Install per-connection hooks for a profile; call before the engine's first connection"""
+    profile = resolve_profile(profile, str(engine.url))
+    if profile == 'sqlite':
+        pragmas = SQLITE_PRAGMAS + (('busy_timeout', settings['SQLITE_BUSY_TIMEOUT_MS']),)
+        event.listen(engine, 'connect', _sqlite_pragma_hook(pragmas))
+    return profile
+
+
+def _sqlite_pragma_hook(pragmas):
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas:
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+    return set_pragmas
@@ -0,0 +1,45 @@
+"""Gunicorn settings for serving with password hashing and RSA work offloaded to process pools.
+
+Usage: gunicorn -c gunicorn.conf.py main:app
+
+Sync workers serve one request at a time, so a burst of logins (each a ~100 ms scrypt
+hash) holds every worker and starves all other routes. Here each worker handles requests
+on threads (gthread) or greenlets (gevent, if installed) and sends the CPU-bound calls to
+its own auth and RSA process pools (cpu_offload.py). Requests only wait for those calls, and
+once a pool has OFFLOAD_*_MAX_PENDING calls waiting, further ones get a 503 with Retry-After.
+
+Every setting below can be overridden from the environment.
+"""
+import os
+
+cpu_count = os.cpu_count() or 1
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', min(cpu_count, 4)))
+# gthread, or gevent; with sync, a request waiting on a pool still holds its whole worker
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+# Concurrent requests per worker: threads for gthread, greenlets for gevent
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 256))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Every process pool is per gunicorn worker, so split the cores between the workers instead of
+# giving each pool cpu_count processes in every worker. Read by app.py, which every worker
+# imports after this file has run
+_offload_workers = max(1, cpu_count // workers)
+for _pool_setting in ('OFFLOAD_AUTH_WORKERS', 'OFFLOAD_RSA_WORKERS', 'CRYPTO_WORKERS', 'STEGO_BATCH_WORKERS'):
+    os.environ.setdefault(_pool_setting, str(_offload_workers))
+# Well below `threads`, so a login burst cannot tie up every thread (or an unbounded number
+# of greenlets) and the other routes keep being served
+os.environ.setdefault('OFFLOAD_AUTH_MAX_PENDING', str(max(1, min(threads // 2, 4 * _offload_workers))))
+os.environ.setdefault('OFFLOAD_RSA_MAX_PENDING', str(max(1, min(threads // 4, 2 * _offload_workers))))
+# Refill the RSA key pool in a process too, so prime search does not hold the worker's GIL
+os.environ.setdefault('RSA_KEY_POOL_EXECUTOR', 'process')
+
+
+def post_worker_init(worker):
+    # Start the pool processes before the first request instead of during the first login
+    import routes
+    routes.auth_pool.start()
+    routes.rsa_pool.start()
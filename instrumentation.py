@@ -0,0 +1,287 @@
+import bisect
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from contextlib import nullcontext
+from flask import Response, abort, g, has_request_context, request
+from sqlalchemy import event
+
+METRIC_PREFIX = 'cryptoapp_'
+
+# Histogram bucket upper bounds in seconds, from sub-millisecond PEM parsing to multi-second keygen
+DURATION_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+PROFILE_HEADER = 'X-Profile'
+
+# Shared no-op context returned by stage() while instrumentation is disabled
+_DISABLED_STAGE = nullcontext()
+
+class _Histogram:
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+    
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class _StageTimer:
+    __slots__ = ('metrics', 'stage', 'start')
+    
+    def __init__(self, metrics, stage):
+        self.metrics = metrics
+        self.stage = stage
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed = time.perf_counter() - self.start
+        self.metrics.observe('stage_duration_seconds', elapsed, stage=self.stage)
+        if has_request_context():
+            # Per-request breakdown, reported in the Server-Timing header
+            stages = g.setdefault('stage_seconds', defaultdict(float))
+            stages[self.stage] += elapsed
+        return False
+
+class Metrics:
+    """Process-local counters and histograms rendered in the Prometheus text format"""
+    
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._gauges = {}
+        self._help = {}
+    
+    def stage(self, name):
+        """Context manager timing one stage of a hot path"""
+        if not self.enabled:
+            return _DISABLED_STAGE
+        return _StageTimer(self, name)
+    
+    def inc(self, name, amount=1, **labels):
+        """Add to a counter"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+    
+    def observe(self, name, value, buckets=DURATION_BUCKETS, **labels):
+        """Record a value in a histogram"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(buckets)
+            histogram.observe(value)
+    
+    def register_gauge(self, name, func, help_text=None, **labels):
+        """Report func() as a gauge each time the metrics are rendered"""
+        self._gauges[(name, tuple(sorted(labels.items())))] = func
+        if help_text:
+            self._help[name] = help_text
+    
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+    
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+    
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(
+                (key, (list(h.buckets), list(h.counts), h.sum, h.count)) for key, h in self._histograms.items()
+            )
+        gauges = []
+        for key, func in sorted(self._gauges.items()):
+            try:
+                gauges.append((key, float(func())))
+            except Exception:
+                continue
+        
+        lines = []
+        declared = set()
+        
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {METRIC_PREFIX}{name} {self._help[name]}")
+                lines.append(f"# TYPE {METRIC_PREFIX}{name} {kind}")
+        
+        for (name, labels), value in counters:
+            declare(name, 'counter')
+            lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            declare(name, 'gauge')
+            lines.append(f"{METRIC_PREFIX}{name}{_format_labels(labels)} {value}")
+        for (name, labels), (buckets, counts, total, count) in histograms:
+            declare(name, 'histogram')
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ['+Inf'], counts):
+                cumulative += bucket_count
+                lines.append(f"{METRIC_PREFIX}{name}_bucket{_format_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{METRIC_PREFIX}{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{METRIC_PREFIX}{name}_count{_format_labels(labels)} {count}")
+        return '\n'.join(lines) + '\n'
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape_label(value)}"' for name, value in labels) + '}'
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class StackSampler:
+    """Samples one thread's Python stack at a fixed interval into folded-stack counts"""
+    
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+    
+    def start(self):
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """Stop sampling and return the collected samples"""
+        if not self._stop.is_set():
+            self._stop.set()
+            self._thread.join()
+        return self.samples
+    
+    def folded(self):
+        """Samples in the folded format read by flamegraph.pl and speedscope"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[';'.join(reversed(stack))] += 1
+
+metrics = Metrics(enabled=os.environ.get('METRICS_ENABLED', '1').lower() in ('1', 'true', 'yes'))
+
+def init_app(app, engine, session):
+    """Install request hooks, SQL query counting, commit timing and the /metrics endpoint"""
+    metrics.enabled = app.config['METRICS_ENABLED']
+    metrics.describe('stage_duration_seconds', 'Time spent in one stage of a hot path')
+    metrics.describe('request_duration_seconds', 'Request latency by endpoint')
+    metrics.describe('request_sql_queries', 'SQL statements executed per request')
+    
+    # Per-endpoint counts and latencies are not for everyone, so there is no /metrics without a
+    # token. With one it is served even when disabled, so scrapers see an empty page rather than a 404
+    @app.route('/metrics')
+    def prometheus_metrics():
+        token = app.config['METRICS_TOKEN']
+        if not token:
+            abort(404)
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+            abort(401)
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+    
+    profiling = app.config['PROFILE_ALLOW_HEADER'] or app.config['PROFILE_SAMPLE_RATE'] > 0
+    if not metrics.enabled and not profiling:
+        # Nothing to record: leave the request path and the engine untouched
+        return
+    if metrics.enabled:
+        event.listen(engine, 'before_cursor_execute', _count_query)
+        event.listen(session, 'before_commit', _start_commit_timer)
+        event.listen(session, 'after_commit', _stop_commit_timer)
+        event.listen(session, 'after_rollback', _discard_commit_timer)
+    
+    @app.before_request
+    def _start_request_instrumentation():
+        g.request_started = time.perf_counter()
+        g.sql_queries = 0
+        if profiling and _should_profile(app):
+            g.stack_sampler = StackSampler(threading.get_ident(), app.config['PROFILE_INTERVAL_MS'] / 1000).start()
+    
+    @app.after_request
+    def _finish_request_instrumentation(response):
+        started = g.pop('request_started', None)
+        endpoint = request.endpoint or 'unmatched'
+        if metrics.enabled and started is not None:
+            elapsed = time.perf_counter() - started
+            metrics.observe('request_duration_seconds', elapsed, endpoint=endpoint, method=request.method)
+            metrics.observe('request_sql_queries', g.get('sql_queries', 0), QUERY_COUNT_BUCKETS, endpoint=endpoint)
+            metrics.inc('requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+            stages = g.get('stage_seconds')
+            if stages:
+                response.headers['Server-Timing'] = ', '.join(
+                    f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in stages.items()
+                )
+        
+        sampler = g.pop('stack_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+            response.headers['X-Profile-File'] = _write_profile(app.config['PROFILE_DIR'], endpoint, sampler)
+        return response
+    
+    @app.teardown_request
+    def _stop_stack_sampler(exc):
+        # after_request does not run for unhandled errors, so never leave a sampler thread behind
+        sampler = g.pop('stack_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+
+def _count_query(conn, cursor, statement, parameters, context, executemany):
+    metrics.inc('sql_queries_total')
+    if has_request_context():
+        g.sql_queries = g.get('sql_queries', 0) + 1
+
+def _start_commit_timer(session):
+    session.info['commit_timer'] = metrics.stage('db_commit').__enter__()
+
+def _stop_commit_timer(session):
+    timer = session.info.pop('commit_timer', None)
+    if timer is not None:
+        timer.__exit__(None, None, None)
+
+def _discard_commit_timer(session):
+    session.info.pop('commit_timer', None)
+
+def _should_profile(app):
+    if app.config['PROFILE_ALLOW_HEADER'] and request.headers.get(PROFILE_HEADER) == '1':
+        return True
+    rate = app.config['PROFILE_SAMPLE_RATE']
+    return rate > 0 and random.random() < rate
+
+def _write_profile(directory, endpoint, sampler):
+    """Save a request's folded stacks, returning the file name"""
+    os.makedirs(directory, exist_ok=True)
+    filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{uuid.uuid4().hex[:8]}.folded"
+    with open(os.path.join(directory, filename), 'w') as f:
+        f.write(sampler.folded())
+    return filename
@@ -0,0 +1,162 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Finished jobs are purged after this many seconds
+JOB_RETENTION_SECONDS = 24 * 60 * 60
+# Purge old jobs once every this many submissions
+PURGE_EVERY = 100
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no free slot"""
+
+class JobQueue:
+    """Bounded local worker pool for slow operations, with job state in a SQLite file"""
+    
+    def __init__(self, db_path, workers=2, max_pending=16):
+        self.db_path = db_path
+        self.workers = workers
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._submitted = 0
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._init_db()
+    
+    def submit(self, user_id, kind, func, *args):
+        """Queue func(*args) and return the new job id, or raise QueueFullError"""
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Job queue is full, try again shortly")
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+            purge = self._submitted % PURGE_EVERY == 0
+        
+        job_id = uuid.uuid4().hex
+        try:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT INTO jobs (id, user_id, kind, status, pid, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                    (job_id, user_id, kind, os.getpid(), time.time())
+                )
+            self._get_executor().submit(self._run, job_id, func, args)
+        except Exception:
+            self._release_slot()
+            raise
+        if purge:
+            self.purge()
+        return job_id
+    
+    def get(self, job_id):
+        """Return a job as a dict, or None if it does not exist"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        
+        job = dict(row)
+        if job['status'] in ('queued', 'running') and not self._pid_alive(job['pid']):
+            # The worker process that owned the job is gone, so it will never finish
+            self._finish(job_id, 'failed', error='Worker exited before the job finished')
+            return self.get(job_id)
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+    
+    def depth(self):
+        """Number of queued and running jobs in this process"""
+        return self._pending
+    
+    def purge(self, older_than=JOB_RETENTION_SECONDS):
+        """Delete finished jobs older than the given number of seconds"""
+        with self._connect() as conn:
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('finished', 'failed') AND finished_at < ?",
+                (time.time() - older_than,)
+            )
+    
+    def _run(self, job_id, func, args):
+        try:
+            with self._connect() as conn:
+                conn.execute("UPDATE jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), job_id))
+            result = func(*args)
+            self._finish(job_id, 'finished', result=result)
+        except Exception as e:
+            logger.exception("Job %s failed", job_id)
+            self._finish(job_id, 'failed', error=str(e))
+        finally:
+            self._release_slot()
+    
+    def _finish(self, job_id, status, result=None, error=None):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id)
+            )
+    
+    def _release_slot(self):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+    
+    def _get_executor(self):
+        # Threads do not survive a fork, so each gunicorn worker starts its own pool
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+                self._pid = os.getpid()
+            return self._executor
+    
+    @contextmanager
+    def _connect(self):
+        """Short-lived connection that commits on success and always closes"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+    
+    def _init_db(self):
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    user_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    pid INTEGER,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_jobs_finished_at ON jobs (finished_at)")
+    
+    @staticmethod
+    def _pid_alive(pid):
+        if pid is None or pid == os.getpid():
+            return True
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
@@ -0,0 +1,140 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from process_pool import ProcessPool
+
+logger = logging.getLogger(__name__)
+
+# Number of recent key generations used to compute the refill rate
+RATE_WINDOW = 32
+
+class RSAKeyPool:
+    """Keeps pre-generated RSA key pairs ready so registration does not wait on prime search"""
+    
+    def __init__(self, target_size=4, workers=1, executor='thread'):
+        if executor not in ('thread', 'process'):
+            raise ValueError(f"Unknown key pool executor: {executor}")
+        self.target_size = target_size
+        self.workers = max(1, workers)
+        self.executor_kind = executor
+        
+        self._keys = deque()
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._thread = None
+        self._stopped = False
+        
+        self._generated = 0
+        self._served_from_pool = 0
+        self._inline_fallbacks = 0
+        self._generation_times = deque(maxlen=RATE_WINDOW)
+        self._last_generation_seconds = None
+    
+    @property
+    def enabled(self):
+        return self.target_size > 0
+    
+    def ensure_started(self):
+        """Start the refill thread once per process (safe to call on every request)"""
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A forked worker inherits the deque but not the parent's threads
+            self._keys.clear()
+            self._pid = os.getpid()
+            self._stopped = False
+            self._thread = threading.Thread(target=self._refill_loop, name='rsa-key-pool', daemon=True)
+            self._thread.start()
+    
+    def get_keypair(self, generate=None):
+        """Return (private_der, public_der), from the pool when possible
+        
+        When the pool is empty the pair comes from generate(), or is generated on this thread.
+        """
+        self.ensure_started()
+        try:
+            keypair = self._keys.popleft()
+        except IndexError:
+            keypair = None
+        
+        if keypair is not None:
+            with self._lock:
+                self._served_from_pool += 1
+            self._wakeup.set()
+            return keypair
+        
+        # Pool is empty (or disabled): generate inline like before
+        with self._lock:
+            self._inline_fallbacks += 1
+        self._wakeup.set()
+        if generate is not None:
+            return generate()
+        from crypto_utils import CryptoUtils
+        return CryptoUtils.generate_rsa_keys('der')
+    
+    def stop(self):
+        """Stop refilling; keys already in the pool are kept"""
+        self._stopped = True
+        self._wakeup.set()
+    
+    def stats(self):
+        """Pool depth, refill rate and counters"""
+        with self._lock:
+            times = list(self._generation_times)
+            rate = None
+            if len(times) > 1 and times[-1] > times[0]:
+                rate = (len(times) - 1) / (times[-1] - times[0])
+            return {
+                'enabled': self.enabled,
+                'depth': len(self._keys),
+                'target_size': self.target_size,
+                'workers': self.workers,
+                'executor': self.executor_kind,
+                'generated': self._generated,
+                'served_from_pool': self._served_from_pool,
+                'inline_fallbacks': self._inline_fallbacks,
+                'refill_rate_per_second': rate,
+                'last_generation_seconds': self._last_generation_seconds,
+            }
+    
+    def _refill_loop(self):
+        # Imported here, off the request path, so workers boot without the RSA backend
+        from crypto_utils import CryptoUtils
+        # A process pool never forks from this background thread of a multithreaded worker
+        executor = ProcessPool(self.workers) if self.executor_kind == 'process' else ThreadPoolExecutor(self.workers)
+        try:
+            pending = {}
+            while not self._stopped:
+                # Keep enough generations in flight to reach the target depth
+                missing = self.target_size - len(self._keys) - len(pending)
+                for _ in range(min(missing, self.workers - len(pending))):
+                    pending[executor.submit(CryptoUtils.generate_rsa_keys, 'der')] = time.monotonic()
+                
+                if not pending:
+                    self._wakeup.wait()
+                    self._wakeup.clear()
+                    continue
+                
+                done, _ = wait(pending, timeout=1.0, return_when=FIRST_COMPLETED)
+                for future in done:
+                    started = pending.pop(future)
+                    try:
+                        keypair = future.result()
+                    except Exception:
+                        logger.exception("RSA key pool generation failed")
+                        time.sleep(1.0)
+                        continue
+                    self._keys.append(keypair)
+                    finished = time.monotonic()
+                    with self._lock:
+                        self._generated += 1
+                        self._generation_times.append(finished)
+                        self._last_generation_seconds = finished - started
+        finally:
+            executor.shutdown()
@@ -0,0 +1,124 @@
+import base64
+import binascii
+import logging
+import time
+from cryptography.exceptions import UnsupportedAlgorithm
+from cryptography.hazmat.primitives import serialization
+from sqlalchemy import LargeBinary, bindparam, inspect, text
+from models import pem_to_der
+
+logger = logging.getLogger(__name__)
+
+# Columns added after the first release: (table, column, DDL type clause or SQLAlchemy type).
+# db.create_all() only creates missing tables, so existing databases get these here.
+ADDED_COLUMNS = [
+    ('steganography_operations', 'original_blob', 'VARCHAR(64) REFERENCES blobs (sha256)'),
+    ('steganography_operations', 'modified_blob', 'VARCHAR(64) REFERENCES blobs (sha256)'),
+    ('messages', 'ciphertext', LargeBinary()),
+    ('users', 'rsa_private_key_der', LargeBinary()),
+    ('users', 'rsa_public_key_der', LargeBinary()),
+]
+
+def _ciphertext_bytes(encrypted_message):
+    return base64.b64decode(encrypted_message, validate=True)
+
+def _private_key_der(pem):
+    # The PEM text is cleared once converted, so only a DER that parses may replace it
+    der = pem_to_der(pem)
+    serialization.load_der_private_key(der, password=None)
+    return der
+
+def _public_key_der(pem):
+    der = pem_to_der(pem)
+    serialization.load_der_public_key(der)
+    return der
+
+# Text columns moved into binary ones by convert_crypto_storage():
+# (table, text column, binary column, decoder, value left in the text column)
+CRYPTO_STORAGE_CONVERSIONS = [
+    ('messages', 'encrypted_message', 'ciphertext', _ciphertext_bytes, ''),
+    ('users', 'rsa_private_key', 'rsa_private_key_der', _private_key_der, None),
+    ('users', 'rsa_public_key', 'rsa_public_key_der', _public_key_der, None),
+]
+
+# Indexes added after the first release: (name, table, column list)
+ADDED_INDEXES = [
+    ('ix_messages_user_id_created_at', 'messages', 'user_id, created_at DESC, id DESC'),
+    ('ix_steganography_operations_user_id_created_at', 'steganography_operations', 'user_id, created_at DESC, id DESC'),
+]
+
+def upgrade(engine):
+    """Bring an existing database up to the current schema; safe to run repeatedly"""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table, column, ddl in ADDED_COLUMNS:
+            if table not in tables:
+                continue
+            existing = {c['name'] for c in inspector.get_columns(table)}
+            if column not in existing:
+                if not isinstance(ddl, str):
+                    ddl = ddl.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+                logger.info("Added column %s.%s", table, column)
+    
+    _create_missing_indexes(engine)
+
+def _create_missing_indexes(engine):
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    for name, table, columns in ADDED_INDEXES:
+        if table not in tables or name in {i['name'] for i in inspector.get_indexes(table)}:
+            continue
+        if engine.dialect.name == 'postgresql':
+            # Build without blocking writers; CONCURRENTLY cannot run inside a transaction
+            with engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+                conn.execute(text(f'CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON {table} ({columns})'))
+        else:
+            with engine.begin() as conn:
+                conn.execute(text(f'CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})'))
+        logger.info("Created index %s", name)
+
+def convert_crypto_storage(engine, batch_size=1000, pause=0.0):
+    """Move base64 ciphertexts and PEM keys into the binary columns, one short transaction per batch
+    
+    Only rows whose binary column is still NULL are read, so the conversion can be stopped and
+    re-run at any point while the app keeps serving; reads accept both formats meanwhile.
+    Returns {'table.column': (converted, unreadable)}.
+    """
+    summary = {}
+    for table, text_column, binary_column, decode, cleared in CRYPTO_STORAGE_CONVERSIONS:
+        select_batch = text(
+            f"SELECT id, {text_column} FROM {table} "
+            f"WHERE id > :last_id AND {binary_column} IS NULL AND {text_column} IS NOT NULL AND {text_column} != '' "
+            f"ORDER BY id LIMIT :limit"
+        )
+        # Matching the old text as well leaves a row alone if it was rewritten since the SELECT
+        update_row = text(
+            f"UPDATE {table} SET {binary_column} = :value, {text_column} = :cleared "
+            f"WHERE id = :id AND {binary_column} IS NULL AND {text_column} = :original"
+        ).bindparams(bindparam('value', type_=LargeBinary))
+        
+        converted = unreadable = 0
+        last_id = 0
+        while True:
+            with engine.begin() as conn:
+                rows = conn.execute(select_batch, {'last_id': last_id, 'limit': batch_size}).all()
+                if not rows:
+                    break
+                updates = []
+                for row_id, value in rows:
+                    try:
+                        updates.append({'id': row_id, 'value': decode(value), 'cleared': cleared, 'original': value})
+                    except (ValueError, binascii.Error, UnsupportedAlgorithm) as e:
+                        unreadable += 1
+                        logger.warning("Left %s.%s of row %s as text: %s", table, text_column, row_id, e)
+                if updates:
+                    conn.execute(update_row, updates)
+            converted += len(updates)
+            last_id = rows[-1][0]
+            logger.info("Converted %d %s.%s rows (up to id %s)", converted, table, text_column, last_id)
+            if pause:
+                time.sleep(pause)
+        summary[f'{table}.{text_column}'] = (converted, unreadable)
+    return summary
@@ -1,19 +1,52 @@
+import base64
+from collections import Counter
 from datetime import datetime
+from flask import current_app
 from flask_login import UserMixin
+from sqlalchemy import event, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import undefer
 from werkzeug.security import generate_password_hash, check_password_hash
 from app import db
 
+# PEM labels of the PKCS#8 private and SubjectPublicKeyInfo public keys the app generates
+PRIVATE_KEY_LABEL = 'PRIVATE KEY'
+PUBLIC_KEY_LABEL = 'PUBLIC KEY'
+
+def _binary_storage():
+    # CRYPTO_STORAGE only decides how new values are written; reads accept both formats
+    return current_app.config['CRYPTO_STORAGE'] == 'binary'
+
+def der_to_pem(der, label):
+    """PEM text of a DER key, as the cryptography library would write it"""
+    encoded = base64.b64encode(der).decode('ascii')
+    lines = [encoded[i:i + 64] for i in range(0, len(encoded), 64)]
+    return f"-----BEGIN {label}-----\n" + '\n'.join(lines) + f"\n-----END {label}-----\n"
+
+def pem_to_der(pem):
+    """DER bytes of a single-key PEM text, without parsing the key; binascii.Error if it is not valid base64"""
+    body = ''.join(line.strip() for line in pem.splitlines() if not line.startswith('-----'))
+    return base64.b64decode(body, validate=True)
+
+def _row_version(updated_at):
+    # A string, so it can be stored in the signed session cookie as is
+    return updated_at.isoformat() if updated_at else ''
+
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
     
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(256), nullable=False)
+    # Large or sensitive columns are deferred and only loaded by the routes that need them
+    password_hash = db.deferred(db.Column(db.String(256), nullable=False), group='credentials')
     
-    # RSA key storage
-    rsa_private_key = db.Column(db.Text, nullable=True)
-    rsa_public_key = db.Column(db.Text, nullable=True)
+    # RSA key storage: DER in binary storage, PEM in text storage and in rows not converted yet
+    rsa_private_key = db.deferred(db.Column(db.Text, nullable=True), group='rsa_keys')
+    rsa_public_key = db.deferred(db.Column(db.Text, nullable=True), group='rsa_keys')
+    rsa_private_key_der = db.deferred(db.Column(db.LargeBinary, nullable=True), group='rsa_keys')
+    rsa_public_key_der = db.deferred(db.Column(db.LargeBinary, nullable=True), group='rsa_keys')
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -30,24 +63,106 @@ class User(UserMixin, db.Model):
         """Check password against hash"""
         return check_password_hash(self.password_hash, password)
     
+    def set_rsa_keys(self, private_der, public_der):
+        """Store a DER key pair in the configured crypto storage format"""
+        if _binary_storage():
+            self.rsa_private_key_der, self.rsa_public_key_der = private_der, public_der
+            self.rsa_private_key = self.rsa_public_key = None
+        else:
+            self.rsa_private_key = der_to_pem(private_der, PRIVATE_KEY_LABEL)
+            self.rsa_public_key = der_to_pem(public_der, PUBLIC_KEY_LABEL)
+            self.rsa_private_key_der = self.rsa_public_key_der = None
+    
+    @property
+    def public_key_material(self):
+        """DER public key, or PEM text for a row in text storage"""
+        return self.rsa_public_key_der if self.rsa_public_key_der is not None else self.rsa_public_key
+    
+    @property
+    def private_key_material(self):
+        """DER private key, or PEM text for a row in text storage"""
+        return self.rsa_private_key_der if self.rsa_private_key_der is not None else self.rsa_private_key
+    
+    @property
+    def version(self):
+        """Row version for caches, bumped by every update through updated_at"""
+        return _row_version(self.updated_at)
+    
+    @classmethod
+    def with_password_hash(cls, username):
+        """Look up a user by name with the password hash loaded in the same SELECT"""
+        return cls.query.options(undefer(cls.password_hash)).filter_by(username=username).first()
+    
+    @classmethod
+    def with_public_key(cls, user_id):
+        """Load a user with the public key in the same SELECT"""
+        return cls.query.options(undefer(cls.rsa_public_key), undefer(cls.rsa_public_key_der)).filter_by(id=user_id).first()
+    
+    @classmethod
+    def with_private_key(cls, user_id):
+        """Load a user with the private key in the same SELECT"""
+        return cls.query.options(undefer(cls.rsa_private_key), undefer(cls.rsa_private_key_der)).filter_by(id=user_id).first()
+    
     def __repr__(self):
         return f'<User {self.username}>'
 
+class SessionUser(UserMixin):
+    """Detached projection of a User with only the columns every request needs"""
+    
+    def __init__(self, id, username, email, updated_at):
+        self.id = id
+        self.username = username
+        self.email = email
+        self.updated_at = updated_at
+    
+    @property
+    def version(self):
+        return _row_version(self.updated_at)
+    
+    @classmethod
+    def load(cls, user_id):
+        """Fetch the projection for a user id, or None if the user does not exist"""
+        row = db.session.query(User.id, User.username, User.email, User.updated_at).filter(User.id == user_id).first()
+        return cls(*row) if row else None
+    
+    def __repr__(self):
+        return f'<SessionUser {self.username}>'
+
 class Message(db.Model):
     __tablename__ = 'messages'
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     
-    original_message = db.Column(db.Text, nullable=False)
-    encrypted_message = db.Column(db.Text, nullable=False)
+    original_message = db.deferred(db.Column(db.Text, nullable=False), group='message_text')
+    # Raw bytes in binary storage. encrypted_message holds base64 in text storage and in rows not
+    # converted yet, '' otherwise; it stays NOT NULL so existing databases need no constraint change
+    encrypted_message = db.deferred(db.Column(db.Text, nullable=False, default=''), group='message_text')
+    ciphertext = db.deferred(db.Column(db.LargeBinary, nullable=True), group='message_text')
     md5_hash = db.Column(db.String(32), nullable=False)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    @property
+    def ciphertext_base64(self):
+        """The ciphertext as shown in pages and JSON"""
+        if self.ciphertext is not None:
+            return base64.b64encode(self.ciphertext).decode('ascii')
+        return self.encrypted_message
+    
+    @staticmethod
+    def ciphertext_columns(ciphertext):
+        """Column values for a raw ciphertext in the configured crypto storage format"""
+        if _binary_storage():
+            return {'ciphertext': ciphertext, 'encrypted_message': ''}
+        return {'ciphertext': None, 'encrypted_message': base64.b64encode(ciphertext).decode('ascii')}
+    
     def __repr__(self):
         return f'<Message {self.id}>'
 
+# Serves per-user history newest first, including keyset pagination on (created_at, id)
+db.Index('ix_messages_user_id_created_at', Message.user_id, Message.created_at.desc(), Message.id.desc())
+
 class SteganographyOperation(db.Model):
     __tablename__ = 'steganography_operations'
     
@@ -56,10 +171,82 @@ class SteganographyOperation(db.Model):
     
     original_filename = db.Column(db.String(255), nullable=False)
     modified_filename = db.Column(db.String(255), nullable=False)
-    secret_message = db.Column(db.Text, nullable=False)
-    secret_key = db.Column(db.String(255), nullable=False)
+    secret_message = db.deferred(db.Column(db.Text, nullable=False), group='secrets')
+    secret_key = db.deferred(db.Column(db.String(255), nullable=False), group='secrets')
+    
+    # Content-addressed blobs (SHA-256) for the carrier and the stego output
+    original_blob = db.Column(db.String(64), db.ForeignKey('blobs.sha256'), nullable=True)
+    modified_blob = db.Column(db.String(64), db.ForeignKey('blobs.sha256'), nullable=True)
     
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    def blob_digests(self):
+        """Blob digests referenced by this operation"""
+        return [digest for digest in (self.original_blob, self.modified_blob) if digest]
+    
     def __repr__(self):
         return f'<SteganographyOperation {self.id}>'
+
+db.Index(
+    'ix_steganography_operations_user_id_created_at',
+    SteganographyOperation.user_id,
+    SteganographyOperation.created_at.desc(),
+    SteganographyOperation.id.desc()
+)
+
+class Blob(db.Model):
+    __tablename__ = 'blobs'
+    
+    sha256 = db.Column(db.String(64), primary_key=True)
+    ref_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<Blob {self.sha256[:12]}>'
+
+def _adjust_blob_refs(connection, digests, delta):
+    """Atomically add delta to the reference count of each blob, creating rows as needed"""
+    for digest in digests:
+        if delta > 0:
+            dialect_insert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+            statement = dialect_insert(Blob.__table__).values(
+                sha256=digest, ref_count=delta, created_at=datetime.utcnow()
+            ).on_conflict_do_update(
+                index_elements=['sha256'],
+                set_={'ref_count': Blob.__table__.c.ref_count + delta}
+            )
+        else:
+            statement = update(Blob.__table__).where(Blob.__table__.c.sha256 == digest).values(
+                ref_count=Blob.__table__.c.ref_count + delta
+            )
+        connection.execute(statement)
+
+def add_blob_references(connection, digests):
+    """One reference per occurrence of each digest, for operations inserted in bulk
+    
+    Bulk INSERTs skip the before_insert hook below, so their callers count references
+    here instead, in one executemany upsert and before the rows that point at them.
+    """
+    counts = Counter(digests)
+    if not counts:
+        return
+    dialect_insert = pg_insert if connection.dialect.name == 'postgresql' else sqlite_insert
+    statement = dialect_insert(Blob.__table__)
+    statement = statement.on_conflict_do_update(
+        index_elements=['sha256'],
+        set_={'ref_count': Blob.__table__.c.ref_count + statement.excluded.ref_count}
+    )
+    now = datetime.utcnow()
+    connection.execute(statement, [
+        {'sha256': digest, 'ref_count': count, 'created_at': now} for digest, count in counts.items()
+    ])
+
+@event.listens_for(SteganographyOperation, 'before_insert')
+def _reference_blobs(mapper, connection, target):
+    # Runs in the same transaction as the INSERT, before the foreign keys are checked
+    _adjust_blob_refs(connection, target.blob_digests(), 1)
+
+@event.listens_for(SteganographyOperation, 'after_delete')
+def _release_blobs(mapper, connection, target):
+    _adjust_blob_refs(connection, target.blob_digests(), -1)
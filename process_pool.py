@@ -0,0 +1,56 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class ProcessPool:
+    """A ProcessPoolExecutor built on first use in each process
+    
+    Pools do not survive a fork, so each gunicorn worker builds its own. Its processes are
+    started by a fork server (or spawned where there is none), never forked from a worker
+    that may already be running threads. A pool process that dies (out of memory, a crash)
+    breaks the executor and fails every call it was running; the next submit replaces it.
+    """
+    
+    def __init__(self, workers):
+        self.workers = workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+    
+    def submit(self, func, *args):
+        """Submit a call, first replacing the executor if a dead process has broken it"""
+        executor = self.executor()
+        try:
+            return executor.submit(func, *args)
+        except BrokenProcessPool:
+            self._discard(executor)
+            return self.executor().submit(func, *args)
+    
+    def executor(self):
+        """This process's executor, started on first use"""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                methods = multiprocessing.get_all_start_methods()
+                context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+                self._pid = os.getpid()
+            return self._executor
+    
+    def shutdown(self):
+        """Stop this process's executor without waiting, cancelling queued calls"""
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pid = None
+    
+    def _discard(self, executor):
+        with self._lock:
+            # Another thread may already have replaced it
+            if self._executor is executor:
+                self._executor = None
+                self._pid = None
+        executor.shutdown(wait=False, cancel_futures=True)
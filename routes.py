@@ -1,28 +1,220 @@
 import os
-from flask import render_template, request, redirect, url_for, flash, session, jsonify, send_from_directory
+import base64
+import io
+import binascii
+import json
+import shutil
+import tempfile
+import zipfile
+import math
+import time
+import mimetypes
+import sys
+import click
+from collections import namedtuple
+from contextlib import ExitStack
+from datetime import datetime
+from flask import render_template, request, redirect, url_for, flash, session, jsonify, make_response, send_file, send_from_directory, abort, stream_with_context
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from werkzeug.utils import secure_filename
 from app import app, db
-from models import User, Message, SteganographyOperation
-from crypto_utils import CryptoUtils
-from steganography import SteganographyUtils
+from models import User, SessionUser, Message, SteganographyOperation, Blob, add_blob_references
+from key_pool import RSAKeyPool
+from batch_crypto import BatchCryptoExecutor
+from cpu_offload import CPUOffloadPool, OffloadBusyError, check_password, decrypt_message, generate_keypair, hash_password
+from batch_stego import BatchStegoExecutor, StreamingZip, extract_image, hide_image
+from jobs import JobQueue, QueueFullError
+from blob_store import BlobInUseError, BlobStore
+from cache_utils import FailureLimiter, TTLCache, VersionedTTLCache
+from instrumentation import metrics
+from sqlalchemy import desc, event, func, insert, literal, select, tuple_, union_all
+from sqlalchemy.orm import undefer, undefer_group
 import uuid
 
+# Rows per page in history views and APIs
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+# Lightweight rows for the dashboard's recent activity lists
+MessageSummary = namedtuple('MessageSummary', 'id created_at original_message md5_hash')
+OperationSummary = namedtuple('OperationSummary', 'id created_at original_filename modified_filename')
+
 # Initialize Flask-Login
 login_manager = LoginManager()
 login_manager.init_app(app)
 login_manager.login_view = 'login'
 login_manager.login_message_category = 'info'
 
+# Pre-generated RSA key pairs handed out at registration
+rsa_key_pool = RSAKeyPool(
+    target_size=app.config['RSA_KEY_POOL_SIZE'],
+    workers=app.config['RSA_KEY_POOL_WORKERS'],
+    executor=app.config['RSA_KEY_POOL_EXECUTOR']
+)
+
+# Process pools for the CPU-bound work of single requests: password hashes, and RSA keygen and decryption
+auth_pool = CPUOffloadPool('auth', workers=app.config['OFFLOAD_AUTH_WORKERS'], max_pending=app.config['OFFLOAD_AUTH_MAX_PENDING'])
+rsa_pool = CPUOffloadPool('rsa', workers=app.config['OFFLOAD_RSA_WORKERS'], max_pending=app.config['OFFLOAD_RSA_MAX_PENDING'])
+
+# Process pool for batch RSA work
+batch_executor = BatchCryptoExecutor(workers=app.config['CRYPTO_WORKERS'])
+
+# Process pool for bulk steganography uploads
+stego_batch = BatchStegoExecutor(workers=app.config['STEGO_BATCH_WORKERS'])
+
+# Content-addressed image storage
+blob_store = BlobStore(app.config['BLOB_FOLDER'])
+
+# Short-lived per-user map of downloadable stego filenames
+owned_files_cache = TTLCache(maxsize=app.config['OWNED_FILES_CACHE_SIZE'], ttl=app.config['OWNED_FILES_CACHE_TTL'])
+
+# Logged-in users by id; entries are trusted only while their version matches the session's
+user_cache = VersionedTTLCache(maxsize=app.config['USER_CACHE_SIZE'], ttl=app.config['USER_CACHE_TTL'])
+
+# Session key holding the updated_at version of the logged-in user
+USER_VERSION_SESSION_KEY = '_user_version'
+
+# Failed extractions per user, so guessing secret keys cannot tie up the workers
+extract_limiter = FailureLimiter(
+    limit=app.config['EXTRACT_FAILURE_LIMIT'],
+    window=app.config['EXTRACT_FAILURE_WINDOW'],
+    maxsize=app.config['EXTRACT_LIMITER_SIZE']
+)
+
+# Bounded background pool for steganography jobs
+job_queue = JobQueue(
+    app.config['JOBS_DATABASE'],
+    workers=app.config['JOB_WORKERS'],
+    max_pending=app.config['JOB_QUEUE_SIZE']
+)
+
+def _key_cache_stats():
+    # Crypto modules are imported on first use; until then no key has been parsed
+    crypto_utils = sys.modules.get('crypto_utils')
+    return crypto_utils.key_cache.stats() if crypto_utils else {'hit_rate': 0.0, 'size': 0}
+
+# Cache and queue levels reported on /metrics
+for cache_name, cache_stats in (('user', user_cache.stats), ('owned_files', owned_files_cache.stats), ('parsed_keys', _key_cache_stats)):
+    metrics.register_gauge('cache_hit_ratio', lambda cache_stats=cache_stats: cache_stats()['hit_rate'], cache=cache_name)
+    metrics.register_gauge('cache_entries', lambda cache_stats=cache_stats: cache_stats()['size'], cache=cache_name)
+metrics.register_gauge('rsa_key_pool_depth', lambda: rsa_key_pool.stats()['depth'])
+metrics.register_gauge('job_queue_depth', job_queue.depth)
+for offload_pool in (auth_pool, rsa_pool):
+    metrics.register_gauge('offload_pending', lambda offload_pool=offload_pool: offload_pool.stats()['pending'], pool=offload_pool.name)
+    metrics.register_gauge('offload_rejected', lambda offload_pool=offload_pool: offload_pool.stats()['rejected'], pool=offload_pool.name)
+metrics.register_gauge('extract_limiter_tracked_users', lambda: extract_limiter.stats()['tracked'])
+
+@app.before_request
+def start_key_pool():
+    rsa_key_pool.ensure_started()
+
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    user_id = int(user_id)
+    user = user_cache.get(user_id, session.get(USER_VERSION_SESSION_KEY))
+    if user is not None:
+        return user
+    
+    # Miss or version mismatch: another worker may have updated the row, so ask the database.
+    # Runs on every uncached request, so skip the PEM and password hash columns
+    user = SessionUser.load(user_id)
+    if user is None:
+        user_cache.pop(user_id)
+        return None
+    user_cache.set(user_id, user, user.version)
+    session[USER_VERSION_SESSION_KEY] = user.version
+    return user
+
+@event.listens_for(db.session, 'after_flush')
+def _track_changed_users(session, flush_context):
+    changed = session.info.setdefault('changed_users', set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            changed.add(obj.id)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_cached_users(session):
+    for user_id in session.info.pop('changed_users', ()):
+        user_cache.pop(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_changed_users(session):
+    session.info.pop('changed_users', None)
 
 # Helper function for allowed file extensions
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'bmp'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def _unique_filename(file, prefix=''):
+    """Unique name for an upload; uploads are decoded from memory and never written as-is"""
+    return f"{prefix}{uuid.uuid4()}_{secure_filename(file.filename)}"
+
+def _stego_output_filename(unique_filename):
+    """Download name of a stego output; always lossless PNG/APNG, whatever the upload's format"""
+    from carriers import OUTPUT_EXTENSION
+    return f"stego_{os.path.splitext(unique_filename)[0]}{OUTPUT_EXTENSION}"
+
+def _hide_to_blobs(user_id, upload, unique_filename, message, secret_key):
+    """Store the carrier and the stego output as blobs, returning an unsaved SteganographyOperation"""
+    from carriers import Carrier, OUTPUT_EXTENSION
+    from steganography import SteganographyUtils
+    
+    # A header read is enough to turn away carriers that are too small, before anything is stored
+    SteganographyUtils.check_capacity(Carrier.probe(upload), message)
+    
+    # Deduplicate the carrier, then decode it from the same in-memory stream
+    with metrics.stage('blob_put'):
+        original_blob = blob_store.put_stream(upload)
+    upload.seek(0)
+    
+    output_filename = _stego_output_filename(unique_filename)
+    output_path = blob_store.temp_path(OUTPUT_EXTENSION)
+    try:
+        SteganographyUtils.hide_message_in_image(upload, message, secret_key, output_path)
+        with metrics.stage('blob_put'):
+            modified_blob = blob_store.put_file(output_path)
+    finally:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+    
+    return SteganographyOperation(
+        user_id=user_id,
+        original_filename=unique_filename,
+        modified_filename=output_filename,
+        secret_message=message,
+        secret_key=secret_key,
+        original_blob=original_blob,
+        modified_blob=modified_blob
+    )
+
+def _extract_message(user_id, upload, secret_key):
+    """Extract a message from an upload, counting failures against the user's extraction limit"""
+    from steganography import SteganographyUtils
+    try:
+        return SteganographyUtils.extract_message_from_image(
+            upload, secret_key, text_only=True,
+            legacy_max_pixels=app.config['STEGO_LEGACY_MAX_PIXELS'] or None
+        )
+    except Exception:
+        extract_limiter.record_failure(user_id)
+        metrics.inc('extract_failures_total')
+        raise
+
+def _extract_retry_after(user_id):
+    """Whole seconds the user must wait after too many failed extractions, or 0"""
+    retry_after = extract_limiter.retry_after(user_id)
+    if retry_after:
+        metrics.inc('extract_rate_limited_total')
+    return math.ceil(retry_after)
+
+def _spool_upload(file):
+    """Copy an upload into a private spooled buffer that outlives the request"""
+    spool = tempfile.SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_MAX_SIZE'])
+    shutil.copyfileobj(file.stream, spool)
+    spool.seek(0)
+    return spool
+
 @app.route('/')
 def index():
     """Home page"""
@@ -60,23 +252,21 @@ def register():
             return render_template('register.html')
         
         try:
-            # Generate RSA keys for the user
-            private_key, public_key = CryptoUtils.generate_rsa_keys()
+            # Take a pre-generated RSA key pair (generated in the RSA pool if the key pool is empty)
+            private_key, public_key = rsa_key_pool.get_keypair(generate=lambda: rsa_pool.run(generate_keypair))
             
             # Create new user
-            user = User(
-                username=username,
-                email=email,
-                rsa_private_key=private_key,
-                rsa_public_key=public_key
-            )
-            user.set_password(password)
+            user = User(username=username, email=email)
+            user.set_rsa_keys(private_key, public_key)
+            user.password_hash = auth_pool.run(hash_password, password)
             
             db.session.add(user)
             db.session.commit()
             
             flash('Registration successful! You can now log in.', 'success')
             return redirect(url_for('login'))
+        except OffloadBusyError:
+            raise
         except Exception as e:
             db.session.rollback()
             flash(f'Registration failed: {str(e)}', 'danger')
@@ -94,10 +284,11 @@ def login():
             flash('Username and password are required.', 'danger')
             return render_template('login.html')
         
-        user = User.query.filter_by(username=username).first()
+        user = User.with_password_hash(username)
         
-        if user and user.check_password(password):
+        if user and auth_pool.run(check_password, user.password_hash, password):
             login_user(user)
+            session[USER_VERSION_SESSION_KEY] = user.version
             flash('Login successful!', 'success')
             next_page = request.args.get('next')
             return redirect(next_page) if next_page else redirect(url_for('dashboard'))
@@ -111,6 +302,7 @@ def login():
 def logout():
     """User logout"""
     logout_user()
+    session.pop(USER_VERSION_SESSION_KEY, None)
     flash('You have been logged out.', 'info')
     return redirect(url_for('index'))
 
@@ -118,17 +310,141 @@ def logout():
 @login_required
 def dashboard():
     """User dashboard"""
-    messages = Message.query.filter_by(user_id=current_user.id).order_by(Message.created_at.desc()).limit(5).all()
-    stego_ops = SteganographyOperation.query.filter_by(user_id=current_user.id).order_by(SteganographyOperation.created_at.desc()).limit(5).all()
+    messages, stego_ops = _recent_activity(current_user.id, limit=5)
     
     return render_template('dashboard.html', messages=messages, stego_ops=stego_ops)
 
+def _recent_activity(user_id, limit):
+    """Latest messages and steganography operations of a user, fetched in one UNION ALL round trip"""
+    recent_messages = select(
+        literal('message').label('kind'),
+        Message.id,
+        Message.created_at,
+        # The dashboard shows 50 characters and an ellipsis, so 51 is enough to decide
+        func.substr(Message.original_message, 1, 51).label('text_a'),
+        Message.md5_hash.label('text_b')
+    ).where(Message.user_id == user_id).order_by(Message.created_at.desc(), Message.id.desc()).limit(limit).subquery()
+    recent_ops = select(
+        literal('stego').label('kind'),
+        SteganographyOperation.id,
+        SteganographyOperation.created_at,
+        SteganographyOperation.original_filename.label('text_a'),
+        SteganographyOperation.modified_filename.label('text_b')
+    ).where(SteganographyOperation.user_id == user_id).order_by(
+        SteganographyOperation.created_at.desc(), SteganographyOperation.id.desc()
+    ).limit(limit).subquery()
+    
+    # A UNION ALL keeps no order of its own, so order the merged rows again, newest first
+    feed = union_all(select(recent_messages), select(recent_ops)).order_by(desc('created_at'), desc('id'))
+    rows = db.session.execute(feed.limit(2 * limit)).all()
+    messages = [
+        MessageSummary(row.id, row.created_at, row.text_a, row.text_b)
+        for row in rows if row.kind == 'message'
+    ]
+    stego_ops = [
+        OperationSummary(row.id, row.created_at, row.text_a, row.text_b)
+        for row in rows if row.kind == 'stego'
+    ]
+    return messages, stego_ops
+
+def _encode_cursor(row):
+    """Opaque keyset cursor for the (created_at, id) position of a row"""
+    raw = json.dumps([row.created_at.isoformat(), row.id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    return datetime.fromisoformat(created_at), int(row_id)
+
+def _keyset_page(model, user_id, cursor=None, limit=HISTORY_PAGE_SIZE, options=()):
+    """One page of a user's rows newest first, continuing after the cursor position"""
+    query = model.query.options(*options).filter(model.user_id == user_id)
+    if cursor:
+        created_at, row_id = _decode_cursor(cursor)
+        # Seek past the previous page on the (user_id, created_at, id) index instead of OFFSET
+        query = query.filter(tuple_(model.created_at, model.id) < tuple_(created_at, row_id))
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    next_cursor = _encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def _page_request():
+    """Cursor and page size from the query string, returning (cursor, limit, error response)"""
+    cursor = request.args.get('cursor') or None
+    try:
+        limit = min(max(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 1), HISTORY_MAX_PAGE_SIZE)
+        if cursor:
+            _decode_cursor(cursor)
+    except (ValueError, TypeError, binascii.Error):
+        return None, None, (jsonify({'error': 'Invalid cursor or limit.'}), 400)
+    return cursor, limit, None
+
+@app.route('/history/messages')
+@login_required
+def message_history():
+    """Paginated encrypted message history"""
+    cursor, limit, error = _page_request()
+    if error:
+        abort(400)
+    messages, next_cursor = _keyset_page(Message, current_user.id, cursor, limit, [undefer(Message.original_message)])
+    return render_template('history_messages.html', messages=messages, next_cursor=next_cursor)
+
+@app.route('/history/steganography')
+@login_required
+def steganography_history():
+    """Paginated steganography operation history"""
+    cursor, limit, error = _page_request()
+    if error:
+        abort(400)
+    stego_ops, next_cursor = _keyset_page(SteganographyOperation, current_user.id, cursor, limit)
+    return render_template('history_steganography.html', stego_ops=stego_ops, next_cursor=next_cursor)
+
+@app.route('/api/messages')
+@login_required
+def api_messages():
+    """Encrypted message history as JSON, newest first"""
+    cursor, limit, error = _page_request()
+    if error:
+        return error
+    messages, next_cursor = _keyset_page(Message, current_user.id, cursor, limit, [undefer_group('message_text')])
+    return jsonify({
+        'items': [{
+            'id': message.id,
+            'created_at': message.created_at.isoformat(),
+            'original_message': message.original_message,
+            'encrypted_message': message.ciphertext_base64,
+            'md5_hash': message.md5_hash,
+        } for message in messages],
+        'next_cursor': next_cursor,
+    })
+
+@app.route('/api/steganography-operations')
+@login_required
+def api_steganography_operations():
+    """Steganography operation history as JSON, newest first"""
+    cursor, limit, error = _page_request()
+    if error:
+        return error
+    stego_ops, next_cursor = _keyset_page(SteganographyOperation, current_user.id, cursor, limit)
+    return jsonify({
+        'items': [{
+            'id': op.id,
+            'created_at': op.created_at.isoformat(),
+            'original_filename': op.original_filename,
+            'modified_filename': op.modified_filename,
+            'download_url': url_for('download_file', filename=op.modified_filename),
+        } for op in stego_ops],
+        'next_cursor': next_cursor,
+    })
+
 @app.route('/encrypt', methods=['GET', 'POST'])
 @login_required
 def encrypt():
     """Encrypt message"""
     if request.method == 'POST':
+        from crypto_utils import CryptoUtils, key_cache
         message = request.form['message']
+        mode = request.form.get('mode', 'hybrid')
         
         if not message:
             flash('Message is required.', 'danger')
@@ -136,7 +452,7 @@ def encrypt():
         
         try:
             # Encrypt message using user's public key
-            encrypted_message = CryptoUtils.encrypt_message(message, current_user.rsa_public_key)
+            ciphertext = CryptoUtils.encrypt_message_bytes(message, key_cache.public_key(User.with_public_key(current_user.id)), mode=mode)
             
             # Generate MD5 hash
             md5_hash = CryptoUtils.generate_md5_hash(message)
@@ -145,15 +461,15 @@ def encrypt():
             msg_record = Message(
                 user_id=current_user.id,
                 original_message=message,
-                encrypted_message=encrypted_message,
-                md5_hash=md5_hash
+                md5_hash=md5_hash,
+                **Message.ciphertext_columns(ciphertext)
             )
             db.session.add(msg_record)
             db.session.commit()
             
             flash('Message encrypted successfully!', 'success')
             return render_template('encrypt.html', 
-                                 encrypted_message=encrypted_message, 
+                                 encrypted_message=base64.b64encode(ciphertext).decode('ascii'), 
                                  md5_hash=md5_hash,
                                  original_message=message)
         except Exception as e:
@@ -166,6 +482,7 @@ def encrypt():
 def decrypt():
     """Decrypt message"""
     if request.method == 'POST':
+        from crypto_utils import CryptoUtils, key_cache
         encrypted_message = request.form['encrypted_message']
         expected_hash = request.form.get('expected_hash', '')
         
@@ -174,8 +491,12 @@ def decrypt():
             return render_template('decrypt.html')
         
         try:
-            # Decrypt message using user's private key
-            decrypted_message = CryptoUtils.decrypt_message(encrypted_message, current_user.rsa_private_key)
+            # Decrypt message using user's private key; the RSA pool parses keys in its own per-process cache
+            user = User.with_private_key(current_user.id)
+            if rsa_pool.offloaded:
+                decrypted_message = rsa_pool.run(decrypt_message, user.private_key_material, encrypted_message)
+            else:
+                decrypted_message = CryptoUtils.decrypt_message(encrypted_message, key_cache.private_key(user))
             
             # Verify MD5 hash if provided
             hash_valid = None
@@ -187,6 +508,8 @@ def decrypt():
                                  decrypted_message=decrypted_message,
                                  hash_valid=hash_valid,
                                  encrypted_message=encrypted_message)
+        except OffloadBusyError:
+            raise
         except Exception as e:
             flash(f'Decryption failed: {str(e)}', 'danger')
     
@@ -216,34 +539,17 @@ def steganography():
         
         if file and allowed_file(file.filename):
             try:
-                # Save uploaded file
-                filename = secure_filename(file.filename)
-                unique_filename = f"{uuid.uuid4()}_{filename}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                file.save(filepath)
-                
-                # Create output filename
-                output_filename = f"stego_{unique_filename}"
-                output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-                
-                # Hide message in image
-                SteganographyUtils.hide_message_in_image(filepath, message, secret_key, output_path)
+                # Hide message in image, storing carrier and result in the blob store
+                stego_op = _hide_to_blobs(current_user.id, file.stream, _unique_filename(file), message, secret_key)
                 
                 # Save operation to database
-                stego_op = SteganographyOperation(
-                    user_id=current_user.id,
-                    original_filename=unique_filename,
-                    modified_filename=output_filename,
-                    secret_message=message,
-                    secret_key=secret_key
-                )
                 db.session.add(stego_op)
                 db.session.commit()
                 
                 flash('Message hidden in image successfully!', 'success')
                 return render_template('steganography.html', 
                                      success=True,
-                                     output_filename=output_filename)
+                                     output_filename=stego_op.modified_filename)
             except Exception as e:
                 flash(f'Steganography failed: {str(e)}', 'danger')
         else:
@@ -258,6 +564,13 @@ def extract():
     if request.method == 'POST':
         secret_key = request.form['secret_key']
         
+        retry_after = _extract_retry_after(current_user.id)
+        if retry_after:
+            flash(f'Too many failed extractions. Try again in {retry_after} seconds.', 'danger')
+            response = app.make_response((render_template('extract.html'), 429))
+            response.headers['Retry-After'] = str(retry_after)
+            return response
+        
         if 'image' not in request.files:
             flash('No image file selected.', 'danger')
             return render_template('extract.html')
@@ -274,46 +587,628 @@ def extract():
         
         if file and allowed_file(file.filename):
             try:
-                # Save uploaded file
-                filename = secure_filename(file.filename)
-                unique_filename = f"extract_{uuid.uuid4()}_{filename}"
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-                file.save(filepath)
-                
-                # Extract message from image
-                extracted_message = SteganographyUtils.extract_message_from_image(filepath, secret_key)
-                
-                # Clean up uploaded file
-                os.remove(filepath)
+                # Extract message straight from the upload stream
+                extracted_message = _extract_message(current_user.id, file.stream, secret_key)
                 
                 flash('Message extracted successfully!', 'success')
                 return render_template('extract.html', 
                                      extracted_message=extracted_message)
             except Exception as e:
-                # Clean up uploaded file if it exists
-                if 'filepath' in locals() and os.path.exists(filepath):
-                    os.remove(filepath)
                 flash(f'Message extraction failed: {str(e)}', 'danger')
         else:
             flash('Invalid file type. Please upload PNG, JPG, JPEG, GIF, or BMP files.', 'danger')
     
     return render_template('extract.html')
 
+def _owned_file(user_id, filename):
+    """(blob digest, created_at) of a user's stego output, or None if the user does not own it"""
+    owned = owned_files_cache.get(user_id)
+    if owned is None or filename not in owned:
+        # Misses always go to the database, so a stale cache never hides a new file
+        owned = {
+            row.modified_filename: (row.modified_blob, row.created_at)
+            for row in db.session.query(
+                SteganographyOperation.modified_filename,
+                SteganographyOperation.modified_blob,
+                SteganographyOperation.created_at
+            ).filter_by(user_id=user_id)
+        }
+        owned_files_cache.set(user_id, owned)
+    return owned.get(filename)
+
+@event.listens_for(db.session, 'after_flush')
+def _track_stego_owners(session, flush_context):
+    changed = session.info.setdefault('stego_owners', set())
+    for obj in list(session.new) + list(session.deleted):
+        if isinstance(obj, SteganographyOperation):
+            changed.add(obj.user_id)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_owned_files(session):
+    for user_id in session.info.pop('stego_owners', ()):
+        owned_files_cache.pop(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def _forget_stego_owners(session):
+    session.info.pop('stego_owners', None)
+
+def _offloaded_blob_response(digest, filename, last_modified):
+    """Empty response telling the front proxy (nginx X-Accel-Redirect) to send the blob itself"""
+    relative_path = os.path.relpath(blob_store.path(digest), blob_store.root).replace(os.sep, '/')
+    response = app.response_class(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response.headers['X-Accel-Redirect'] = app.config['X_ACCEL_REDIRECT_PREFIX'].rstrip('/') + '/' + relative_path
+    response.headers['Content-Disposition'] = f'inline; filename="{filename}"'
+    response.set_etag(digest)
+    response.last_modified = last_modified
+    return response.make_conditional(request)
+
 @app.route('/download/<filename>')
 @login_required
 def download_file(filename):
     """Download processed image"""
     # Verify user owns this file
-    stego_op = SteganographyOperation.query.filter_by(
-        user_id=current_user.id,
-        modified_filename=filename
-    ).first()
+    owned = _owned_file(current_user.id, filename)
     
-    if stego_op:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
-    else:
+    if owned is None:
         flash('File not found or access denied.', 'danger')
         return redirect(url_for('dashboard'))
+    
+    digest, created_at = owned
+    if digest is None:
+        # Operations recorded before the blob store still live in uploads/
+        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    
+    # Blobs never change, so the content digest is a strong ETag and creation time is Last-Modified
+    if app.config['X_ACCEL_REDIRECT_PREFIX']:
+        response = _offloaded_blob_response(digest, filename, created_at)
+    else:
+        # send_file answers If-None-Match/If-Modified-Since with 304 and Range with 206,
+        # and emits X-Sendfile instead of the body when USE_X_SENDFILE is set
+        response = send_file(
+            blob_store.path(digest),
+            download_name=filename,
+            etag=digest,
+            last_modified=created_at,
+            conditional=True,
+            max_age=0
+        )
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+def _batch_items(field):
+    """Validate a JSON batch body, returning (items, error response)"""
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict) or not isinstance(payload.get(field), list):
+        return None, (jsonify({'error': f'JSON body with a "{field}" array is required.'}), 400)
+    
+    items = payload[field]
+    if len(items) > app.config['BATCH_MAX_ITEMS']:
+        return None, (jsonify({'error': f"Batch too large. Maximum {app.config['BATCH_MAX_ITEMS']} items."}), 413)
+    return items, None
+
+@app.route('/api/encrypt/batch', methods=['POST'])
+@login_required
+def encrypt_batch():
+    """Encrypt an array of messages and store them in one bulk insert"""
+    messages, error = _batch_items('messages')
+    if error:
+        return error
+    mode = request.get_json().get('mode', 'hybrid')
+    
+    # Items that are not non-empty strings fail on their own without reaching the pool
+    results = [None] * len(messages)
+    valid = [i for i, message in enumerate(messages) if isinstance(message, str) and message]
+    for i in set(range(len(messages))) - set(valid):
+        results[i] = {'error': 'Message must be a non-empty string.'}
+    
+    encrypted = batch_executor.encrypt(User.with_public_key(current_user.id).public_key_material, [messages[i] for i in valid], mode)
+    rows = []
+    for i, result in zip(valid, encrypted):
+        if 'error' not in result:
+            # Workers return raw bytes; base64 is only for the JSON response
+            ciphertext = result.pop('ciphertext')
+            result['encrypted_message'] = base64.b64encode(ciphertext).decode('ascii')
+            rows.append({
+                'user_id': current_user.id,
+                'original_message': messages[i],
+                'md5_hash': result['md5_hash'],
+                **Message.ciphertext_columns(ciphertext),
+            })
+        results[i] = result
+    
+    try:
+        if rows:
+            # Save every successful item in a single round of INSERTs
+            ids = db.session.scalars(
+                insert(Message).returning(Message.id, sort_by_parameter_order=True), rows
+            ).all()
+            db.session.commit()
+            stored = iter(ids)
+            for result in results:
+                if 'error' not in result:
+                    result['id'] = next(stored)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Saving messages failed: {str(e)}'}), 500
+    
+    for index, result in enumerate(results):
+        result['index'] = index
+    return jsonify({
+        'results': results,
+        'succeeded': len(rows),
+        'failed': len(results) - len(rows),
+    })
+
+@app.route('/api/decrypt/batch', methods=['POST'])
+@login_required
+def decrypt_batch():
+    """Decrypt an array of ciphertexts with the current user's private key"""
+    ciphertexts, error = _batch_items('ciphertexts')
+    if error:
+        return error
+    
+    results = [None] * len(ciphertexts)
+    valid = [i for i, ciphertext in enumerate(ciphertexts) if isinstance(ciphertext, str) and ciphertext]
+    for i in set(range(len(ciphertexts))) - set(valid):
+        results[i] = {'error': 'Ciphertext must be a non-empty string.'}
+    
+    decrypted = batch_executor.decrypt(User.with_private_key(current_user.id).private_key_material, [ciphertexts[i] for i in valid])
+    for i, result in zip(valid, decrypted):
+        results[i] = result
+    
+    for index, result in enumerate(results):
+        result['index'] = index
+    succeeded = sum(1 for result in results if 'error' not in result)
+    return jsonify({
+        'results': results,
+        'succeeded': succeeded,
+        'failed': len(results) - succeeded,
+    })
+
+def _run_hide_job(user_id, upload, unique_filename, message, secret_key):
+    """Job body for /api/jobs/steganography"""
+    with upload:
+        stego_op = _hide_to_blobs(user_id, upload, unique_filename, message, secret_key)
+    
+    with app.app_context():
+        db.session.add(stego_op)
+        db.session.commit()
+        return {'output_filename': stego_op.modified_filename, 'operation_id': stego_op.id}
+
+def _run_extract_job(user_id, upload, secret_key):
+    """Job body for /api/jobs/extract"""
+    with upload:
+        return {'extracted_message': _extract_message(user_id, upload, secret_key)}
+
+def _submit_job(kind, func, *args):
+    """Queue a job and answer 202 with its id, or 503 when the queue is full"""
+    try:
+        job_id = job_queue.submit(current_user.id, kind, func, *args)
+    except QueueFullError as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    return jsonify({
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': url_for('job_status', job_id=job_id)
+    }), 202
+
+def _job_image():
+    """Validate the uploaded image of a job request, returning (file, error response)"""
+    file = request.files.get('image')
+    if file is None or file.filename == '':
+        return None, (jsonify({'error': 'No image file selected.'}), 400)
+    if not allowed_file(file.filename):
+        return None, (jsonify({'error': 'Invalid file type. Please upload PNG, JPG, JPEG, GIF, or BMP files.'}), 400)
+    return file, None
+
+@app.route('/api/jobs/steganography', methods=['POST'])
+@login_required
+def steganography_job():
+    """Queue hiding a message in an image"""
+    message = request.form.get('message', '')
+    secret_key = request.form.get('secret_key', '')
+    file, error = _job_image()
+    if error:
+        return error
+    if not message or not secret_key:
+        return jsonify({'error': 'Message and secret key are required.'}), 400
+    
+    upload = _spool_upload(file)
+    response = _submit_job('steganography', _run_hide_job, current_user.id, upload, _unique_filename(file), message, secret_key)
+    if response[1] != 202:
+        upload.close()
+    return response
+
+@app.route('/api/jobs/extract', methods=['POST'])
+@login_required
+def extract_job():
+    """Queue extracting a message from an image"""
+    retry_after = _extract_retry_after(current_user.id)
+    if retry_after:
+        response = jsonify({'error': 'Too many failed extractions.'})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429
+    
+    secret_key = request.form.get('secret_key', '')
+    file, error = _job_image()
+    if error:
+        return error
+    if not secret_key:
+        return jsonify({'error': 'Secret key is required.'}), 400
+    
+    upload = _spool_upload(file)
+    response = _submit_job('extract', _run_extract_job, current_user.id, upload, secret_key)
+    if response[1] != 202:
+        upload.close()
+    return response
+
+@app.route('/api/steganography/capacity', methods=['POST'])
+@login_required
+def steganography_capacity():
+    """How much a carrier can hold, read from its header without decoding pixels"""
+    from carriers import Carrier
+    from steganography import SteganographyUtils
+    
+    file, error = _job_image()
+    if error:
+        return error
+    try:
+        info = Carrier.probe(file.stream)
+    except Exception:
+        return jsonify({'error': 'Unreadable image file.'}), 400
+    
+    body = {
+        'format': info.format,
+        'width': info.width,
+        'height': info.height,
+        'frames': info.frames,
+        'mode': info.mode,
+        'capacity_bytes': info.capacity_bytes,
+        'max_message_bytes': SteganographyUtils.max_message_size(info),
+        'output_format': info.output_format,
+    }
+    message = request.form.get('message')
+    if message is not None:
+        body['message_bytes'] = len(message.encode('utf-8'))
+        body['fits'] = body['message_bytes'] <= body['max_message_bytes']
+    return jsonify(body)
+
+# Result encodings of the bulk steganography endpoints
+BATCH_OUTPUT_FORMATS = ('zip', 'ndjson')
+
+def _batch_uploads(spools):
+    """(name, read) pairs from a ZIP in 'archive' or several 'images' files, returning (items, error response)
+    
+    Results are streamed after the request's own files are closed, so uploads are
+    copied into private spools registered on the spools ExitStack.
+    """
+    archive = request.files.get('archive')
+    if archive is not None and archive.filename:
+        try:
+            bundle = zipfile.ZipFile(spools.enter_context(_spool_upload(archive)))
+        except zipfile.BadZipFile:
+            return None, (jsonify({'error': 'Archive is not a valid ZIP file.'}), 400)
+        # Directories, macOS resource forks and other non-image entries are skipped
+        entries = [
+            info for info in bundle.infolist()
+            if not info.is_dir() and not info.filename.startswith('__MACOSX/') and allowed_file(info.filename)
+        ]
+        oversized = next((info for info in entries if info.file_size > app.config['MAX_CONTENT_LENGTH']), None)
+        if oversized is not None:
+            return None, (jsonify({'error': f'{oversized.filename} is larger than the 16MB image limit.'}), 413)
+        items = [(info.filename, lambda info=info: bundle.read(info)) for info in entries]
+    else:
+        files = [file for file in request.files.getlist('images') if file.filename]
+        invalid = [file.filename for file in files if not allowed_file(file.filename)]
+        if invalid:
+            return None, (jsonify({'error': f"Invalid file type: {', '.join(invalid)}. Please upload PNG, JPG, JPEG, GIF, or BMP files."}), 400)
+        items = [(file.filename, spools.enter_context(_spool_upload(file)).read) for file in files]
+    
+    if not items:
+        return None, (jsonify({'error': 'No images found in the upload.'}), 400)
+    if len(items) > app.config['STEGO_BATCH_MAX_IMAGES']:
+        return None, (jsonify({'error': f"Batch too large. Maximum {app.config['STEGO_BATCH_MAX_IMAGES']} images."}), 413)
+    return items, None
+
+def _batch_tasks(items, make_args, refuse=None):
+    """((index, name, args), args) tasks for the batch pool, reading each upload only when the pool has room
+    
+    refuse(), if given, is asked right before each item is submitted and may return an
+    exception to report for it instead of running it.
+    """
+    for index, (name, read) in enumerate(items):
+        args = refuse() if refuse is not None else None
+        if args is None:
+            try:
+                args = make_args(read())
+            except Exception as e:
+                args = Exception(f'Reading {name} failed: {str(e)}')
+        yield (index, name, args), args
+
+def _stream_batch(chunks, output_format, download_name):
+    """Streamed response for a batch run; the request context stays open until the last chunk"""
+    if output_format == 'zip':
+        response = app.response_class(stream_with_context(chunks), mimetype='application/zip')
+        response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    else:
+        response = app.response_class(stream_with_context(chunks), mimetype='application/x-ndjson')
+    # Let results through a buffering front proxy as soon as they are produced
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def _ndjson(line):
+    return json.dumps(line) + '\n'
+
+def _save_operations(user_id, rows):
+    """Store a batch of SteganographyOperation rows in one bulk insert, returning their ids"""
+    # Bulk INSERTs skip the before_insert hook that counts blob references
+    add_blob_references(
+        db.session.connection(), [digest for row in rows for digest in (row['original_blob'], row['modified_blob'])]
+    )
+    ids = db.session.scalars(
+        insert(SteganographyOperation).returning(SteganographyOperation.id, sort_by_parameter_order=True), rows
+    ).all()
+    db.session.info.setdefault('stego_owners', set()).add(user_id)
+    db.session.commit()
+    return ids
+
+@app.route('/api/steganography/batch', methods=['POST'])
+@login_required
+def steganography_batch():
+    """Hide a message in every image of a ZIP or multi-file upload, streaming results as images finish"""
+    request.max_content_length = app.config['STEGO_BATCH_MAX_UPLOAD']
+    message = request.form.get('message', '')
+    secret_key = request.form.get('secret_key', '')
+    output_format = request.form.get('format', 'zip')
+    if output_format not in BATCH_OUTPUT_FORMATS:
+        return jsonify({'error': f"Unknown format. Use one of: {', '.join(BATCH_OUTPUT_FORMATS)}."}), 400
+    if not message or not secret_key:
+        return jsonify({'error': 'Message and secret key are required.'}), 400
+    spools = ExitStack()
+    items, error = _batch_uploads(spools)
+    if error:
+        spools.close()
+        return error
+    user_id = current_user.id
+    
+    def generate():
+        with spools:
+            yield from _hide_batch(user_id, items, message, secret_key, output_format)
+    
+    return _stream_batch(generate(), output_format, 'steganography-batch.zip')
+
+def _hide_batch(user_id, items, message, secret_key, output_format):
+    """Chunks of a /api/steganography/batch response"""
+    from carriers import OUTPUT_EXTENSION
+    
+    archive = StreamingZip() if output_format == 'zip' else None
+    lines = []
+    rows = []
+    tasks = _batch_tasks(items, lambda data: (data, message, secret_key, blob_store.temp_path(OUTPUT_EXTENSION)))
+    for (index, name, args), _, error in stego_batch.imap_unordered(hide_image, tasks):
+        line = {'index': index, 'filename': name}
+        if error is None:
+            data, output_path = args[0], args[3]
+            try:
+                unique_filename = f"{uuid.uuid4()}_{secure_filename(os.path.basename(name))}"
+                output_filename = _stego_output_filename(unique_filename)
+                with metrics.stage('blob_put'):
+                    original_blob = blob_store.put_stream(io.BytesIO(data))
+                    modified_blob = blob_store.put_file(output_path)
+            except Exception as e:
+                error = e
+        if error is not None:
+            if not isinstance(args, Exception) and os.path.exists(args[3]):
+                os.remove(args[3])
+            line['error'] = str(error)
+            metrics.inc('stego_batch_items_total', kind='steganography', status='failed')
+            lines.append(line)
+            yield _ndjson(line) if archive is None else b''
+            continue
+        
+        rows.append({
+            'user_id': user_id,
+            'original_filename': unique_filename,
+            'modified_filename': output_filename,
+            'secret_message': message,
+            'secret_key': secret_key,
+            'original_blob': original_blob,
+            'modified_blob': modified_blob,
+        })
+        line['output_filename'] = output_filename
+        line['download_url'] = url_for('download_file', filename=output_filename)
+        metrics.inc('stego_batch_items_total', kind='steganography', status='succeeded')
+        lines.append(line)
+        if archive is None:
+            yield _ndjson(line)
+        else:
+            yield from archive.add_file(output_filename, blob_store.path(modified_blob))
+    
+    # Every operation is recorded in one round of INSERTs once all images are done
+    summary = {'succeeded': len(rows), 'failed': len(lines) - len(rows)}
+    try:
+        if rows:
+            summary['operation_ids'] = _save_operations(user_id, rows)
+    except Exception as e:
+        db.session.rollback()
+        summary['error'] = f'Saving operations failed: {str(e)}'
+    if archive is None:
+        yield _ndjson({'summary': summary})
+    else:
+        yield archive.add_bytes('results.ndjson', ''.join(map(_ndjson, lines + [{'summary': summary}])))
+        yield archive.close()
+
+@app.route('/api/extract/batch', methods=['POST'])
+@login_required
+def extract_batch():
+    """Extract the messages hidden in every image of a ZIP or multi-file upload, streaming results"""
+    retry_after = _extract_retry_after(current_user.id)
+    if retry_after:
+        response = jsonify({'error': 'Too many failed extractions.'})
+        response.headers['Retry-After'] = str(retry_after)
+        return response, 429
+    
+    request.max_content_length = app.config['STEGO_BATCH_MAX_UPLOAD']
+    secret_key = request.form.get('secret_key', '')
+    output_format = request.form.get('format', 'ndjson')
+    if output_format not in BATCH_OUTPUT_FORMATS:
+        return jsonify({'error': f"Unknown format. Use one of: {', '.join(BATCH_OUTPUT_FORMATS)}."}), 400
+    if not secret_key:
+        return jsonify({'error': 'Secret key is required.'}), 400
+    spools = ExitStack()
+    items, error = _batch_uploads(spools)
+    if error:
+        spools.close()
+        return error
+    user_id = current_user.id
+    legacy_max_pixels = app.config['STEGO_LEGACY_MAX_PIXELS'] or None
+    
+    def generate():
+        with spools:
+            yield from _extract_batch(user_id, items, secret_key, legacy_max_pixels, output_format)
+    
+    return _stream_batch(generate(), output_format, 'extract-batch.zip')
+
+class ExtractRateLimited(Exception):
+    """A batch item refused because the user has had too many failed extractions"""
+    
+    def __init__(self, retry_after):
+        super().__init__('Too many failed extractions.')
+        self.retry_after = retry_after
+
+def _extract_batch(user_id, items, secret_key, legacy_max_pixels, output_format):
+    """Chunks of a /api/extract/batch response"""
+    archive = StreamingZip() if output_format == 'zip' else None
+    lines = []
+    limited = None
+    
+    def refuse():
+        # Failures of earlier items count straight away, so a batch gets past the limit by at most
+        # the items already in flight; once it trips, every remaining item is refused
+        nonlocal limited
+        if limited is None:
+            retry_after = _extract_retry_after(user_id)
+            if retry_after:
+                limited = ExtractRateLimited(retry_after)
+        return limited
+    
+    tasks = _batch_tasks(items, lambda data: (data, secret_key, legacy_max_pixels), refuse)
+    for (index, name, _), message, error in stego_batch.imap_unordered(extract_image, tasks):
+        line = {'index': index, 'filename': name}
+        if isinstance(error, ExtractRateLimited):
+            line['error'] = str(error)
+            line['retry_after'] = error.retry_after
+            chunk = b''
+        elif error is not None:
+            line['error'] = str(error)
+            extract_limiter.record_failure(user_id)
+            metrics.inc('extract_failures_total')
+            chunk = b''
+        else:
+            line['extracted_message'] = message
+            entry_name = f"{index:04d}_{os.path.splitext(secure_filename(os.path.basename(name)))[0]}.txt"
+            chunk = archive.add_bytes(entry_name, message) if archive is not None else b''
+        status = 'rate_limited' if isinstance(error, ExtractRateLimited) else 'failed' if error else 'succeeded'
+        metrics.inc('stego_batch_items_total', kind='extract', status=status)
+        lines.append(line)
+        yield _ndjson(line) if archive is None else chunk
+    
+    summary = {'succeeded': sum(1 for line in lines if 'error' not in line)}
+    summary['failed'] = len(lines) - summary['succeeded']
+    if archive is None:
+        yield _ndjson({'summary': summary})
+    else:
+        yield archive.add_bytes('results.ndjson', ''.join(map(_ndjson, lines + [{'summary': summary}])))
+        yield archive.close()
+
+@app.route('/jobs/<job_id>')
+@login_required
+def job_status(job_id):
+    """Status and result of a background job"""
+    job = job_queue.get(job_id)
+    if job is None or job['user_id'] != current_user.id:
+        return jsonify({'error': 'Job not found.'}), 404
+    
+    body = {key: job[key] for key in ('id', 'kind', 'status', 'error', 'result', 'created_at', 'started_at', 'finished_at')}
+    if job['status'] == 'finished' and job['kind'] == 'steganography':
+        body['download_url'] = url_for('download_file', filename=job['result']['output_filename'])
+    return jsonify(body)
+
+@app.route('/api/key-pool')
+@login_required
+def key_pool_stats():
+    """RSA key pool depth and refill metrics"""
+    return jsonify(rsa_key_pool.stats())
+
+@app.route('/api/user-cache')
+@login_required
+def user_cache_stats():
+    """User loader cache hit rate and size"""
+    return jsonify(user_cache.stats())
+
+def collect_blob_garbage(grace_seconds):
+    """Delete unreferenced blobs and orphaned blob files older than the grace period"""
+    cutoff = time.time() - grace_seconds
+    known = set()
+    removed = 0
+    
+    for digest, ref_count in db.session.query(Blob.sha256, Blob.ref_count).all():
+        known.add(digest)
+        if ref_count > 0:
+            continue
+        path = blob_store.path(digest)
+        if os.path.exists(path) and os.path.getmtime(path) >= cutoff:
+            continue
+        # Re-check the count in the DELETE in case an operation referenced the blob meanwhile; the
+        # row stays locked until commit, so an operation referencing it now waits for the outcome
+        deleted = Blob.query.filter(Blob.sha256 == digest, Blob.ref_count <= 0).delete(synchronize_session=False)
+        if not deleted:
+            db.session.rollback()
+            continue
+        try:
+            # An upload that deduplicated against the file since the check above keeps it
+            retired = blob_store.retire(digest, cutoff)
+        except BlobInUseError:
+            db.session.rollback()
+            continue
+        try:
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            if retired is not None:
+                blob_store.restore(digest, retired)
+            raise
+        if retired is not None:
+            os.remove(retired)
+        removed += 1
+    
+    # Files whose operation never committed have no row at all
+    orphans = 0
+    for digest, mtime in blob_store.iter_blobs():
+        if digest not in known and mtime < cutoff and db.session.get(Blob, digest) is None:
+            try:
+                retired = blob_store.retire(digest, cutoff)
+            except BlobInUseError:
+                continue
+            if retired is not None:
+                os.remove(retired)
+                orphans += 1
+    
+    temp_files = blob_store.remove_stale_temp_files(grace_seconds)
+    return {'unreferenced': removed, 'orphaned': orphans, 'temp_files': temp_files}
+
+@app.cli.command('gc-blobs')
+@click.option('--grace', type=int, default=None, help='Minimum blob age in seconds (default BLOB_GC_GRACE_SECONDS).')
+def gc_blobs(grace):
+    """Delete unreferenced and orphaned image blobs"""
+    if grace is None:
+        grace = app.config['BLOB_GC_GRACE_SECONDS']
+    result = collect_blob_garbage(grace)
+    click.echo(f"Removed {result['unreferenced']} unreferenced blobs, "
+               f"{result['orphaned']} orphaned files and {result['temp_files']} temp files")
 
 # Error handlers
 @app.errorhandler(404)
@@ -324,3 +1219,11 @@ def not_found_error(error):
 def internal_error(error):
     db.session.rollback()
     return render_template('500.html'), 500
+
+@app.errorhandler(OffloadBusyError)
+def offload_busy_error(error):
+    # Shed the request quickly instead of queueing more CPU work behind the pool
+    db.session.rollback()
+    response = make_response(render_template('503.html'), 503)
+    response.headers['Retry-After'] = str(app.config['OFFLOAD_RETRY_AFTER'])
+    return response
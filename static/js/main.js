@@ -113,7 +113,8 @@ function validateForm(form) {
     
     // Message length validation for encryption
     const messageField = form.querySelector('textarea[name="message"]');
-    if (messageField && form.action.includes('encrypt')) {
+    const modeField = form.querySelector('select[name="mode"]');
+    if (messageField && form.action.includes('encrypt') && modeField && modeField.value === 'rsa') {
         if (messageField.value.length > 190) {
             showFieldError(messageField, 'Message too long for RSA encryption (max 190 characters).');
             isValid = false;
@@ -183,7 +184,9 @@ function initializeCharacterCounters() {
     const textareas = document.querySelectorAll('textarea');
     
     textareas.forEach(textarea => {
-        if (textarea.name === 'message' && window.location.pathname.includes('encrypt')) {
+        const modeField = document.querySelector('select[name="mode"]');
+        if (textarea.name === 'message' && window.location.pathname.includes('encrypt') &&
+            modeField && modeField.value === 'rsa') {
             addCharacterCounter(textarea, 190);
         }
     });
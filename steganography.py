@@ -1,95 +1,371 @@
 import os
-from PIL import Image
+import struct
+import zlib
 import hashlib
+import hmac
+import re
+from contextlib import closing
+import numpy as np
+from cache_utils import SizedLRUCache
+from carriers import Carrier
+from instrumentation import metrics
+
+DELIMITER = b"<<<END_OF_MESSAGE>>>"
+
+# Pixels packed per band while scanning an image for the delimiter, and the first
+# band of rows decoded (later bands grow, see Carrier.row_bands)
+EXTRACT_CHUNK_PIXELS = 256 * 1024
+
+# Bytes that never come out of a text form field: C0 controls other than
+# tab/newline/carriage return, DEL and the C1 control range
+NON_TEXT_BYTES = re.compile(rb'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f-\x9f]')
+
+# Versioned container: magic, version, varint payload length, UTF-8 payload, CRC32
+CONTAINER_MAGIC = b'SMSG'
+CONTAINER_VERSION = 1
+MAX_VARINT_BYTES = 5
+CONTAINER_HEADER_MAX = len(CONTAINER_MAGIC) + 1 + MAX_VARINT_BYTES
+CRC_SIZE = 4
+
+# Containers are preceded by a key check header written in order into the first
+# channels of the first frame: magic, version, random salt and a salted check value
+# of the secret key. Wrong keys and images without one are turned away after 128 bits.
+KEY_HEADER_MAGIC = b'\x89SK'
+KEY_HEADER_VERSION = 2
+KEY_SALT_SIZE = 8
+KEY_CHECK_SIZE = 4
+KEY_HEADER_SIZE = len(KEY_HEADER_MAGIC) + 1 + KEY_SALT_SIZE + KEY_CHECK_SIZE
+KEY_CHECK_CONTEXT = b'steganography key check'
+
+PAYLOAD_FORMATS = ('container', 'legacy')
+
+NO_MESSAGE_ERROR = "No valid message found in image or incorrect secret key"
+
+# (key, image size) pixel permutations kept in memory by each process, bounded by count and
+# by total bytes (4 or 8 per pixel); permutations of larger images are recomputed every time
+PERMUTATION_CACHE_SIZE = 4
+PERMUTATION_CACHE_BYTES = 128 * 1024 * 1024
+
+
+def encode_varint(value):
+    """Encode a non-negative integer as an unsigned LEB128 varint"""
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def decode_varint(data, offset=0):
+    """Decode a varint from data, returning (value, next offset)"""
+    value = 0
+    for i in range(MAX_VARINT_BYTES):
+        if offset + i >= len(data):
+            break
+        byte = data[offset + i]
+        value |= (byte & 0x7F) << (7 * i)
+        if not byte & 0x80:
+            return value, offset + i + 1
+    raise ValueError("Invalid payload length header")
+
+
+_permutations = SizedLRUCache(PERMUTATION_CACHE_SIZE, PERMUTATION_CACHE_BYTES, sizeof=lambda array: array.nbytes)
+
+
+def _pixel_permutation(key_digest, num_pixels):
+    """Key-seeded permutation of pixel indices, cached per (key, size) while it fits"""
+    permutation = _permutations.get((key_digest, num_pixels))
+    if permutation is not None:
+        return permutation
+    # RandomState's stream is frozen across NumPy releases, unlike Generator,
+    # so images embedded today stay extractable after an upgrade
+    rng = np.random.RandomState(np.frombuffer(key_digest, dtype='<u4'))
+    dtype = np.uint32 if num_pixels <= np.iinfo(np.uint32).max else np.uint64
+    permutation = rng.permutation(num_pixels).astype(dtype)
+    permutation.setflags(write=False)
+    _permutations.set((key_digest, num_pixels), permutation)
+    return permutation
+
 
 class SteganographyUtils:
     @staticmethod
-    def hide_message_in_image(image_path, message, secret_key, output_path):
+    def hide_message_in_image(image_path, message, secret_key, output_path, payload_format='container'):
         """Hide a message in an image using LSB steganography"""
         try:
-            # Open the image
-            img = Image.open(image_path)
-            
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Create a key-based seed for message positioning
-            key_hash = hashlib.md5(secret_key.encode()).hexdigest()
-            seed = int(key_hash[:8], 16)
-            
-            # Prepare the message with delimiter
-            delimiter = "<<<END_OF_MESSAGE>>>"
-            full_message = message + delimiter
-            binary_message = ''.join(format(ord(char), '08b') for char in full_message)
-            
-            # Get image dimensions
-            width, height = img.size
-            pixels = list(img.getdata())
+            if payload_format not in PAYLOAD_FORMATS:
+                raise ValueError(f"Unknown payload format: {payload_format}")
             
-            # Check if image can hold the message
-            max_chars = (width * height * 3) // 8
-            if len(full_message) > max_chars:
-                raise ValueError(f"Message too long for image. Maximum {max_chars} characters.")
+            with metrics.stage('image_open'):
+                # Only the header has been read at this point, so a carrier that is
+                # too small is rejected before any pixel is decoded
+                carrier = Carrier.open(image_path)
+                info = carrier.info
+                SteganographyUtils.check_capacity(info, message, payload_format)
+                pixels = carrier.pixels()
+                flat_pixels = pixels.reshape(-1)
             
-            # Hide message in LSBs
-            data_index = 0
-            for i in range(len(pixels)):
-                if data_index < len(binary_message):
-                    pixel = list(pixels[i])
-                    for j in range(3):  # RGB channels
-                        if data_index < len(binary_message):
-                            # Modify LSB
-                            pixel[j] = pixel[j] & 0xFE | int(binary_message[data_index])
-                            data_index += 1
-                    pixels[i] = tuple(pixel)
+            # Only the message bits are written, so there is no per-pixel work to spread over processes
+            with metrics.stage('lsb_embed'):
+                if payload_format == 'legacy':
+                    # Delimiter-terminated bits, written in order from the first channel of the first frame
+                    bits = SteganographyUtils._message_to_bits(message + DELIMITER.decode('ascii'))
+                    SteganographyUtils._embed_bits(flat_pixels, bits)
                 else:
-                    break
+                    # Key check header in the first channels, then the container scattered
+                    # over key-derived positions in the rest of each frame
+                    header = SteganographyUtils.build_key_header(secret_key)
+                    container = SteganographyUtils.build_container(message)
+                    bits = np.unpackbits(np.frombuffer(header + container, dtype=np.uint8))
+                    header_bits = len(header) * 8
+                    positions = np.concatenate((
+                        np.arange(header_bits),
+                        SteganographyUtils._carrier_positions(
+                            secret_key, info, len(bits) - header_bits, SteganographyUtils._header_pixels(info)
+                        ),
+                    ))
+                    flat_pixels[positions] = (flat_pixels[positions] & 0xFE) | bits
             
-            # Create new image with modified pixels
-            stego_img = Image.new('RGB', (width, height))
-            stego_img.putdata(pixels)
-            stego_img.save(output_path)
+            # Always written losslessly, whatever the carrier's own format was
+            with metrics.stage('png_encode'):
+                carrier.save(pixels, output_path)
             
             return True
         except Exception as e:
             raise Exception(f"Steganography hiding failed: {str(e)}")
     
     @staticmethod
-    def extract_message_from_image(image_path, secret_key):
-        """Extract hidden message from image"""
+    def max_message_size(info, payload_format='container'):
+        """Largest message a carrier can hold: UTF-8 bytes for containers, characters for legacy"""
+        if payload_format == 'legacy':
+            return max(info.capacity_bytes - len(DELIMITER), 0)
+        # The length varint grows with the payload, so try each header size
+        capacity = SteganographyUtils._keyed_capacity(info, SteganographyUtils._header_pixels(info))
+        fixed = len(CONTAINER_MAGIC) + 1 + CRC_SIZE
+        best = -1
+        for varint_size in range(1, MAX_VARINT_BYTES + 1):
+            length = capacity - fixed - varint_size
+            if length >= 0 and len(encode_varint(length)) <= varint_size:
+                best = max(best, length)
+        return best
+    
+    @staticmethod
+    def check_capacity(info, message, payload_format='container'):
+        """Raise ValueError if the message does not fit in a carrier with this CarrierInfo"""
+        limit = SteganographyUtils.max_message_size(info, payload_format)
+        if limit < 0:
+            raise ValueError("Image too small to hold a message.")
+        if payload_format == 'legacy':
+            if len(message) > limit:
+                raise ValueError(f"Message too long for image. Maximum {limit} characters.")
+        elif len(message.encode('utf-8')) > limit:
+            raise ValueError(f"Message too long for image. Maximum {limit} bytes.")
+    
+    @staticmethod
+    def build_key_header(secret_key, salt=None):
+        """Key check header: magic, version, salt and a check value only the right key reproduces"""
+        salt = os.urandom(KEY_SALT_SIZE) if salt is None else salt
+        return (KEY_HEADER_MAGIC + bytes([KEY_HEADER_VERSION]) + salt
+                + SteganographyUtils._key_check(secret_key, salt))
+    
+    @staticmethod
+    def _key_check(secret_key, salt):
+        return hmac.new(secret_key.encode('utf-8'), KEY_CHECK_CONTEXT + salt, hashlib.sha256).digest()[:KEY_CHECK_SIZE]
+    
+    @staticmethod
+    def _header_pixels(info):
+        """Pixels at the start of each frame left out of the keyed order for the key check header"""
+        return -(-KEY_HEADER_SIZE * 8 // info.channels)
+    
+    @staticmethod
+    def _keyed_capacity(info, skip_pixels=0):
+        """Bytes available at keyed positions once skip_pixels are left out of every frame"""
+        return info.frames * max(info.width * info.height - skip_pixels, 0) * info.channels // 8
+    
+    @staticmethod
+    def build_container(message):
+        """Pack a message into the versioned, length-prefixed container format"""
+        payload = message.encode('utf-8')
+        header = CONTAINER_MAGIC + bytes([CONTAINER_VERSION]) + encode_varint(len(payload))
+        return header + payload + struct.pack('>I', zlib.crc32(payload))
+    
+    @staticmethod
+    def _embedding_positions(secret_key, num_pixels, num_bits, channels=3):
+        """Flat channel indices within one frame for the first num_bits bits of a keyed payload"""
+        key_digest = hashlib.sha256(secret_key.encode('utf-8')).digest()
+        pixel_order = _pixel_permutation(key_digest, num_pixels)[:(num_bits + channels - 1) // channels]
+        positions = (pixel_order[:, None].astype(np.int64) * channels + np.arange(channels)).reshape(-1)
+        return positions[:num_bits]
+    
+    @staticmethod
+    def _carrier_positions(secret_key, info, num_bits, skip_pixels=0):
+        """Flat indices into a (frames, height, width, channels) buffer for a keyed payload
+        
+        Each frame is filled in turn using the same keyed order over all but its first
+        skip_pixels pixels, so the layout of a frame never depends on how many follow it.
+        """
+        frame_bits = info.frame_bits
+        usable_bits = (info.width * info.height - skip_pixels) * info.channels
+        positions = SteganographyUtils._embedding_positions(
+            secret_key, info.width * info.height - skip_pixels, min(num_bits, usable_bits), info.channels
+        ) + skip_pixels * info.channels
+        if num_bits <= usable_bits:
+            return positions
+        frames = -(-num_bits // usable_bits)
+        offsets = np.arange(frames, dtype=np.int64)[:, None] * frame_bits
+        return (offsets + positions).reshape(-1)[:num_bits]
+    
+    @staticmethod
+    def _message_to_bits(full_message):
+        """Convert a message to an array of bits, one uint8 per bit"""
         try:
-            # Open the image
-            img = Image.open(image_path)
-            
-            # Convert to RGB if necessary
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-            
-            # Get pixels
-            pixels = list(img.getdata())
-            
-            # Extract LSBs
-            binary_message = ""
-            for pixel in pixels:
-                for channel in pixel:
-                    binary_message += str(channel & 1)
-            
-            # Convert binary to text
-            message = ""
-            for i in range(0, len(binary_message), 8):
-                byte = binary_message[i:i+8]
-                if len(byte) == 8:
-                    char = chr(int(byte, 2))
-                    message += char
-                    
-                    # Check for delimiter
-                    if message.endswith("<<<END_OF_MESSAGE>>>"):
-                        # Remove delimiter and return message
-                        return message[:-len("<<<END_OF_MESSAGE>>>")]
-            
-            # If we reach here, no valid message was found
-            raise ValueError("No valid message found in image or incorrect secret key")
+            message_bytes = np.frombuffer(full_message.encode('latin-1'), dtype=np.uint8)
+            return np.unpackbits(message_bytes)
+        except UnicodeEncodeError:
+            # Characters above U+00FF have always been written with their full
+            # ord() width, so keep that layout for non Latin-1 text
+            binary_message = ''.join(format(ord(char), '08b') for char in full_message)
+            return np.frombuffer(binary_message.encode('ascii'), dtype=np.uint8) - ord('0')
+    
+    @staticmethod
+    def _embed_bits(flat_pixels, bits):
+        """Write bits into the LSBs of a flat uint8 channel buffer in place"""
+        count = min(len(bits), len(flat_pixels))
+        target = flat_pixels[:count]
+        target &= 0xFE
+        target |= bits[:count]
+        return count
+    
+    @staticmethod
+    def extract_message_from_image(image_path, secret_key, text_only=False, legacy_max_pixels=None):
+        """Extract hidden message from image
+        
+        Images without a key check header are scanned for the older formats only up to
+        legacy_max_pixels (None for no limit); larger ones are rejected without decoding.
+        """
+        try:
+            with metrics.stage('image_open'):
+                carrier = Carrier.open(image_path)
+                info = carrier.info
+                
+                # The first 128 bits tell whether this key can be right, before the image is decoded
+                key_header = SteganographyUtils._read_key_header(carrier)
+                if key_header is not None:
+                    salt, check = key_header
+                    if not hmac.compare_digest(check, SteganographyUtils._key_check(secret_key, salt)):
+                        raise ValueError(NO_MESSAGE_ERROR)
+                elif legacy_max_pixels is not None and info.frames * info.width * info.height > legacy_max_pixels:
+                    raise ValueError(NO_MESSAGE_ERROR)
             
+            with metrics.stage('lsb_extract'):
+                if key_header is not None:
+                    # Decode every frame in the carrier mode it was written in
+                    message = SteganographyUtils._extract_container(
+                        carrier.pixels(), info, secret_key, SteganographyUtils._header_pixels(info)
+                    )
+                    if message is None:
+                        raise ValueError(NO_MESSAGE_ERROR)
+                    return message
+                
+                # Images from before the key check header can only hold the delimiter format,
+                # which decodes the image itself as the scan goes
+                return SteganographyUtils._extract_legacy(carrier, text_only)
+        
         except Exception as e:
             raise Exception(f"Message extraction failed: {str(e)}")
+    
+    @staticmethod
+    def _read_key_header(carrier):
+        """(salt, check value) from the key check header, or None if the image starts without one"""
+        info = carrier.info
+        if info.width * info.height <= SteganographyUtils._header_pixels(info):
+            return None
+        header = np.packbits(carrier.leading_channels(KEY_HEADER_SIZE * 8) & 1).tobytes()
+        if not header.startswith(KEY_HEADER_MAGIC) or header[len(KEY_HEADER_MAGIC)] != KEY_HEADER_VERSION:
+            return None
+        salt_start = len(KEY_HEADER_MAGIC) + 1
+        return header[salt_start:salt_start + KEY_SALT_SIZE], header[salt_start + KEY_SALT_SIZE:]
+    
+    @staticmethod
+    def _extract_container(pixels, info, secret_key, skip_pixels):
+        """Read a container payload, or return None if the image has none for this key"""
+        flat_pixels = pixels.reshape(-1)
+        capacity = SteganographyUtils._keyed_capacity(info, skip_pixels)
+        if capacity < len(CONTAINER_MAGIC) + 2 + CRC_SIZE:
+            return None
+        
+        def read_bytes(count):
+            positions = SteganographyUtils._carrier_positions(secret_key, info, count * 8, skip_pixels)
+            return np.packbits(flat_pixels[positions] & 1).tobytes()
+        
+        header = read_bytes(min(CONTAINER_HEADER_MAX, capacity))
+        if not header.startswith(CONTAINER_MAGIC) or header[len(CONTAINER_MAGIC)] != CONTAINER_VERSION:
+            return None
+        try:
+            length, offset = decode_varint(header, len(CONTAINER_MAGIC) + 1)
+        except ValueError:
+            return None
+        if offset + length + CRC_SIZE > capacity:
+            return None
+        
+        # The header tells us exactly how many bits to read
+        data = read_bytes(offset + length + CRC_SIZE)
+        payload = data[offset:offset + length]
+        (crc,) = struct.unpack('>I', data[offset + length:])
+        if zlib.crc32(payload) != crc:
+            raise ValueError("Hidden message is corrupted (checksum mismatch)")
+        return payload.decode('utf-8')
+    
+    @staticmethod
+    def _extract_legacy(carrier, text_only):
+        """Scan for a delimiter-terminated message band by band, decoding rows only as the scan reaches them"""
+        info = carrier.info
+        # Decoded top down as far as the scan gets; noise is usually turned away in the first band
+        bands = carrier.row_bands(max(1, EXTRACT_CHUNK_PIXELS // info.width))
+        return SteganographyUtils._find_delimited_message(SteganographyUtils._iter_packed_lsbs(bands), text_only)
+    
+    @staticmethod
+    def _find_delimited_message(chunks, text_only):
+        """Decode packed LSB bytes chunk by chunk until the delimiter shows up"""
+        message = bytearray()
+        with closing(chunks):
+            for chunk in chunks:
+                decoded_from = len(message)
+                message += chunk
+                
+                # Check for delimiter, only rescanning the bytes that could straddle the previous band
+                end = message.find(DELIMITER, max(0, decoded_from - len(DELIMITER) + 1))
+                if end != -1:
+                    if text_only and NON_TEXT_BYTES.search(message, 0, end):
+                        break
+                    return message[:end].decode('latin-1')
+                
+                # Random LSB noise produces control bytes almost immediately, so
+                # text-only callers can give up long before the end of the image
+                if text_only and NON_TEXT_BYTES.search(message, decoded_from):
+                    break
+        
+        # If we reach here, no valid message was found
+        raise ValueError(NO_MESSAGE_ERROR)
+    
+    @staticmethod
+    def _iter_packed_lsbs(frames):
+        """Yield the LSB plane of (height, width, channels) frames packed into bytes, one band of rows at a time"""
+        carry = np.empty(0, dtype=np.uint8)
+        for frame in frames:
+            height, width = frame.shape[:2]
+            rows_per_chunk = max(1, EXTRACT_CHUNK_PIXELS // width)
+            for top in range(0, height, rows_per_chunk):
+                # Extract LSBs of one band of rows
+                bits = frame[top:top + rows_per_chunk].reshape(-1) & 1
+                if carry.size:
+                    bits = np.concatenate((carry, bits))
+                
+                # Bits that do not fill a whole byte roll over into the next band, or the next frame
+                usable = bits.size - bits.size % 8
+                carry = bits[usable:]
+                if usable:
+                    yield np.packbits(bits[:usable]).tobytes()
@@ -0,0 +1,40 @@
+import io
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from blob_store import BlobInUseError, BlobStore
+
+
+def _age(path, seconds):
+    old = time.time() - seconds
+    os.utime(path, (old, old))
+
+
+def test_retire_keeps_a_blob_stored_again_after_the_cutoff(tmp_path):
+    store = BlobStore(tmp_path)
+    digest = store.put_stream(io.BytesIO(b'carrier'))
+    _age(store.path(digest), 7200)
+    cutoff = time.time() - 3600
+    # An upload deduplicates against the old file after GC decided to collect it
+    store.put_stream(io.BytesIO(b'carrier'))
+    with pytest.raises(BlobInUseError):
+        store.retire(digest, cutoff)
+    assert store.exists(digest)
+
+
+def test_upload_after_retire_stores_the_blob_again(tmp_path):
+    store = BlobStore(tmp_path)
+    digest = store.put_stream(io.BytesIO(b'carrier'))
+    _age(store.path(digest), 7200)
+    retired = store.retire(digest, time.time() - 3600)
+    assert not store.exists(digest)
+    
+    assert store.put_stream(io.BytesIO(b'carrier')) == digest
+    os.remove(retired)
+    with open(store.path(digest), 'rb') as f:
+        assert f.read() == b'carrier'
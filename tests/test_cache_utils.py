@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_utils import FailureLimiter, SizedLRUCache
+
+
+def test_sized_cache_evicts_by_total_bytes():
+    cache = SizedLRUCache(maxsize=10, maxbytes=10)
+    cache.set('a', b'xxxx')
+    cache.set('b', b'xxxx')
+    cache.set('c', b'xxxx')
+    assert cache.get('a') is None
+    assert cache.get('b') == b'xxxx' and cache.get('c') == b'xxxx'
+    assert cache.nbytes == 8
+
+
+def test_sized_cache_does_not_keep_values_over_maxbytes():
+    cache = SizedLRUCache(maxsize=10, maxbytes=10)
+    cache.set('small', b'xx')
+    cache.set('large', b'x' * 11)
+    assert cache.get('large') is None
+    assert cache.get('small') == b'xx'
+    assert cache.nbytes == 2
+
+
+def test_sized_cache_replacing_a_key_counts_it_once():
+    cache = SizedLRUCache(maxsize=10, maxbytes=10)
+    cache.set('a', b'xxxx')
+    cache.set('a', b'xxxxxx')
+    assert cache.nbytes == 6
+    cache.pop('a')
+    assert cache.nbytes == 0 and len(cache) == 0
+
+
+def test_failure_limiter_locks_out_and_leaks_back_down():
+    now = [1000.0]
+    limiter = FailureLimiter(limit=3, window=60, clock=lambda: now[0])
+    for _ in range(3):
+        assert limiter.retry_after('alice') == 0
+        limiter.record_failure('alice')
+    # Three failures fill the bucket; it drains one failure every 20 seconds
+    assert limiter.retry_after('alice') == pytest.approx(20)
+    assert limiter.retry_after('bob') == 0
+    
+    now[0] += 10
+    assert limiter.retry_after('alice') == pytest.approx(10)
+    now[0] += 10
+    assert limiter.retry_after('alice') == 0
+    assert limiter.stats()['rejected'] == 2
@@ -0,0 +1,48 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from carriers import Carrier
+
+
+def _png(pixels, mode, **params):
+    buffer = io.BytesIO()
+    Image.fromarray(pixels, mode).save(buffer, 'PNG', **params)
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.parametrize('mode', ['RGB', 'RGBA'])
+def test_row_limited_decode_matches_a_full_decode(mode):
+    pixels = np.random.default_rng(11).integers(0, 256, (301, 97, len(mode)), dtype=np.uint8)
+    
+    for rows in (1, 7, 150, 301, 1000):
+        carrier = Carrier.open(_png(pixels, mode))
+        assert np.array_equal(carrier.leading_rows(rows), pixels[:rows])
+    carrier = Carrier.open(_png(pixels, mode))
+    assert np.array_equal(carrier.leading_channels(1000), pixels.reshape(-1)[:1000])
+
+
+def test_row_bands_cover_the_image_once():
+    pixels = np.random.default_rng(12).integers(0, 256, (301, 97, 3), dtype=np.uint8)
+    bands = list(Carrier.open(_png(pixels, 'RGB')).row_bands(3))
+    assert len(bands) > 1
+    assert np.array_equal(np.concatenate(bands), pixels)
+
+
+def test_palette_png_falls_back_to_a_full_decode():
+    indices = np.random.default_rng(13).integers(0, 16, (64, 48), dtype=np.uint8)
+    image = Image.fromarray(indices, 'L').convert('P')
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    expected = np.asarray(image.convert('RGB'))
+    
+    carrier = Carrier.open(buffer)
+    assert np.array_equal(carrier.leading_rows(5), expected[:5])
+    assert np.array_equal(np.concatenate(list(carrier.row_bands(3))), expected)
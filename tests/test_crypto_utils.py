@@ -0,0 +1,46 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crypto_utils import CryptoUtils
+
+
+@pytest.fixture(scope='module')
+def key_pairs():
+    """Two unrelated parsed key pairs: (private, public) for alice and for bob"""
+    pairs = []
+    for _ in range(2):
+        private_der, public_der = CryptoUtils.generate_rsa_keys('der')
+        pairs.append((CryptoUtils.load_private_key(private_der), CryptoUtils.load_public_key(public_der)))
+    return pairs
+
+
+def test_hybrid_round_trip(key_pairs):
+    private_key, public_key = key_pairs[0]
+    ciphertext = CryptoUtils.encrypt_message('hello alice', public_key)
+    assert CryptoUtils.decrypt_message(ciphertext, private_key) == 'hello alice'
+
+
+def test_cached_data_key_is_not_shared_with_another_private_key(key_pairs):
+    (alice_private, alice_public), (bob_private, _) = key_pairs
+    ciphertext = CryptoUtils.encrypt_message('for alice only', alice_public)
+    # Alice's decryption puts the unwrapped data key in the process-wide cache
+    assert CryptoUtils.decrypt_message(ciphertext, alice_private) == 'for alice only'
+    with pytest.raises(Exception, match='Decryption failed'):
+        CryptoUtils.decrypt_message(ciphertext, bob_private)
+
+
+def test_cached_stream_data_key_is_not_shared_with_another_private_key(key_pairs):
+    (alice_private, alice_public), (bob_private, _) = key_pairs
+    encrypted = io.BytesIO()
+    CryptoUtils.encrypt_stream(io.BytesIO(b'streamed for alice'), encrypted, alice_public)
+    
+    decrypted = io.BytesIO()
+    CryptoUtils.decrypt_stream(io.BytesIO(encrypted.getvalue()), decrypted, alice_private)
+    assert decrypted.getvalue() == b'streamed for alice'
+    with pytest.raises(Exception):
+        CryptoUtils.decrypt_stream(io.BytesIO(encrypted.getvalue()), io.BytesIO(), bob_private)
@@ -0,0 +1,55 @@
+import base64
+import os
+import sys
+
+from sqlalchemy import create_engine, text
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import migrations
+from crypto_utils import CryptoUtils
+
+
+def _text_storage_db(path, private_keys, public_keys, ciphertexts):
+    """A database with only the text columns filled, as before the binary columns existed"""
+    engine = create_engine(f'sqlite:///{path}')
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE users (id INTEGER PRIMARY KEY, rsa_private_key TEXT, rsa_public_key TEXT, '
+                          'rsa_private_key_der BLOB, rsa_public_key_der BLOB)'))
+        conn.execute(text('CREATE TABLE messages (id INTEGER PRIMARY KEY, encrypted_message TEXT, ciphertext BLOB)'))
+        for private_key, public_key in zip(private_keys, public_keys):
+            conn.execute(text('INSERT INTO users (rsa_private_key, rsa_public_key) VALUES (:private, :public)'),
+                         {'private': private_key, 'public': public_key})
+        for ciphertext in ciphertexts:
+            conn.execute(text('INSERT INTO messages (encrypted_message) VALUES (:value)'), {'value': ciphertext})
+    return engine
+
+
+def test_corrupted_rows_are_left_as_text(tmp_path):
+    private_pem, public_pem = CryptoUtils.generate_rsa_keys()
+    # A stray character that a lenient base64 decoder would skip over
+    corrupted_private = private_pem.replace('\n', '\n!', 3)
+    # Valid base64 that is not a key
+    not_a_key = '-----BEGIN PUBLIC KEY-----\n' + base64.b64encode(b'not a key').decode() + '\n-----END PUBLIC KEY-----\n'
+    engine = _text_storage_db(
+        tmp_path / 'app.db', [private_pem, corrupted_private], [public_pem, not_a_key],
+        [base64.b64encode(b'ciphertext').decode(), 'Y2lwaGVy!dGV4dA==']
+    )
+    
+    summary = migrations.convert_crypto_storage(engine)
+    assert summary == {
+        'messages.encrypted_message': (1, 1),
+        'users.rsa_private_key': (1, 1),
+        'users.rsa_public_key': (1, 1),
+    }
+    with engine.connect() as conn:
+        users = conn.execute(text('SELECT rsa_private_key, rsa_private_key_der, rsa_public_key, rsa_public_key_der '
+                                  'FROM users ORDER BY id')).all()
+        messages = conn.execute(text('SELECT encrypted_message, ciphertext FROM messages ORDER BY id')).all()
+    
+    assert users[0].rsa_private_key is None and CryptoUtils.load_private_key(users[0].rsa_private_key_der)
+    assert users[0].rsa_public_key is None and CryptoUtils.load_public_key(users[0].rsa_public_key_der)
+    assert users[1].rsa_private_key == corrupted_private and users[1].rsa_private_key_der is None
+    assert users[1].rsa_public_key == not_a_key and users[1].rsa_public_key_der is None
+    assert messages[0] == ('', b'ciphertext')
+    assert messages[1] == ('Y2lwaGVy!dGV4dA==', None)
@@ -0,0 +1,57 @@
+import os
+import sys
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from batch_stego import BatchStegoExecutor
+from cpu_offload import CPUOffloadPool
+from process_pool import ProcessPool
+
+
+def _break(pool):
+    """Kill a pool process mid-call, the way the OOM killer would"""
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(os._exit, 1).result()
+
+
+def test_broken_pool_is_replaced_on_the_next_submit():
+    pool = ProcessPool(1)
+    try:
+        _break(pool)
+        assert pool.submit(os.getpid).result() != os.getpid()
+    finally:
+        pool.shutdown()
+
+
+def test_offload_pool_keeps_serving_after_a_process_dies():
+    pool = CPUOffloadPool('test', workers=1)
+    try:
+        _break(pool._pool)
+        assert pool.run(abs, -3) == 3
+        assert pool.stats()['pending'] == 0
+    finally:
+        pool.shutdown()
+
+
+def _exit_first_time(marker, value):
+    """value, after killing the calling process the first time the marker is seen"""
+    if marker and not os.path.exists(marker):
+        open(marker, 'w').close()
+        os._exit(1)
+    return value
+
+
+def test_batch_tasks_lost_with_a_process_are_run_once_more(tmp_path):
+    marker = str(tmp_path / 'died')
+    tasks = [('dies', (marker, 'dies'))] + [(i, ('', i)) for i in range(6)]
+    executor = BatchStegoExecutor(workers=2)
+    try:
+        results = {key: (result, error) for key, result, error in executor.imap_unordered(_exit_first_time, tasks)}
+    finally:
+        executor.shutdown()
+    # The task that killed its process and every task in flight with it were run again
+    assert os.path.exists(marker)
+    assert results == {key: (key, None) for key, _ in tasks}
@@ -0,0 +1,164 @@
+import io
+import os
+import sys
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from carriers import Carrier
+from steganography import SteganographyUtils
+
+
+def _carrier(path, width=64, height=48, mode='RGB', seed=7):
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (height, width, len(mode)), dtype=np.uint8)
+    Image.fromarray(pixels, mode).save(path)
+    return str(path)
+
+
+def _pixels(path):
+    with Image.open(path) as img:
+        return np.asarray(img)
+
+
+def test_container_round_trip(tmp_path):
+    carrier = _carrier(tmp_path / 'carrier.png')
+    output = str(tmp_path / 'stego.png')
+    SteganographyUtils.hide_message_in_image(carrier, 'héllo container ✓', 'right key', output)
+    assert SteganographyUtils.extract_message_from_image(output, 'right key') == 'héllo container ✓'
+
+
+def test_container_wrong_key_fails_cleanly(tmp_path):
+    carrier = _carrier(tmp_path / 'carrier.png')
+    output = str(tmp_path / 'stego.png')
+    SteganographyUtils.hide_message_in_image(carrier, 'secret', 'right key', output)
+    with pytest.raises(Exception, match='No valid message found'):
+        SteganographyUtils.extract_message_from_image(output, 'wrong key')
+
+
+def test_legacy_output_matches_the_original_encoder(tmp_path):
+    carrier = _carrier(tmp_path / 'carrier.png')
+    output = str(tmp_path / 'stego.png')
+    SteganographyUtils.hide_message_in_image(carrier, 'legacy text', 'any key', output, payload_format='legacy')
+    
+    # The original encoder: message and delimiter bits in order from the first channel of the first pixel
+    bits = ''.join(format(ord(char), '08b') for char in 'legacy text<<<END_OF_MESSAGE>>>')
+    expected = _pixels(carrier).reshape(-1).copy()
+    for index, bit in enumerate(bits):
+        expected[index] = expected[index] & 0xFE | int(bit)
+    assert np.array_equal(_pixels(output).reshape(-1), expected)
+
+
+def test_legacy_image_is_extracted(tmp_path):
+    carrier = _carrier(tmp_path / 'carrier.png')
+    output = str(tmp_path / 'stego.png')
+    SteganographyUtils.hide_message_in_image(carrier, 'legacy text', 'any key', output, payload_format='legacy')
+    assert SteganographyUtils.extract_message_from_image(output, 'any key', text_only=True) == 'legacy text'
+
+
+def test_message_over_capacity_reports_the_limit(tmp_path):
+    carrier = _carrier(tmp_path / 'carrier.png', width=20, height=20)
+    output = str(tmp_path / 'stego.png')
+    limit = SteganographyUtils.max_message_size(Carrier.probe(carrier))
+    assert limit > 0
+    
+    with pytest.raises(Exception, match=f'Maximum {limit} bytes'):
+        SteganographyUtils.hide_message_in_image(carrier, 'x' * (limit + 1), 'key', output)
+    # Exactly the limit still fits
+    SteganographyUtils.hide_message_in_image(carrier, 'x' * limit, 'key', output)
+    assert SteganographyUtils.extract_message_from_image(output, 'key') == 'x' * limit
+
+
+def test_key_check_header_tells_right_and_wrong_keys_apart(tmp_path):
+    carrier = _carrier(tmp_path / 'carrier.png')
+    output = str(tmp_path / 'stego.png')
+    SteganographyUtils.hide_message_in_image(carrier, 'secret', 'right key', output)
+    
+    salt, check = SteganographyUtils._read_key_header(Carrier.open(output))
+    assert check == SteganographyUtils._key_check('right key', salt)
+    assert check != SteganographyUtils._key_check('wrong key', salt)
+    # Images without one, such as the carrier itself, have no header
+    assert SteganographyUtils._read_key_header(Carrier.open(carrier)) is None
+
+
+def test_wrong_key_is_turned_away_before_decoding(tmp_path, monkeypatch):
+    carrier = _carrier(tmp_path / 'carrier.png')
+    output = str(tmp_path / 'stego.png')
+    SteganographyUtils.hide_message_in_image(carrier, 'secret', 'right key', output)
+    
+    def decode_everything(self):
+        raise AssertionError("decoded the whole image")
+    monkeypatch.setattr(Carrier, 'pixels', decode_everything)
+    with pytest.raises(Exception, match='No valid message found'):
+        SteganographyUtils.extract_message_from_image(output, 'wrong key')
+
+
+def _gif_bytes(frames):
+    """An animated GIF of P frames sharing one palette, written frame by frame so repeats are kept"""
+    blocks = []
+    for frame in frames:
+        buffer = io.BytesIO()
+        frame.save(buffer, 'GIF', duration=100, optimize=False)
+        data = buffer.getvalue()
+        # Header, logical screen descriptor and global palette, then the frame up to the trailer
+        flags = data[10]
+        header_size = 13 + (3 * 2 ** ((flags & 7) + 1) if flags & 0x80 else 0)
+        blocks.append((data[:header_size], data[header_size:-1]))
+    return blocks[0][0] + b''.join(block for _, block in blocks) + b'\x3b'
+
+
+def _palette_frame(seed, palette, size=(50, 40)):
+    indices = np.random.default_rng(seed).integers(0, 256, size[::-1], dtype=np.uint8)
+    frame = Image.frombytes('P', size, indices.tobytes())
+    frame.putpalette(palette)
+    return frame
+
+
+@pytest.mark.parametrize('payload_format', ['container', 'legacy'])
+@pytest.mark.parametrize('order', ['AAB', 'ABB', 'AAAA'])
+def test_gif_with_repeated_frames_round_trip(tmp_path, payload_format, order):
+    palette = list(np.random.default_rng(3).integers(0, 256, 768, dtype=np.uint8))
+    frames = {name: _palette_frame(seed, palette) for seed, name in enumerate('AB')}
+    carrier = tmp_path / 'carrier.gif'
+    carrier.write_bytes(_gif_bytes([frames[name] for name in order]))
+    output = str(tmp_path / 'stego.png')
+    
+    source = Carrier.open(str(carrier))
+    assert source.info.frames == len(order)
+    # A message filling every frame, so the same bits land in identical frames
+    message = 'y' * SteganographyUtils.max_message_size(source.info, payload_format)
+    SteganographyUtils.hide_message_in_image(str(carrier), message, 'key', output, payload_format)
+    
+    stego = Carrier.open(output)
+    assert stego.info.format == 'PNG' and stego.info.frames == len(order)
+    assert np.array_equal(stego.pixels() >> 1, source.pixels() >> 1)
+    assert SteganographyUtils.extract_message_from_image(output, 'key') == message
+
+
+def test_apng_round_trip(tmp_path):
+    rng = np.random.default_rng(5)
+    frames = [Image.fromarray(rng.integers(0, 256, (30, 40, 3), dtype=np.uint8)) for _ in range(3)]
+    carrier = str(tmp_path / 'carrier.png')
+    frames[0].save(carrier, save_all=True, append_images=frames[1:], duration=[40, 50, 60], loop=2)
+    output = str(tmp_path / 'stego.png')
+    
+    message = 'z' * SteganographyUtils.max_message_size(Carrier.probe(carrier))
+    SteganographyUtils.hide_message_in_image(carrier, message, 'key', output)
+    assert SteganographyUtils.extract_message_from_image(output, 'key') == message
+    with Image.open(output) as img:
+        assert img.n_frames == 3 and img.info.get('loop') == 2
+
+
+def test_rgba_carrier_keeps_its_alpha_channel(tmp_path):
+    carrier = _carrier(tmp_path / 'carrier.png', mode='RGBA')
+    output = str(tmp_path / 'stego.png')
+    SteganographyUtils.hide_message_in_image(carrier, 'see-through', 'key', output)
+    
+    with Image.open(output) as img:
+        assert img.mode == 'RGBA'
+    # Alpha carries payload bits too, so only its LSBs may change
+    assert np.array_equal(_pixels(output)[..., 3] >> 1, _pixels(carrier)[..., 3] >> 1)
+    assert SteganographyUtils.extract_message_from_image(output, 'key') == 'see-through'